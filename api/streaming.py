@@ -0,0 +1,77 @@
+import codecs
+import json
+
+
+READ_SIZE = 64 * 1024
+_decoder = json.JSONDecoder()
+
+
+def iter_ndjson(stream):
+    """Yield one decoded value per non empty line of a binary stream"""
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+class _Buffer:
+    def __init__(self, stream, read_size):
+        self.stream = stream
+        self.read_size = read_size
+        self.text = ""
+        self.position = 0
+        self.eof = False
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+
+    def fill(self):
+        """Drop the consumed text and append the next read, False once the stream is done"""
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.read_size)
+        self.eof = not chunk
+        self.text = self.text[self.position :] + self._utf8.decode(chunk or b"", final=self.eof)
+        self.position = 0
+        return True
+
+    def next_char(self):
+        """Next non whitespace character without consuming it, None at the end"""
+        while True:
+            while self.position < len(self.text) and self.text[self.position] in " \t\r\n":
+                self.position += 1
+            if self.position < len(self.text):
+                return self.text[self.position]
+            if not self.fill():
+                return None
+
+
+def iter_json_array(stream, read_size=READ_SIZE):
+    """
+    Yield the items of a top level JSON array read incrementally from a binary stream,
+    so only one item (plus one read) is held in memory at a time.
+    """
+    buffer = _Buffer(stream, read_size)
+    if buffer.next_char() != "[":
+        raise ValueError("Expected a JSON array")
+    buffer.position += 1
+
+    while True:
+        char = buffer.next_char()
+        if char is None:
+            raise ValueError("Unexpected end of JSON array")
+        if char == "]":
+            return
+        if char == ",":
+            buffer.position += 1
+            continue
+
+        try:
+            item, end = _decoder.raw_decode(buffer.text, buffer.position)
+        except json.JSONDecodeError:
+            # the item continues past the buffer
+            if not buffer.fill():
+                raise
+            continue
+        # a number ending the buffer may continue in the next read
+        if end == len(buffer.text) and buffer.fill():
+            continue
+        buffer.position = end
+        yield item
@@ -8,6 +8,7 @@ urlpatterns = [
     path("", views.BrandSuggestionAPIView.as_view()),
     path("bank-contacts/", views.ContactView.as_view(), name="contacts"),
     path("bank/", views.BrandsView.as_view(), name="bank"),
+    path("bank/batch/", views.BrandsBatchView.as_view(), name="bank_batch"),
     path(
         "bank/<int:brand_id>/feature_override/",
         views.BrandFeatureOverride.as_view(),
@@ -1,3 +1,8 @@
+import shutil
+import tempfile
+
+from django.db import IntegrityError, transaction
+
 from rest_framework import permissions, status
 from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
@@ -7,6 +12,7 @@ from brand.models import BrandSuggestion
 from brand.models.brand import Brand
 from brand.models.commentary import Commentary
 from brand.models.contact import Contact
+from brand.utils import brand_upsert
 
 from .authentication import SingleTokenAuthentication
 from .serializers import (
@@ -15,6 +21,7 @@ from .serializers import (
     CommentaryFeatureOverrideSerializer,
     ContactSerializer,
 )
+from .streaming import iter_json_array, iter_ndjson
 
 
 class BrandSuggestionAPIView(APIView):
@@ -96,6 +103,115 @@ class BrandsView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class BrandsBatchView(APIView):
+    """
+    POST a JSON array or an NDJSON stream (Content-Type: application/x-ndjson) of
+    BrandsView payloads. The whole body is parsed before anything is written, then items
+    are validated like a save from the admin and the valid ones upserted in chunks of
+    CHUNK_SIZE, one transaction each. A chunk failing on a database constraint is
+    reported as invalid items. With ?atomic=true the whole batch is written in one
+    transaction, rolled back when an item is invalid.
+
+    The body is spooled to a temporary file (on disk past SPOOL_SIZE) and read twice, one
+    item at a time, so large payloads are never held in memory.
+    """
+
+    permission_classes = []
+    authentication_classes = [SingleTokenAuthentication]
+    renderer_classes = [JSONRenderer]
+
+    CHUNK_SIZE = 500
+    SPOOL_SIZE = 4 * 1024 * 1024
+
+    def post(self, request):
+        ndjson = request.content_type.startswith("application/x-ndjson")
+        atomic = request.query_params.get("atomic", "").lower() in ("1", "true")
+
+        with tempfile.SpooledTemporaryFile(max_size=self.SPOOL_SIZE) as spool:
+            if request.stream is not None:
+                shutil.copyfileobj(request.stream, spool)
+
+            def items():
+                spool.seek(0)
+                return iter_ndjson(spool) if ndjson else iter_json_array(spool)
+
+            def chunks(results):
+                chunk = []
+                for result, payload in zip(results, items()):
+                    chunk.append((result, payload))
+                    if len(chunk) == self.CHUNK_SIZE:
+                        yield chunk
+                        chunk = []
+                if chunk:
+                    yield chunk
+
+            try:
+                results = [
+                    {"index": index, "tag": _tag_of(payload), "status": "skipped"}
+                    for index, payload in enumerate(items())
+                ]
+            except ValueError as e:
+                return Response(
+                    {"error": f"Malformed body: {e}"}, status=status.HTTP_400_BAD_REQUEST
+                )
+
+            invalid = False
+            if atomic:
+                try:
+                    with transaction.atomic():
+                        for chunk in chunks(results):
+                            # once an item is invalid nothing more is written, only checked
+                            if invalid:
+                                self._validate(chunk)
+                            else:
+                                self._write(chunk)
+                            invalid = invalid or any("errors" in result for result, _ in chunk)
+                        if invalid:
+                            transaction.set_rollback(True)
+                except IntegrityError as e:
+                    invalid = True
+                    self._fail(chunk, e)
+                if invalid:
+                    for result in results:
+                        if "errors" not in result:
+                            result["status"] = "skipped"
+            else:
+                for chunk in chunks(results):
+                    try:
+                        self._write(chunk)
+                    except IntegrityError as e:
+                        self._fail(chunk, e)
+
+        counts = {"created": 0, "updated": 0, "invalid": 0, "skipped": 0}
+        for result in results:
+            counts[result["status"]] += 1
+        response_status = status.HTTP_400_BAD_REQUEST if atomic and invalid else status.HTTP_200_OK
+        return Response({**counts, "results": results}, status=response_status)
+
+    @staticmethod
+    def _validate(chunk):
+        for (result, _), errors in zip(chunk, brand_upsert.validate([p for _, p in chunk])):
+            if errors:
+                result.update(status="invalid", errors=errors)
+
+    @staticmethod
+    def _write(chunk):
+        statuses = brand_upsert.upsert([payload for _, payload in chunk])
+        for (result, _), (item_status, errors) in zip(chunk, statuses):
+            result["status"] = item_status
+            if errors:
+                result["errors"] = errors
+
+    @staticmethod
+    def _fail(chunk, error):
+        for result, _ in chunk:
+            result.update(status="invalid", errors={"non_field_errors": [str(error)]})
+
+
+def _tag_of(payload):
+    return payload.get("tag") if isinstance(payload, dict) else None
+
+
 class BrandFeatureOverride(APIView):
     permission_classes = []
     authentication_classes = [SingleTokenAuthentication]
@@ -164,6 +164,28 @@ PASSWORD = os.environ.get("PASSWORD")
 
 REST_API_CONTACT_SINGLE_TOKEN = os.environ.get("REST_API_CONTACT_SINGLE_TOKEN")
 HARVEST_TOKEN = os.environ.get("HARVEST_TOKEN")
+HARVEST_BASE_URL = os.environ.get("HARVEST_BASE_URL", "https://harvest.bank.green")
+# harvest data is re-fetched once older than this many days, unless forced
+HARVEST_STALE_DAYS = int(os.environ.get("HARVEST_STALE_DAYS", 90))
+
+# outbound requests to harvest and Prismic, see brand/utils/http_client.py.
+# Read timeouts in seconds per endpoint; harvest builds its answer while we wait.
+HTTP_TIMEOUTS = {
+    "default": int(os.environ.get("HTTP_TIMEOUT", 30)),
+    "harvest": int(os.environ.get("HARVEST_TIMEOUT", 600)),
+    "harvest_location": int(os.environ.get("HARVEST_LOCATION_TIMEOUT", 600)),
+    "prismic": int(os.environ.get("PRISMIC_TIMEOUT", 30)),
+}
+HTTP_CONNECT_TIMEOUT = int(os.environ.get("HTTP_CONNECT_TIMEOUT", 10))
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", 2))
+# kept-alive connections per host, at least the workers of refresh_sfi_harvest_data
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 16))
+
+# admin refreshes run as jobs of `manage.py run_jobs`, see brand/models/job.py. Failed jobs
+# are retried after JOB_RETRY_BACKOFF seconds, doubling each time; running jobs taking
+# longer than JOB_TIMEOUT seconds are taken to have lost their worker and queued again.
+JOB_RETRY_BACKOFF = int(os.environ.get("JOB_RETRY_BACKOFF", 60))
+JOB_TIMEOUT = int(os.environ.get("JOB_TIMEOUT", 3600))
 
 CORS_ALLOWED_ORIGIN_REGEXES = (
     os.environ.get("CORS_ALLOWED_ORIGIN_REGEXES").split(" ")
@@ -180,6 +202,23 @@ GRAPHENE = {
     "SCHEMA_OUTPUT": "gql_schema.json",
 }
 
+# /graphql rejects queries estimated to resolve more objects, or nest deeper, than these
+# see brand/utils/query_cost.py. Fetching every brand with its commentary stays allowed.
+GRAPHQL_MAX_QUERY_COST = int(os.environ.get("GRAPHQL_MAX_QUERY_COST", 200000))
+GRAPHQL_MAX_QUERY_DEPTH = int(os.environ.get("GRAPHQL_MAX_QUERY_DEPTH", 12))
+# parsed and validated documents kept per worker, see brand/utils/query_documents.py
+GRAPHQL_DOCUMENT_CACHE_SIZE = int(os.environ.get("GRAPHQL_DOCUMENT_CACHE_SIZE", 256))
+# register any valid document a staff user sends along with its hash, instead of only the
+# ones added with `manage.py register_persisted_queries` or the admin. For development
+GRAPHQL_AUTO_PERSIST_QUERIES = os.environ.get("GRAPHQL_AUTO_PERSIST_QUERIES") == "True"
+# share of /graphql requests whose resolvers are timed for /resolver_stats/, on top of the
+# ones sending X-GraphQL-Tracing, see brand/utils/resolver_tracing.py
+GRAPHQL_TRACING_SAMPLE_RATE = float(os.environ.get("GRAPHQL_TRACING_SAMPLE_RATE", 0))
+GRAPHQL_TRACING_KEEP = int(os.environ.get("GRAPHQL_TRACING_KEEP", 1000))
+# X-GraphQL-Tracing value that lets non-staff clients trace their requests, unset to only
+# allow staff sessions
+GRAPHQL_TRACING_TOKEN = os.environ.get("GRAPHQL_TRACING_TOKEN", "")
+
 REST_FRAMEWORK = {
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 1,
@@ -195,5 +234,14 @@ CACHES = {
         "BACKEND": "django.core.cache.backends.db.DatabaseCache",
         "LOCATION": "bgd_cache_table",
         "TIMEOUT": 60 * 20,
-    }
+    },
+    # evaluated `brands` GraphQL results, see brand/utils/query_cache.py
+    # kept out of the SQLite database so cache writes don't contend with data writes
+    "brand_queries": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.environ.get(
+            "BRAND_QUERY_CACHE_DIR", os.path.join(BASE_DIR, "cache", "brand_queries")
+        ),
+        "TIMEOUT": 60 * 20,
+    },
 }
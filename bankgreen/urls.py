@@ -23,10 +23,8 @@ from django.views.decorators.cache import cache_control
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic.base import RedirectView
 
-from graphene_django.views import GraphQLView
-
 from brand import views
-from brand.views import CustomPasswordResetView
+from brand.views import BrandGraphQLView, CustomPasswordResetView
 from schema import schema
 
 
@@ -36,7 +34,7 @@ urlpatterns = [
     re_path(
         "^graphql/?$",
         cache_control(max_age=settings.CACHE_MAX_AGE)(
-            csrf_exempt(GraphQLView.as_view(graphiql=True, schema=schema))
+            csrf_exempt(BrandGraphQLView.as_view(graphiql=True, schema=schema))
         ),
     ),
     path("calendar/", views.calendar_redirect, name="calendar"),
@@ -75,4 +73,6 @@ urlpatterns = [
         name="password_reset_complete",
     ),
     path("clear_cache/", views.clear_cache, name="clear_cache"),
+    path("cache_stats/", views.brand_query_cache_stats, name="brand_query_cache_stats"),
+    path("resolver_stats/", views.resolver_stats, name="resolver_stats"),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
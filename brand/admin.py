@@ -2,6 +2,8 @@ from datetime import timedelta
 
 from django import forms
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import PAGE_VAR, ChangeList
 from django.contrib.admin.widgets import FilteredSelectMultiple
 from django.core.exceptions import ObjectDoesNotExist
 from django.shortcuts import redirect
@@ -12,16 +14,17 @@ from django.utils.html import format_html
 from django_admin_listfilter_dropdown.filters import ChoiceDropdownFilter
 from reversion.admin import VersionAdmin
 
-from brand.admin_utils import link_contacts
+from brand.admin_utils import link_contacts, state_choices
 from brand.forms import EmbraceCampaignForm
 from brand.models import State
 from brand.models.brand_suggestion import BrandSuggestion
 from brand.models.commentary import Commentary, InstitutionCredential, InstitutionType
 from brand.models.embrace_campaign import EmbraceCampaign
 from brand.models.features import BrandFeature, FeatureType
+from brand.models.persisted_query import PersistedQuery
 
-from .models import Brand, Contact
-from .utils.harvest_data import fetch_harvest_location_data, update_commentary_feature_data
+from .models import Brand, Contact, Job
+from .utils.harvest_data import feature_data_is_stale
 
 
 @admin.register(Commentary)
@@ -44,10 +47,15 @@ class CommentaryAdmin(admin.ModelAdmin):
 
     def refresh_harvest_data(self, request, object_id):
         commentary = self.get_object(request, object_id)
-        if update_commentary_feature_data(commentary, overwrite=False) is None:
-            self.message_user(request, "Could not refresh Harvest data.")
-        else:
-            self.message_user(request, "Harvest data refreshed successfully.")
+        _, created = Job.submit(Job.Kind.HARVEST_FEATURES, commentary.brand_id)
+        self.message_user(
+            request,
+            (
+                "Harvest data refresh queued, it may take a few minutes for data to appear."
+                if created
+                else "A Harvest data refresh is already queued."
+            ),
+        )
         if request.GET.get("model") == "brand":
             return redirect("admin:brand_brand_change", object_id=object_id)
         return redirect("admin:brand_commentary_change", object_id=object_id)
@@ -65,9 +73,13 @@ class CommentaryAdmin(admin.ModelAdmin):
     feature_yaml.short_description = "Feature Data (YAML)"
 
     def refresh_feature_data(self, request, queryset):
-        for commentary in queryset:
-            update_commentary_feature_data(commentary, overwrite=True)
-        self.message_user(request, f"Refreshed feature data for {queryset.count()} commentaries.")
+        brand_ids = queryset.values_list("brand_id", flat=True)
+        queued = sum(Job.submit(Job.Kind.HARVEST_FEATURES, brand_id)[1] for brand_id in brand_ids)
+        self.message_user(
+            request,
+            f"Queued feature data refresh for {queued} commentaries"
+            f" ({len(brand_ids) - queued} already queued).",
+        )
 
     refresh_feature_data.short_description = "Refresh feature data"
 
@@ -193,9 +205,9 @@ class HasSuggestionsFilter(admin.SimpleListFilter):
     def queryset(self, request, queryset):
         value = self.value()
         if value == "Any Suggestions":
-            return queryset.filter(pk__in=BrandSuggestion.objects.values("pk"))
+            return queryset.filter(is_suggestion=True)
         elif value == "No Suggestions":
-            return queryset.exclude(pk__in=BrandSuggestion.objects.values("pk"))
+            return queryset.filter(is_suggestion=False)
         elif value == "High Certainty Suggestions":
             cutoff = timezone.now() - timedelta(days=30)
             return queryset.filter(
@@ -223,7 +235,7 @@ class StatePhysicalBranchDropDownFilter(admin.SimpleListFilter):
     parameter_name = "state_physical_branch"
 
     def lookups(self, request, model_admin):
-        return [(s.tag, str(s)) for s in State.objects.all()]
+        return state_choices()
 
     def queryset(self, request, queryset):
         if not self.value():
@@ -237,7 +249,7 @@ class StateLicensedDropDownFilter(admin.SimpleListFilter):
     parameter_name = "state_licensed"
 
     def lookups(self, request, model_admin):
-        return [(s.tag, str(s)) for s in State.objects.all()]
+        return state_choices()
 
     def queryset(self, request, queryset):
         if not self.value():
@@ -249,6 +261,60 @@ class ChoiceDropdownFilter(admin.ChoicesFieldListFilter):
     template = "django_admin_listfilter_dropdown/dropdown_filter.html"
 
 
+class BrandChangeList(ChangeList):
+    # what list_display shows, the other Brand columns are long texts
+    LIST_FIELDS = ("pk", "name", "tag", "website")
+    fast_list = False
+
+    def get_results(self, request):
+        self.queryset = self.queryset.only(*self.LIST_FIELDS)
+        super().get_results(request)
+
+    def toggle_list_query(self):
+        """The current filters and search in the other kind of list, from its first page"""
+        return self.get_query_string(
+            {"fast": int(not self.fast_list)}, [PAGE_VAR, FastBrandChangeList.AFTER_VAR]
+        )
+
+
+class FastBrandChangeList(BrandChangeList):
+    """
+    Changelist paged by primary key rather than by offset: a page is the `list_per_page`
+    brands after the last pk of the previous one, so nothing is counted. Sorting by
+    column is ignored.
+    """
+
+    AFTER_VAR = "after"
+    fast_list = True
+
+    def __init__(self, request, *args, **kwargs):
+        # taken out before ChangeList reads every other parameter as a filter
+        request.GET = request.GET.copy()
+        self.after = request.GET.pop(self.AFTER_VAR, [None])[-1]
+        super().__init__(request, *args, **kwargs)
+
+    def get_results(self, request):
+        queryset = self.queryset.only(*self.LIST_FIELDS).order_by("pk")
+        if self.after:
+            try:
+                queryset = queryset.filter(pk__gt=int(self.after))
+            except ValueError:
+                raise IncorrectLookupParameters
+        rows = list(queryset[: self.list_per_page + 1])
+        self.result_list = rows[: self.list_per_page]
+        self.next_after = self.result_list[-1].pk if len(rows) > self.list_per_page else None
+        self.result_count = len(self.result_list)
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = False
+        self.paginator = self.model_admin.get_paginator(request, rows, self.list_per_page)
+
+    def next_page_query(self):
+        return self.get_query_string({self.AFTER_VAR: self.next_after})
+
+
 @admin.register(InstitutionType)
 class InstitutionTypes(admin.ModelAdmin):
     model = InstitutionType
@@ -259,6 +325,36 @@ class InstitutionCredentials(admin.ModelAdmin):
     model = InstitutionCredential
 
 
+@admin.register(PersistedQuery)
+class PersistedQueryAdmin(admin.ModelAdmin):
+    search_fields = ["name", "sha256"]
+    list_display = ("name", "sha256", "created")
+    readonly_fields = ("sha256", "created")
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("kind", "brand", "status", "attempts", "run_after", "finished", "last_error")
+    list_filter = ("status", "kind")
+    search_fields = ["brand__tag", "brand__name"]
+    list_select_related = ["brand"]
+    ordering = ["-created"]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def requeue(self, request, queryset):
+        queued = sum(Job.submit(job.kind, job.brand_id)[1] for job in queryset)
+        self.message_user(request, f"Queued {queued} jobs again.")
+
+    requeue.short_description = "Queue again"
+
+    actions = [requeue]
+
+
 @admin.register(State)
 class StateAdmin(admin.ModelAdmin):
     search_fields = ["name"]
@@ -303,88 +399,23 @@ class BrandAdmin(VersionAdmin):
         ]
         return custom_urls + urls
 
-    def _start_thread(self, target, *args, **kwargs):
-        import threading
-
-        t = threading.Thread(target=target, args=args, kwargs=kwargs, daemon=True)
-        t.start()
-        return t
-
-    def refresh_location(self, request, object_id):
-        # Kick off background refresh of location data for this brand
-        def worker(brand_id):
-            from django.db import connection
-
-            try:
-                brand = Brand.objects.get(pk=brand_id)
-                countries_check = ["AU", "US", "CA"]
-                # Determine which countries to process based on the brand's countries field
-                brand_countries = getattr(brand, "countries", []) or []
-                for country in [c for c in countries_check if c in brand_countries]:
-                    data = fetch_harvest_location_data(
-                        brand_tag=brand.tag,
-                        brand_url=brand.website,
-                        brand_country=country,
-                        brand_name=brand.name,
-                    )
-                    if isinstance(data, Exception):
-                        continue
-                    location_data = data.get("location") if isinstance(data, dict) else None
-                    if not location_data:
-                        continue
-                    state_licensed = location_data.get("licensed_to_operate_in", []) or []
-                    state_physical_branch = location_data.get("physical_branches", []) or []
-                    for state_code in state_licensed:
-                        state = State.objects.filter(tag=state_code).first()
-                        if state:
-                            brand.state_licensed.add(state)
-                    for state_code in state_physical_branch:
-                        state = State.objects.filter(tag=state_code).first()
-                        if state:
-                            brand.state_physical_branch.add(state)
-            except Exception:
-                # Best-effort background task; avoid crashing the thread
-                pass
-            finally:
-                # Ensure DB connection cleanup in threaded context
-                try:
-                    connection.close()
-                except Exception:
-                    pass
-
-        self._start_thread(worker, object_id)
+    def _submit(self, request, kind, object_id, description):
+        _, created = Job.submit(kind, object_id)
         self.message_user(
             request,
-            "Working on refreshing location data. It may take up to 10 minutes for data to appear.",
+            (
+                f"Queued a {description} refresh. It may take up to 10 minutes for data to appear."
+                if created
+                else f"A {description} refresh is already queued."
+            ),
         )
         return redirect("admin:brand_brand_change", object_id)
 
-    def refresh_features(self, request, object_id):
-        # Kick off background refresh of feature data for this brand
-        def worker(brand_id):
-            from django.db import connection
+    def refresh_location(self, request, object_id):
+        return self._submit(request, Job.Kind.HARVEST_LOCATIONS, object_id, "location data")
 
-            try:
-                brand = Brand.objects.get(pk=brand_id)
-                # Ensure commentary exists
-                commentary = getattr(brand, "commentary", None)
-                if commentary is None:
-                    commentary = Commentary.objects.create(brand_id=brand.id)
-                update_commentary_feature_data(commentary, overwrite=True)
-            except Exception:
-                pass
-            finally:
-                try:
-                    connection.close()
-                except Exception:
-                    pass
-
-        self._start_thread(worker, object_id)
-        self.message_user(
-            request,
-            "Working on updating feature data. It may take up to 10 minutes for data to appear.",
-        )
-        return redirect("admin:brand_brand_change", object_id)
+    def refresh_features(self, request, object_id):
+        return self._submit(request, Job.Kind.HARVEST_FEATURES, object_id, "feature data")
 
     search_fields = ["name", "tag", "website"]
     readonly_fields = ["created", "modified"]
@@ -411,6 +442,10 @@ class BrandAdmin(VersionAdmin):
     list_display_links = ("short_name", "short_tag")
 
     list_per_page = 800
+    # the total count costs a second COUNT(*) on every page load
+    show_full_result_count = False
+
+    FAST_LIST_SESSION_KEY = "brand_fast_list"
 
     inlines = [StateLicensedInline, StatePhysicalBranchInline, CommentaryInline]
 
@@ -426,13 +461,22 @@ class BrandAdmin(VersionAdmin):
             commentary_obj = Commentary.objects.create(brand_id=obj.id)
             obj.commentary = commentary_obj
             obj.save()
-        update_commentary_feature_data(obj.commentary)
+        # only the published brands are harvested on save, the others on demand
+        commentary = obj.commentary
+        published = commentary.show_on_sustainable_banks_page or commentary.display_on_website
+        if published and feature_data_is_stale(commentary):
+            Job.submit(Job.Kind.HARVEST_FEATURES, obj.pk)
 
     def get_queryset(self, request):
         # filter out all but base class
-        qs = super(BrandAdmin, self).get_queryset(request).filter(brandsuggestion__isnull=True)
+        qs = super(BrandAdmin, self).get_queryset(request).filter(is_suggestion=False)
         return qs
 
+    def get_changelist(self, request, **kwargs):
+        if request.session.get(self.FAST_LIST_SESSION_KEY):
+            return FastBrandChangeList
+        return BrandChangeList
+
     def change_view(self, request, object_id, extra_context=None):
         brand = Brand.objects.get(id=object_id)
         extra_context = extra_context or {}
@@ -441,6 +485,12 @@ class BrandAdmin(VersionAdmin):
         return super(BrandAdmin, self).change_view(request, object_id, extra_context=extra_context)
 
     def changelist_view(self, request, extra_context=None):
+        if "fast" in request.GET:
+            # toggles the keyset paginated list, kept in the session so filters keep it
+            request.session[self.FAST_LIST_SESSION_KEY] = request.GET["fast"] == "1"
+            query = request.GET.copy()
+            del query["fast"]
+            return redirect(f"{request.path}?{query.urlencode()}")
         extra_context = extra_context or {}
         extra_context["page_title"] = "Brands: "
         extra_context["show_contact_inline"] = True
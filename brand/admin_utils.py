@@ -1,8 +1,14 @@
 from django.contrib import admin
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.urls import reverse
 from django.utils.html import escape, format_html
 
+from brand.models import State
+
+
+STATE_CHOICES_CACHE_KEY = "admin_state_choices"
+
 
 def link_contacts(contacts=None):
     links = []
@@ -19,3 +25,12 @@ def link_contacts(contacts=None):
         )
         links.append(link)
     return links
+
+
+def state_choices():
+    """(tag, label) of every State for the list filters, cached until a State changes"""
+    return cache.get_or_set(
+        STATE_CHOICES_CACHE_KEY,
+        lambda: [(s.tag, str(s)) for s in State.objects.only("tag", "name", "country_code")],
+        60 * 60,
+    )
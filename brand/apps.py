@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class BrandConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "brand"
+
+    def ready(self):
+        from brand import signals  # noqa: F401
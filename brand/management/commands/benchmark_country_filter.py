@@ -0,0 +1,65 @@
+import random
+
+from django.core.management.base import BaseCommand
+
+from brand.models import Brand, BrandCountry
+from brand.utils.benchmark import format_timings, rolled_back, time_calls
+
+
+COUNTRY_POOL = [
+    "AU", "AT", "BE", "BR", "CA", "CH", "CN", "DE", "DK", "ES", "FI", "FR", "GB", "GR", "HK",
+    "IE", "IN", "IT", "JP", "KR", "MX", "NL", "NO", "NZ", "PL", "PT", "SE", "SG", "US", "ZA",
+]  # fmt: skip
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the old countries__contains scan with the indexed BrandCountry join "
+        "on synthetic brands. All data is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--brands", type=int, default=50000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--country", default="GB")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        country = options["country"]
+
+        with rolled_back():
+            self.stdout.write(f"Creating {options['brands']} synthetic brands...")
+            brands = Brand.objects.bulk_create(
+                [
+                    Brand(
+                        tag=f"benchmark_brand_{n}",
+                        name=f"Benchmark Brand {n}",
+                        countries=rng.sample(COUNTRY_POOL, rng.randint(1, 3)),
+                    )
+                    for n in range(options["brands"])
+                ],
+                batch_size=1000,
+            )
+            BrandCountry.sync(brands)
+
+            def substring_scan():
+                return list(Brand.objects.filter(countries__contains=country).values_list("pk"))
+
+            def indexed_join():
+                return list(
+                    Brand.objects.filter(country_memberships__country=country).values_list("pk")
+                )
+
+            self.stdout.write(
+                f"{len(substring_scan())} brands match by substring, "
+                f"{len(indexed_join())} by membership"
+            )
+            self.stdout.write(
+                format_timings("countries__contains", time_calls(substring_scan, options["repeat"]))
+            )
+            self.stdout.write(
+                format_timings(
+                    "country_memberships__country", time_calls(indexed_join, options["repeat"])
+                )
+            )
@@ -0,0 +1,99 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from brand.models import Brand, Commentary, HarvestFeature
+from brand.models.commentary import load_harvest_validation_schema
+from brand.schema import harvest_data_filter_q
+from brand.utils.benchmark import format_timings, rolled_back, time_calls
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the old feature_json path filters with the indexed HarvestFeature lookup "
+        "for 1, 5 and 10 combined feature filters on synthetic brands. "
+        "All data is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--brands", type=int, default=20000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--offered", type=float, default=0.8, help="share of offered features")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        sections = {
+            section: list(definition.get("properties", {}))
+            for section, definition in load_harvest_validation_schema()["properties"].items()
+            if section in ("customers_served", "deposit_products", "loan_products", "services")
+        }
+        features = [(section, feature) for section, names in sections.items() for feature in names]
+
+        def document():
+            return {
+                section: {
+                    feature: {
+                        "offered": rng.random() < options["offered"],
+                        "additional_details": "",
+                    }
+                    for feature in names
+                }
+                for section, names in sections.items()
+            }
+
+        with rolled_back():
+            self.stdout.write(f"Creating {options['brands']} synthetic brands...")
+            brands = Brand.objects.bulk_create(
+                [
+                    Brand(tag=f"benchmark_brand_{n}", name=f"Benchmark Brand {n}")
+                    for n in range(options["brands"])
+                ],
+                batch_size=1000,
+            )
+            commentaries = [Commentary(brand=brand, feature_json=document()) for brand in brands]
+            # bulk_create skips save(), which merges the effective features the index reads
+            for commentary in commentaries:
+                commentary.refresh_effective_features()
+            commentaries = Commentary.objects.bulk_create(commentaries, batch_size=1000)
+            HarvestFeature.sync(commentaries)
+
+            for count in (1, 5, 10):
+                requested = {}
+                for section, feature in rng.sample(features, count):
+                    requested.setdefault(section, []).append(feature)
+
+                def json_paths():
+                    query = Q()
+                    for section, names in requested.items():
+                        for feature in names:
+                            query &= Q(
+                                **{f"commentary__feature_json__{section}__{feature}__offered": True}
+                            )
+                    return list(Brand.objects.filter(query).values_list("pk"))
+
+                def indexed():
+                    return list(
+                        Brand.objects.filter(harvest_data_filter_q(requested)).values_list("pk")
+                    )
+
+                by_path, by_index = len(json_paths()), len(indexed())
+                self.stdout.write(
+                    f"{count} filters: {by_path} brands by JSON path, {by_index} by index"
+                )
+                if by_path != by_index:
+                    raise CommandError(
+                        f"{count} filters: the index found {by_index} brands, "
+                        f"the JSON paths {by_path}"
+                    )
+                self.stdout.write(
+                    format_timings(
+                        f"  feature_json paths ({count})", time_calls(json_paths, options["repeat"])
+                    )
+                )
+                self.stdout.write(
+                    format_timings(
+                        f"  HarvestFeature index ({count})", time_calls(indexed, options["repeat"])
+                    )
+                )
@@ -0,0 +1,65 @@
+import random
+
+from django.core.management.base import BaseCommand
+
+from brand.models import Brand, BrandSpelling
+from brand.utils.benchmark import format_timings, rolled_back, time_calls
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares resolving spellings through a full Brand.create_spelling_dictionary rebuild "
+        "with the persisted BrandSpelling index on synthetic brands. "
+        "All data is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--brands", type=int, default=10000)
+        parser.add_argument("--lookups", type=int, default=100)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+
+        with rolled_back():
+            self.stdout.write(f"Creating {options['brands']} synthetic brands...")
+            brands = Brand.objects.bulk_create(
+                [
+                    Brand(
+                        tag=f"benchmark_brand_{n}",
+                        name=f"Benchmark Brand {n}",
+                        aliases=f"BB{n}, Bench {n}",
+                        website=f"https://www.benchmark{n}.com/home",
+                        lei=f"LEI{n:017d}",
+                        rssd=str(100000 + n),
+                    )
+                    for n in range(options["brands"])
+                ],
+                batch_size=1000,
+            )
+            BrandSpelling.sync(brands)
+
+            texts = []
+            for n in rng.sample(range(options["brands"]), min(options["lookups"], len(brands))):
+                texts += [f"benchmark brand {n}", f"BB{n}", f"benchmark{n}.com", f"LEI{n:017d}"]
+
+            def dictionary_rebuild():
+                spelling_dict = Brand.create_spelling_dictionary()
+                return {text: spelling_dict.get(text.lower()) for text in texts}
+
+            def single_lookups():
+                return {text: BrandSpelling.resolve(text) for text in texts}
+
+            def batch_lookup():
+                return BrandSpelling.resolve_many(texts)
+
+            self.stdout.write(
+                f"{len(texts)} spellings, {len(batch_lookup())} resolved through the index"
+            )
+            for label, fn in (
+                ("create_spelling_dictionary", dictionary_rebuild),
+                ("BrandSpelling.resolve", single_lookups),
+                ("BrandSpelling.resolve_many", batch_lookup),
+            ):
+                self.stdout.write(format_timings(label, time_calls(fn, options["repeat"])))
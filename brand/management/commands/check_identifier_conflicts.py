@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from brand.models import BrandIdentifier
+
+
+class Command(BaseCommand):
+    help = "Lists institutional identifiers that are claimed by more than one brand"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scheme", choices=BrandIdentifier.Scheme.values)
+
+    def handle(self, *args, **options):
+        conflicts = list(BrandIdentifier.conflicts(options["scheme"]))
+        values_by_scheme = {}
+        for conflict in conflicts:
+            values_by_scheme.setdefault(conflict["scheme"], []).append(conflict["value"])
+
+        # chunked like the index syncs, a value__in of every conflict can pass the
+        # database's bound parameter limit
+        chunk_size = BrandIdentifier.SYNC_CHUNK_SIZE
+        brand_tags = {}
+        for scheme, values in values_by_scheme.items():
+            for start in range(0, len(values), chunk_size):
+                for value, tag in (
+                    BrandIdentifier.objects.filter(
+                        scheme=scheme, value__in=values[start : start + chunk_size]
+                    )
+                    .order_by("brand__tag")
+                    .values_list("value", "brand__tag")
+                ):
+                    brand_tags.setdefault((scheme, value), []).append(tag)
+
+        for conflict in conflicts:
+            tags = brand_tags[(conflict["scheme"], conflict["value"])]
+            self.stdout.write(f"{conflict['scheme']} {conflict['value']}: {', '.join(tags)}")
+        self.stdout.write(self.style.SUCCESS(f"Done. {len(conflicts)} conflicting identifiers"))
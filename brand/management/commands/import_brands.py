@@ -0,0 +1,73 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from brand.utils.brand_import import BrandImporter
+
+
+"""
+    Generic replacement for the one-off credit union importers under scripts/, i.e.
+
+    python manage.py import_brands uk_credit_unions.csv --map name=Firm --map frn=FRN \
+        --set countries=GB --set commentary__display_on_website=true \
+        --institution-type "Credit Union" --checkpoint uk_cus.checkpoint.json --dry-run
+"""
+
+
+def key_value(option):
+    if "=" not in option:
+        raise CommandError(f"Expected field=value, got {option}")
+    return option.split("=", 1)
+
+
+class Command(BaseCommand):
+    help = "Imports brands with their commentary from a CSV or JSON file in bulk"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV, JSON (list of objects) or JSON lines file")
+        parser.add_argument(
+            "--map",
+            action="append",
+            default=[],
+            help="field=column, use commentary__<field> for Commentary fields",
+        )
+        parser.add_argument("--mapping", help="JSON file of {field: column}")
+        parser.add_argument(
+            "--set", action="append", default=[], help="field=value set on every row"
+        )
+        parser.add_argument("--institution-type", action="append", default=[])
+        parser.add_argument("--chunk-size", type=int, default=500)
+        parser.add_argument("--checkpoint", help="File recording the next row to import")
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Validate and report, write nothing"
+        )
+
+    def handle(self, *args, **options):
+        mapping = {}
+        if options["mapping"]:
+            with open(options["mapping"]) as file:
+                mapping.update(json.load(file))
+        mapping.update(key_value(option) for option in options["map"])
+
+        try:
+            importer = BrandImporter(
+                mapping,
+                constants=dict(key_value(option) for option in options["set"]),
+                institution_types=options["institution_type"],
+                chunk_size=options["chunk_size"],
+                checkpoint=options["checkpoint"],
+                dry_run=options["dry_run"],
+            )
+        except ValueError as e:
+            raise CommandError(e)
+
+        report = importer.run(options["path"])
+        if report.resumed_from:
+            self.stdout.write(f"Resumed after row {report.resumed_from}")
+        if options["dry_run"]:
+            for line in report.diff_lines():
+                self.stdout.write(line)
+        else:
+            for row, errors in report.invalid:
+                self.stderr.write(f"! row {row}: {errors}")
+        self.stdout.write(self.style.SUCCESS(f"Done. {report.summary()}"))
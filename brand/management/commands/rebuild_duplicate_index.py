@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from brand.models import Brand, BrandDuplicate, BrandSimilarityKey
+
+
+"""
+    Rebuilds the duplicate candidates shown on /check-duplicates/ from scratch.
+    Only needed once for existing rows or after bulk writes, saving a Brand keeps it up to date.
+"""
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the similarity keys and duplicate candidates of every Brand"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=BrandSimilarityKey.INDEX_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        BrandDuplicate.objects.all().delete()
+        BrandSimilarityKey.objects.all().delete()
+
+        brands = Brand.objects.only("pk", "name", "tag", "aliases", "website").order_by("pk")
+        chunk = []
+        total = 0
+        for brand in brands.iterator(chunk_size=chunk_size):
+            chunk.append(brand)
+            if len(chunk) >= chunk_size:
+                BrandSimilarityKey.index(chunk)
+                total += len(chunk)
+                chunk = []
+                self.stdout.write(f"Indexed {total} brands...")
+        if chunk:
+            BrandSimilarityKey.index(chunk)
+            total += len(chunk)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done. Indexed {total} brands, {BrandDuplicate.objects.count()} candidate pairs"
+            )
+        )
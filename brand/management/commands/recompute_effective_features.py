@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from brand.models import Commentary, HarvestFeature
+from brand.utils import query_cache
+
+
+"""
+    Recomputes Commentary.effective_features and the HarvestFeature index from
+    feature_json and feature_override. Saving a Commentary keeps both up to date; this is
+    for rows changed by raw SQL, fixture loads or a change to the merge rules.
+"""
+
+
+class Command(BaseCommand):
+    help = "Recomputes the effective features (harvest data with overrides) of every Commentary"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        commentaries = Commentary.objects.only(
+            "pk", "brand_id", "feature_json", "feature_override", "effective_features"
+        ).order_by("pk")
+
+        chunk = []
+        total = changed = 0
+        for commentary in commentaries.iterator(chunk_size=chunk_size):
+            chunk.append(commentary)
+            if len(chunk) >= chunk_size:
+                changed += self.recompute(chunk)
+                total += len(chunk)
+                chunk = []
+                self.stdout.write(f"Recomputed {total} commentaries...")
+        if chunk:
+            changed += self.recompute(chunk)
+            total += len(chunk)
+        self.stdout.write(
+            self.style.SUCCESS(f"Done. Recomputed {total} commentaries, {changed} changed")
+        )
+
+    @staticmethod
+    def recompute(chunk):
+        changed = [
+            commentary
+            for commentary in chunk
+            if commentary.effective_features != commentary.refresh_effective_features()
+        ]
+        with transaction.atomic():
+            Commentary.objects.bulk_update(changed, ["effective_features"])
+            # rows are diffed, so syncing unchanged commentaries also repairs the index
+            HarvestFeature.sync(chunk)
+        query_cache.invalidate_brands(commentary.brand_id for commentary in changed)
+        return len(changed)
@@ -1,7 +1,8 @@
 from django.core.management.base import BaseCommand
 
-from brand.models import Brand, State
-from brand.utils.harvest_data import fetch_harvest_location_data
+from brand.models import Brand
+from brand.utils import http_client
+from brand.utils.brand_locations import LOCATION_COUNTRIES, refresh_locations
 
 
 """
@@ -12,44 +13,19 @@ from brand.utils.harvest_data import fetch_harvest_location_data
 
 class Command(BaseCommand):
     help = "For brands located in US/CA/AU, this refreshes their state information using harvest"
-    countries = ["AU", "US", "CA"]
 
-    def handle(self, *args, **options):
-        brands_by_country = {}
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=100, help="Brands per bulk write of state rows"
+        )
 
-        for country in self.countries:
-            brands_by_country[country] = Brand.objects.filter(countries__contains=country)
+    def handle(self, *args, **options):
+        brands = (
+            Brand.objects.filter(country_memberships__country__in=LOCATION_COUNTRIES)
+            .distinct()
+            .only("pk", "tag", "name", "website", "countries")
+        )
         print(f"Initialized...")
-        for country, brands in brands_by_country.items():
-            for brand in brands:
-                print(f"Attempt for: {brand.tag}, {country}")
-                data = fetch_harvest_location_data(
-                    brand_tag=brand.tag,
-                    brand_url=brand.website,
-                    brand_country=country,
-                    brand_name=brand.name,
-                )
-
-                if isinstance(data, Exception):
-                    print(f"\tError: {brand.tag}, failed to fetch:", data)
-                    continue
-
-                location_data = data.get("location")
-                if not location_data:
-                    print(f"\tError: {brand.tag}: missing location data")
-                    continue
-
-                state_licensed = location_data.get("licensed_to_operate_in", [])
-                state_physical_branch = location_data.get("physical_branches", [])
-
-                for state_code in state_licensed:
-                    state = State.objects.filter(tag=state_code).first()
-                    if state:
-                        brand.state_licensed.add(state)
-
-                for state_code in state_physical_branch:
-                    state = State.objects.filter(tag=state_code).first()
-                    if state:
-                        brand.state_physical_branch.add(state)
-                print(f"\tCompleted: {brand.tag}, {country}")
-        print("Completed")
+        fetched, failed = refresh_locations(brands, batch_size=options["batch_size"], log=print)
+        print(f"Completed. Fetched: {fetched}, Failed: {failed}")
+        print(f"HTTP: {http_client.metrics.summary()}")
@@ -1,7 +1,8 @@
 from django.core.management.base import BaseCommand
 
 from brand.models import Commentary
-from brand.utils.harvest_data import update_commentary_feature_data
+from brand.utils import http_client
+from brand.utils.harvest_refresh import HarvestRefreshPipeline, refresh_plan
 
 
 """
@@ -12,22 +13,67 @@ from brand.utils.harvest_data import update_commentary_feature_data
 class Command(BaseCommand):
     help = "Fetches the harvest data of SFI Brands then updates the Brand's Commentary"
 
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8)
+        parser.add_argument(
+            "--per-host", type=int, default=4, help="Concurrent requests per harvest host"
+        )
+        parser.add_argument("--max-retries", type=int, default=2)
+        parser.add_argument(
+            "--backoff", type=float, default=30.0, help="Seconds before the first retry"
+        )
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument(
+            "--stale-days",
+            type=int,
+            default=None,
+            help="Refresh data older than this many days (default: HARVEST_STALE_DAYS)",
+        )
+        parser.add_argument(
+            "--force", action="store_true", help="Refresh every brand, however recent its data"
+        )
+        parser.add_argument(
+            "--limit", type=int, default=None, help="Refresh at most this many, most due first"
+        )
+
     def handle(self, *args, **options):
         self.stdout.write("Fetching Commentaries...")
-        sfi_commentaries = Commentary.objects.filter(show_on_sustainable_banks_page=True)
-        self.stdout.write(f"Updating {sfi_commentaries.count()} commentaries...")
-        success = 0
-        failure = 0
-        for commentary in sfi_commentaries:
-            try:
-                result = update_commentary_feature_data(commentary, overwrite=True)
-                if result is not None:
-                    success += 1
-                    self.stdout.write(f"✓ Updated {commentary.brand.tag}")
-                else:
-                    failure += 1
-                    self.stderr.write(f"✗ Skipped/failed {commentary.brand.tag}")
-            except Exception as e:
-                failure += 1
-                self.stderr.write(f"✗ {commentary.brand.tag} failed: {e}")
-        self.stdout.write(self.style.SUCCESS(f"Done. Success: {success}, Failed: {failure}"))
+        sfi = Commentary.objects.filter(show_on_sustainable_banks_page=True)
+        plan = (
+            refresh_plan(sfi, stale_days=options["stale_days"], force=options["force"])
+            .select_related("brand")
+            .only(
+                "pk",
+                "feature_hash",
+                "brand__tag",
+                "brand__website",
+                "brand__countries",
+                "brand__name",
+            )
+        )
+        due = plan.count()
+        fresh = sfi.count() - due
+        sfi_commentaries = list(plan[: options["limit"]])
+        self.stdout.write(
+            f"Updating {len(sfi_commentaries)} of {due} due commentaries, "
+            f"{fresh} refreshed more recently..."
+        )
+
+        pipeline = HarvestRefreshPipeline(
+            workers=options["workers"],
+            per_host=options["per_host"],
+            max_retries=options["max_retries"],
+            backoff=options["backoff"],
+            batch_size=options["batch_size"],
+            progress=self.report_progress,
+        )
+        report = pipeline.run(sfi_commentaries, fresh=fresh)
+        self.stdout.write(f"HTTP: {http_client.metrics.summary()}")
+        self.stdout.write(self.style.SUCCESS(report.summary()))
+
+    def report_progress(self, report, job, result):
+        progress = f"[{report.done}/{report.total}]"
+        if isinstance(result, dict):
+            self.stdout.write(f"{progress} ✓ Updated {job.brand_tag}")
+        else:
+            self.stderr.write(f"{progress} ✗ {job.brand_tag} failed: {result}")
@@ -0,0 +1,33 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from graphql import GraphQLError, parse
+
+from brand.models import PersistedQuery
+
+
+class Command(BaseCommand):
+    help = (
+        "Registers GraphQL documents (one per .graphql file) as persisted queries and prints "
+        "the SHA-256 hash clients send instead of the query"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", help=".graphql files")
+
+    def handle(self, *args, **options):
+        for path in options["paths"]:
+            with open(path, encoding="utf-8") as file:
+                query = file.read()
+            try:
+                parse(query)
+            except GraphQLError as e:
+                raise CommandError(f"{path}: {e.message}")
+
+            name = os.path.splitext(os.path.basename(path))[0]
+            persisted, created = PersistedQuery.objects.update_or_create(
+                sha256=PersistedQuery.hash(query), defaults={"name": name, "query": query}
+            )
+            self.stdout.write(f"{persisted.sha256} {name}{'' if created else ' (exists)'}")
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from brand.models import Commentary
+from brand.utils.markdown_render import MARKDOWN_FIELDS
+
+
+"""
+    Backfills the pre-rendered HTML of the Commentary markdown fields.
+    Only needed once for existing rows, saving a Commentary keeps its HTML up to date.
+"""
+
+
+class Command(BaseCommand):
+    help = "Renders the markdown fields of every Commentary into their stored HTML columns"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        html_fields = list(MARKDOWN_FIELDS.values())
+        commentaries = Commentary.objects.only("pk", *MARKDOWN_FIELDS).order_by("pk")
+
+        chunk = []
+        total = 0
+        for commentary in commentaries.iterator(chunk_size=chunk_size):
+            commentary.render_markdown_fields(force=True)
+            chunk.append(commentary)
+            if len(chunk) >= chunk_size:
+                Commentary.objects.bulk_update(chunk, html_fields)
+                total += len(chunk)
+                chunk = []
+                self.stdout.write(f"Rendered {total} commentaries...")
+        if chunk:
+            Commentary.objects.bulk_update(chunk, html_fields)
+            total += len(chunk)
+        self.stdout.write(self.style.SUCCESS(f"Done. Rendered {total} commentaries"))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from brand.utils.jobs import JobWorker
+
+
+class Command(BaseCommand):
+    help = "Runs the refreshes queued from the admin, see config/jobs.service"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=2, help="Jobs run at the same time")
+        parser.add_argument(
+            "--poll", type=float, default=5.0, help="Seconds between looks for new jobs"
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Exit once no job is due instead of waiting"
+        )
+
+    def handle(self, *args, **options):
+        worker = JobWorker(
+            concurrency=max(1, options["concurrency"]),
+            poll=options["poll"],
+            progress=self.report_progress,
+        )
+        self.stdout.write(f"Worker {worker.name} waiting for jobs...")
+        done = worker.run(once=options["once"])
+        self.stdout.write(self.style.SUCCESS(f"Done. Ran {done} jobs"))
+
+    def report_progress(self, job, succeeded):
+        if succeeded:
+            self.stdout.write(f"✓ {job.get_kind_display()} of {job.brand.tag}")
+        else:
+            self.stderr.write(
+                f"✗ {job.get_kind_display()} of {job.brand.tag} ({job.status}): {job.last_error}"
+            )
@@ -0,0 +1,83 @@
+# Generated by Django 5.1.7 on 2026-10-18 14:18
+
+from collections import defaultdict, deque
+
+from django.db import migrations, models
+
+
+def resolve_inherited_ratings(rows):
+    """
+    Frozen copy of brand.utils.rating_inheritance.resolve_inherited_ratings: brand_id ->
+    effective rating of (brand_id, rating, inherit_brand_rating_id) rows
+    """
+    own_rating = {}
+    inheritors = defaultdict(list)
+    inherits_from = {}
+    for brand_id, rating, parent_id in rows:
+        own_rating[brand_id] = rating
+        if rating == "inherit" and parent_id is not None:
+            inheritors[parent_id].append(brand_id)
+            inherits_from[brand_id] = parent_id
+
+    resolved = {}
+    queue = deque()
+    for brand_id, rating in own_rating.items():
+        if rating != "inherit":
+            resolved[brand_id] = rating
+            queue.append(brand_id)
+        elif inherits_from.get(brand_id) not in own_rating:
+            resolved[brand_id] = "unknown"
+            queue.append(brand_id)
+
+    while queue:
+        parent_id = queue.popleft()
+        for brand_id in inheritors.get(parent_id, ()):
+            if brand_id not in resolved:
+                resolved[brand_id] = resolved[parent_id]
+                queue.append(brand_id)
+
+    # cycles and their inheritors
+    for brand_id in own_rating:
+        resolved.setdefault(brand_id, "unknown")
+    return resolved
+
+
+def populate_rating_inherited(apps, schema_editor):
+    Commentary = apps.get_model("brand", "commentary")
+    rows = list(
+        Commentary.objects.values_list("pk", "brand_id", "rating", "inherit_brand_rating_id")
+    )
+    resolved = resolve_inherited_ratings((row[1], row[2], row[3]) for row in rows)
+    Commentary.objects.bulk_update(
+        [Commentary(pk=pk, rating_inherited=resolved[brand_id]) for pk, brand_id, _, _ in rows],
+        ["rating_inherited"],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("brand", "0055_remove_brand_regions_remove_brand_subregions")]
+
+    operations = [
+        migrations.AddField(
+            model_name="commentary",
+            name="rating_inherited",
+            field=models.CharField(
+                choices=[
+                    ("great", "Great"),
+                    ("good", "Good"),
+                    ("ok", "Ok"),
+                    ("bad", "Bad"),
+                    ("worst", "Worst"),
+                    ("unknown", "Unknown"),
+                    ("inherit", "Inherit"),
+                ],
+                db_index=True,
+                default="unknown",
+                editable=False,
+                max_length=8,
+            ),
+        ),
+        migrations.RunPython(populate_rating_inherited, migrations.RunPython.noop),
+    ]
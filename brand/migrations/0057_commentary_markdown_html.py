@@ -0,0 +1,41 @@
+# Generated by Django 5.1.7 on 2026-10-18 14:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("brand", "0056_commentary_rating_inherited")]
+
+    operations = [
+        migrations.AddField(
+            model_name="commentary",
+            name="description1_html",
+            field=models.TextField(blank=True, default="", editable=False),
+        ),
+        migrations.AddField(
+            model_name="commentary",
+            name="description2_html",
+            field=models.TextField(blank=True, default="", editable=False),
+        ),
+        migrations.AddField(
+            model_name="commentary",
+            name="description3_html",
+            field=models.TextField(blank=True, default="", editable=False),
+        ),
+        migrations.AddField(
+            model_name="commentary",
+            name="from_the_website_html",
+            field=models.TextField(blank=True, default="", editable=False),
+        ),
+        migrations.AddField(
+            model_name="commentary",
+            name="headline_html",
+            field=models.TextField(blank=True, default="", editable=False),
+        ),
+        migrations.AddField(
+            model_name="commentary",
+            name="subtitle_html",
+            field=models.TextField(blank=True, default="", editable=False),
+        ),
+    ]
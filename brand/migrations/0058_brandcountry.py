@@ -0,0 +1,52 @@
+# Generated by Django 5.1.7 on 2026-10-18 14:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_brand_countries(apps, schema_editor):
+    Brand = apps.get_model("brand", "brand")
+    BrandCountry = apps.get_model("brand", "brandcountry")
+    memberships = []
+    for brand_id, countries in Brand.objects.values_list("pk", "countries").iterator():
+        for code in (countries or "").split(","):
+            if code:
+                memberships.append(BrandCountry(brand_id=brand_id, country=code))
+    BrandCountry.objects.bulk_create(memberships, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("brand", "0057_commentary_markdown_html")]
+
+    operations = [
+        migrations.CreateModel(
+            name="BrandCountry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("country", models.CharField(max_length=2)),
+                (
+                    "brand",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="country_memberships",
+                        to="brand.brand",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [models.Index(fields=["country", "brand"], name="brand_country_lookup")],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("brand", "country"), name="unique_brand_country"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(populate_brand_countries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.1.7 on 2026-10-18 14:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("brand", "0058_brandcountry")]
+
+    operations = [
+        migrations.CreateModel(
+            name="BrandDuplicate",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("name", "Name or alias"), ("tag", "Tag"), ("website", "Website")],
+                        max_length=8,
+                    ),
+                ),
+                ("distance", models.PositiveSmallIntegerField()),
+                (
+                    "score",
+                    models.FloatField(help_text="1 for an exact match, lower for more edits"),
+                ),
+                (
+                    "brand",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="duplicate_candidates",
+                        to="brand.brand",
+                    ),
+                ),
+                (
+                    "duplicate_of",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="brand.brand",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-score", "-brand_id"],
+                "indexes": [
+                    models.Index(fields=["-score", "-brand"], name="brand_duplicate_score")
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("brand", "duplicate_of"), name="unique_brand_duplicate"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="BrandSimilarityKey",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("name", "Name or alias"), ("tag", "Tag"), ("website", "Website")],
+                        max_length=8,
+                    ),
+                ),
+                ("term", models.CharField(max_length=200)),
+                ("key", models.CharField(max_length=7)),
+                (
+                    "brand",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="similarity_keys",
+                        to="brand.brand",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [models.Index(fields=["kind", "key"], name="brand_similarity_lookup")]
+            },
+        ),
+    ]
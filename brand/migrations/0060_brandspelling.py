@@ -0,0 +1,114 @@
+# Generated by Django 5.1.7 on 2026-10-18 14:36
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+IDENTIFIER_FIELDS = (
+    "lei",
+    "permid",
+    "viafid",
+    "googleid",
+    "rssd",
+    "rssd_hd",
+    "cusip",
+    "thrift",
+    "thrift_hc",
+    "aba_prim",
+    "ncua",
+    "fdic_cert",
+    "occ",
+    "ein",
+)
+SOURCE_FIELDS = ("name", "aliases", "website", *IDENTIFIER_FIELDS)
+NAME, ALIAS, WEBSITE, ABBREVIATION, IDENTIFIER = range(5)
+
+
+def spellings_of(brand):
+    """Frozen copy of BrandSpelling.spellings_of and the Brand helpers it calls"""
+    candidates = [(brand.name, NAME)]
+    if brand.aliases:
+        candidates += [(alias.strip(), ALIAS) for alias in brand.aliases.split(",")]
+    if brand.website:
+        web_sans_prefix = re.sub(r"http(s)?(:)?(\/\/)?|(\/\/)?(www\.)?", "", brand.website)
+        web_sans_prefix = web_sans_prefix.strip("/")
+        candidates.append((web_sans_prefix, WEBSITE))
+        domain = re.match(r"^(?:\/\/|[^\/]+)*", web_sans_prefix).group(0)
+        if domain:
+            candidates.append((domain, WEBSITE))
+    candidates += [
+        (re.sub("[^A-Z]", "", brand.name).lower(), ABBREVIATION),
+        (re.sub("[^A-Z0-9]", "", brand.name).lower(), ABBREVIATION),
+    ]
+    candidates += [(getattr(brand, field), IDENTIFIER) for field in IDENTIFIER_FIELDS]
+
+    spellings = {}
+    for text, rank in candidates:
+        spelling = (text or "").strip().lower()
+        if spelling in ("", "0") or len(spelling) > 255:
+            continue
+        spellings[spelling] = min(rank, spellings.get(spelling, rank))
+    return spellings
+
+
+def populate_brand_spellings(apps, schema_editor):
+    Brand = apps.get_model("brand", "brand")
+    BrandSpelling = apps.get_model("brand", "brandspelling")
+    spellings = []
+    for brand in Brand.objects.only("pk", *SOURCE_FIELDS).iterator():
+        for spelling, rank in spellings_of(brand).items():
+            spellings.append(BrandSpelling(brand_id=brand.pk, spelling=spelling, rank=rank))
+    BrandSpelling.objects.bulk_create(spellings, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("brand", "0059_brand_duplicate_index")]
+
+    operations = [
+        migrations.CreateModel(
+            name="BrandSpelling",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("spelling", models.CharField(max_length=255)),
+                (
+                    "rank",
+                    models.PositiveSmallIntegerField(
+                        choices=[
+                            (0, "Name"),
+                            (1, "Alias"),
+                            (2, "Website"),
+                            (3, "Abbreviation"),
+                            (4, "Identifier"),
+                        ]
+                    ),
+                ),
+                (
+                    "brand",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="spellings",
+                        to="brand.brand",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["spelling", "rank", "brand"], name="brand_spelling_lookup")
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("spelling", "brand"), name="unique_brand_spelling"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(populate_brand_spellings, migrations.RunPython.noop),
+    ]
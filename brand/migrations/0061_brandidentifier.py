@@ -0,0 +1,112 @@
+# Generated by Django 5.1.7 on 2026-10-18 14:38
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+SCHEMES = (
+    "permid",
+    "isin",
+    "viafid",
+    "lei",
+    "googleid",
+    "rssd",
+    "rssd_hd",
+    "cusip",
+    "thrift",
+    "thrift_hc",
+    "aba_prim",
+    "ncua",
+    "fdic_cert",
+    "occ",
+    "ein",
+    "frn",
+)
+NUMERIC_SCHEMES = {"rssd", "rssd_hd", "thrift", "thrift_hc", "ncua", "fdic_cert", "occ"}
+
+
+def identifiers_of(brand):
+    """Frozen copy of BrandIdentifier.identifiers_of"""
+    identifiers = set()
+    for scheme in SCHEMES:
+        value = re.sub(r"[\s-]", "", str(getattr(brand, scheme) or "")).upper()
+        if scheme in NUMERIC_SCHEMES and value.isdigit():
+            value = value.lstrip("0")
+        if value not in ("", "0") and len(value) <= 255:
+            identifiers.add((scheme, value))
+    return identifiers
+
+
+def populate_brand_identifiers(apps, schema_editor):
+    Brand = apps.get_model("brand", "brand")
+    BrandIdentifier = apps.get_model("brand", "brandidentifier")
+    identifiers = []
+    for brand in Brand.objects.only("pk", *SCHEMES).iterator():
+        for scheme, value in identifiers_of(brand):
+            identifiers.append(BrandIdentifier(brand_id=brand.pk, scheme=scheme, value=value))
+    BrandIdentifier.objects.bulk_create(identifiers, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("brand", "0060_brandspelling")]
+
+    operations = [
+        migrations.CreateModel(
+            name="BrandIdentifier",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                (
+                    "scheme",
+                    models.CharField(
+                        choices=[
+                            ("permid", "Permid"),
+                            ("isin", "Isin"),
+                            ("viafid", "Viafid"),
+                            ("lei", "Lei"),
+                            ("googleid", "Googleid"),
+                            ("rssd", "Rssd"),
+                            ("rssd_hd", "Rssd Hd"),
+                            ("cusip", "Cusip"),
+                            ("thrift", "Thrift"),
+                            ("thrift_hc", "Thrift Hc"),
+                            ("aba_prim", "Aba Prim"),
+                            ("ncua", "Ncua"),
+                            ("fdic_cert", "Fdic Cert"),
+                            ("occ", "Occ"),
+                            ("ein", "Ein"),
+                            ("frn", "Frn"),
+                        ],
+                        max_length=16,
+                    ),
+                ),
+                ("value", models.CharField(max_length=255)),
+                (
+                    "brand",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="identifiers",
+                        to="brand.brand",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["scheme", "value"], name="brand_identifier_lookup")
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("brand", "scheme", "value"), name="unique_brand_identifier"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(populate_brand_identifiers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-18 14:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("brand", "0061_brandidentifier")]
+
+    operations = [
+        migrations.CreateModel(
+            name="PersistedQuery",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("sha256", models.CharField(editable=False, max_length=64, unique=True)),
+                ("name", models.CharField(blank=True, max_length=255)),
+                ("query", models.TextField()),
+                ("created", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={"verbose_name_plural": "Persisted queries"},
+        )
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-18 14:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("brand", "0062_persistedquery")]
+
+    operations = [
+        migrations.CreateModel(
+            name="ResolverTrace",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("operation_name", models.CharField(blank=True, max_length=255)),
+                ("duration_ms", models.FloatField()),
+                ("sql_count", models.PositiveIntegerField()),
+                ("fields", models.JSONField()),
+            ],
+        )
+    ]
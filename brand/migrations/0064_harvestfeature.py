@@ -0,0 +1,99 @@
+# Generated by Django 5.1.7 on 2026-10-18 14:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def customer_types_of(offered_to):
+    entries = offered_to if isinstance(offered_to, list) else [offered_to]
+    types = set()
+    for entry in entries:
+        customer_type = entry.get("customer_type") if isinstance(entry, dict) else None
+        if isinstance(customer_type, str):
+            types.add(customer_type)
+        elif isinstance(customer_type, list):
+            types.update(t for t in customer_type if isinstance(t, str))
+    return sorted(types)
+
+
+def features_of(document):
+    """
+    Frozen copy of HarvestFeature.features_of: {(section, feature): (offered, customer
+    types)} of a harvest document
+    """
+    features = {}
+    for section, section_features in (document or {}).items():
+        if not isinstance(section_features, dict):
+            continue
+        for feature, values in section_features.items():
+            if isinstance(values, dict) and "offered" in values:
+                features[(section, feature)] = (
+                    values["offered"] is True,
+                    customer_types_of(values.get("offered_to")),
+                )
+    return features
+
+
+def populate_harvest_features(apps, schema_editor):
+    Commentary = apps.get_model("brand", "commentary")
+    HarvestFeature = apps.get_model("brand", "harvestfeature")
+    features = []
+    for commentary in Commentary.objects.only("pk", "feature_json").iterator():
+        for (section, feature), (offered, customer_types) in features_of(
+            commentary.feature_json
+        ).items():
+            features.append(
+                HarvestFeature(
+                    commentary_id=commentary.pk,
+                    section=section,
+                    feature=feature,
+                    offered=offered,
+                    customer_types=customer_types,
+                )
+            )
+    HarvestFeature.objects.bulk_create(features, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("brand", "0063_resolvertrace")]
+
+    operations = [
+        migrations.CreateModel(
+            name="HarvestFeature",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("section", models.CharField(max_length=64)),
+                ("feature", models.CharField(max_length=64)),
+                ("offered", models.BooleanField()),
+                ("customer_types", models.JSONField(blank=True, default=list)),
+                (
+                    "commentary",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="harvest_features",
+                        to="brand.commentary",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["section", "feature", "offered", "commentary"],
+                        name="harvest_feature_lookup",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("commentary", "section", "feature"), name="unique_harvest_feature"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(populate_harvest_features, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 5.1.7 on 2026-10-18 14:57
+
+import copy
+
+from django.db import migrations, models
+
+
+def merge_features(feature_json, feature_override):
+    """Frozen copy of brand.models.commentary.merge_features"""
+    if not isinstance(feature_json, dict) or not isinstance(feature_override, dict):
+        return copy.deepcopy(feature_json if feature_override is None else feature_override)
+    merged = copy.deepcopy(feature_json)
+    for key, value in feature_override.items():
+        merged[key] = merge_features(feature_json.get(key), value)
+    return merged
+
+
+def customer_types_of(offered_to):
+    entries = offered_to if isinstance(offered_to, list) else [offered_to]
+    types = set()
+    for entry in entries:
+        customer_type = entry.get("customer_type") if isinstance(entry, dict) else None
+        if isinstance(customer_type, str):
+            types.add(customer_type)
+        elif isinstance(customer_type, list):
+            types.update(t for t in customer_type if isinstance(t, str))
+    return sorted(types)
+
+
+def features_of(document):
+    """
+    Frozen copy of HarvestFeature.features_of: {(section, feature): (offered, customer
+    types)} of a harvest document
+    """
+    features = {}
+    for section, section_features in (document or {}).items():
+        if not isinstance(section_features, dict):
+            continue
+        for feature, values in section_features.items():
+            if isinstance(values, dict) and "offered" in values:
+                features[(section, feature)] = (
+                    values["offered"] is True,
+                    customer_types_of(values.get("offered_to")),
+                )
+    return features
+
+
+def populate_effective_features(apps, schema_editor):
+    Commentary = apps.get_model("brand", "commentary")
+    HarvestFeature = apps.get_model("brand", "harvestfeature")
+    commentaries = []
+    for commentary in Commentary.objects.only("pk", "feature_json", "feature_override").iterator():
+        commentary.effective_features = merge_features(
+            commentary.feature_json, commentary.feature_override
+        )
+        commentaries.append(commentary)
+    Commentary.objects.bulk_update(commentaries, ["effective_features"], batch_size=500)
+
+    # the feature index was built from feature_json alone
+    overridden = [commentary for commentary in commentaries if commentary.feature_override]
+    HarvestFeature.objects.filter(commentary_id__in=[c.pk for c in overridden]).delete()
+    HarvestFeature.objects.bulk_create(
+        [
+            HarvestFeature(
+                commentary_id=commentary.pk,
+                section=section,
+                feature=feature,
+                offered=offered,
+                customer_types=customer_types,
+            )
+            for commentary in overridden
+            for (section, feature), (offered, customer_types) in features_of(
+                commentary.effective_features
+            ).items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("brand", "0064_harvestfeature")]
+
+    operations = [
+        migrations.AddField(
+            model_name="commentary",
+            name="effective_features",
+            field=models.JSONField(blank=True, default=dict, editable=False, null=True),
+        ),
+        migrations.RunPython(populate_effective_features, migrations.RunPython.noop),
+    ]
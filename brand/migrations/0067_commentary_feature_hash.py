@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-18 15:04
+
+import hashlib
+import json
+
+from django.db import migrations, models
+
+
+def hash_features(feature_json):
+    """Frozen copy of brand.models.commentary.hash_features"""
+    canonical = json.dumps(feature_json, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def populate_feature_hash(apps, schema_editor):
+    Commentary = apps.get_model("brand", "commentary")
+    commentaries = []
+    for commentary in Commentary.objects.only("pk", "feature_json").iterator():
+        commentary.feature_hash = hash_features(commentary.feature_json)
+        commentaries.append(commentary)
+    Commentary.objects.bulk_update(commentaries, ["feature_hash"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("brand", "0066_job")]
+
+    operations = [
+        migrations.AddField(
+            model_name="commentary",
+            name="feature_hash",
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.RunPython(populate_feature_hash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.7 on 2026-10-18 15:09
+
+from django.db import migrations, models
+
+
+def flag_suggestions(apps, schema_editor):
+    Brand = apps.get_model("brand", "brand")
+    BrandSuggestion = apps.get_model("brand", "brandsuggestion")
+    Brand.objects.filter(pk__in=BrandSuggestion.objects.values("brand_ptr_id")).update(
+        is_suggestion=True
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("brand", "0067_commentary_feature_hash")]
+
+    operations = [
+        migrations.AddField(
+            model_name="brand",
+            name="is_suggestion",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(flag_suggestions, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="brand",
+            index=models.Index(
+                condition=models.Q(("is_suggestion", False)),
+                fields=["name", "id"],
+                name="brand_listed_by_name",
+            ),
+        ),
+    ]
@@ -1,8 +1,16 @@
 from brand.models.brand import Brand
+from brand.models.brand_country import BrandCountry
+from brand.models.brand_duplicate import BrandDuplicate, BrandSimilarityKey
+from brand.models.brand_identifier import BrandIdentifier
+from brand.models.brand_spelling import BrandSpelling
 from brand.models.brand_state import StateLicensed, StatePhysicalBranch
 from brand.models.brand_suggestion import BrandSuggestion
 from brand.models.commentary import Commentary, RatingChoice
 from brand.models.contact import Contact
 from brand.models.embrace_campaign import EmbraceCampaign
 from brand.models.features import BrandFeature, FeatureAvailabilityChoice, FeatureType
+from brand.models.harvest_feature import HarvestFeature
+from brand.models.job import Job
+from brand.models.persisted_query import PersistedQuery
+from brand.models.resolver_trace import ResolverTrace
 from brand.models.state import State
@@ -30,6 +30,14 @@ class Brand(TimeStampedModel):
 
     class Meta:
         ordering = ["name"]
+        indexes = [
+            # the brand admin's changelist: brands that aren't suggestions, by name
+            models.Index(
+                fields=["name", "id"],
+                condition=models.Q(is_suggestion=False),
+                name="brand_listed_by_name",
+            )
+        ]
 
     @property
     def short_name(self):
@@ -40,6 +48,8 @@ class Brand(TimeStampedModel):
         return truncatechars(self.tag, 50)
 
     name_locked = models.BooleanField(default=False)
+    # set for the BrandSuggestion subclass, so brand lists skip them without joining it
+    is_suggestion = models.BooleanField(default=False, editable=False)
     aliases = models.CharField(
         help_text="Other names for the brand, used for search. comma seperated. i.e. BOFA, BOA",
         max_length=200,
@@ -0,0 +1,59 @@
+from django.db import models
+
+from brand.utils.countries import country_codes
+
+from .brand import Brand
+
+
+class BrandCountry(models.Model):
+    """
+    One row per country in `Brand.countries`, so country filters can use an index
+    instead of a substring scan over the comma separated field.
+    Kept in sync with the field on save, see `BrandCountry.sync`.
+    """
+
+    brand = models.ForeignKey(Brand, related_name="country_memberships", on_delete=models.CASCADE)
+    country = models.CharField(max_length=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["brand", "country"], name="unique_brand_country")
+        ]
+        indexes = [models.Index(fields=["country", "brand"], name="brand_country_lookup")]
+
+    def __str__(self):
+        return f"{self.brand_id}: {self.country}"
+
+    SYNC_CHUNK_SIZE = 500
+
+    @classmethod
+    def sync(cls, brands):
+        """
+        Bring the membership rows of `brands` in line with their `countries` field,
+        touching only rows that changed. Use after bulk writes that skip Brand.save.
+        """
+        brands = [brand for brand in brands if brand.pk]
+        for start in range(0, len(brands), cls.SYNC_CHUNK_SIZE):
+            cls._sync_chunk(brands[start : start + cls.SYNC_CHUNK_SIZE])
+
+    @classmethod
+    def _sync_chunk(cls, brands):
+        wanted = {(brand.pk, code) for brand in brands for code in country_codes(brand.countries)}
+        existing = {
+            (brand_id, country): pk
+            for pk, brand_id, country in cls.objects.filter(
+                brand_id__in=[brand.pk for brand in brands]
+            ).values_list("pk", "brand_id", "country")
+        }
+
+        stale = [pk for key, pk in existing.items() if key not in wanted]
+        if stale:
+            cls.objects.filter(pk__in=stale).delete()
+        cls.objects.bulk_create(
+            [
+                cls(brand_id=brand_id, country=country)
+                for brand_id, country in wanted - existing.keys()
+            ],
+            batch_size=500,
+            ignore_conflicts=True,
+        )
@@ -0,0 +1,128 @@
+from collections import defaultdict
+
+from django.db import models
+
+from brand.utils import similarity
+
+from .brand import Brand
+
+
+class BrandSimilarityKey(models.Model):
+    """
+    Delete variants of the normalized names, aliases, tags and websites of a brand.
+    Brands sharing a key within the same kind are duplicate candidates.
+    Kept in sync on save, see `BrandSimilarityKey.index`.
+    """
+
+    class Kind(models.TextChoices):
+        NAME = similarity.NAME, "Name or alias"
+        TAG = similarity.TAG, "Tag"
+        WEBSITE = similarity.WEBSITE, "Website"
+
+    brand = models.ForeignKey(Brand, related_name="similarity_keys", on_delete=models.CASCADE)
+    kind = models.CharField(max_length=8, choices=Kind.choices)
+    term = models.CharField(max_length=200)
+    key = models.CharField(max_length=similarity.PREFIX_LENGTH)
+
+    class Meta:
+        indexes = [models.Index(fields=["kind", "key"], name="brand_similarity_lookup")]
+
+    def __str__(self):
+        return f"{self.brand_id}: {self.kind} {self.key}"
+
+    INDEX_CHUNK_SIZE = 200
+
+    @classmethod
+    def index(cls, brands):
+        """
+        (Re)index `brands` and refresh their duplicate candidates.
+        Use after bulk writes that skip Brand.save.
+        """
+        brands = [brand for brand in brands if brand.pk]
+        for start in range(0, len(brands), cls.INDEX_CHUNK_SIZE):
+            chunk = brands[start : start + cls.INDEX_CHUNK_SIZE]
+            brand_ids = [brand.pk for brand in chunk]
+            cls.objects.filter(brand_id__in=brand_ids).delete()
+            cls.objects.bulk_create(
+                [
+                    cls(brand_id=brand.pk, kind=kind, term=term[:200], key=key)
+                    for brand in chunk
+                    for kind, term in similarity.brand_terms(brand)
+                    for key in similarity.delete_keys(term)
+                ],
+                batch_size=500,
+            )
+            BrandDuplicate.refresh(brand_ids)
+
+
+class BrandDuplicate(models.Model):
+    """
+    A pair of brands whose names/aliases, tags or websites are within
+    `similarity.MAX_DISTANCE` edits of each other. `brand` is always the newer brand.
+    """
+
+    brand = models.ForeignKey(Brand, related_name="duplicate_candidates", on_delete=models.CASCADE)
+    duplicate_of = models.ForeignKey(Brand, related_name="+", on_delete=models.CASCADE)
+    kind = models.CharField(max_length=8, choices=BrandSimilarityKey.Kind.choices)
+    distance = models.PositiveSmallIntegerField()
+    score = models.FloatField(help_text="1 for an exact match, lower for more edits")
+
+    class Meta:
+        ordering = ["-score", "-brand_id"]
+        constraints = [
+            models.UniqueConstraint(fields=["brand", "duplicate_of"], name="unique_brand_duplicate")
+        ]
+        indexes = [models.Index(fields=["-score", "-brand"], name="brand_duplicate_score")]
+
+    def __str__(self):
+        return f"{self.brand_id} ~ {self.duplicate_of_id} ({self.kind}, {self.score:.2f})"
+
+    @classmethod
+    def refresh(cls, brand_ids):
+        """Recompute every candidate pair involving `brand_ids` from the similarity keys"""
+        own = defaultdict(list)
+        for brand_id, kind, term, key in BrandSimilarityKey.objects.filter(
+            brand_id__in=brand_ids
+        ).values_list("brand_id", "kind", "term", "key"):
+            own[(kind, key)].append((brand_id, term))
+
+        best = {}
+        compared = set()
+        for kind in BrandSimilarityKey.Kind.values:
+            shared = BrandSimilarityKey.objects.filter(brand_id__in=brand_ids, kind=kind)
+            others = BrandSimilarityKey.objects.filter(
+                kind=kind, key__in=shared.values("key")
+            ).values_list("brand_id", "term", "key")
+            for other_id, other_term, key in others:
+                for brand_id, term in own.get((kind, key), []):
+                    if brand_id == other_id:
+                        continue
+                    pair = (max(brand_id, other_id), min(brand_id, other_id))
+                    # terms usually share several keys, compare each pair of terms once
+                    if (pair, term, other_term) in compared:
+                        continue
+                    compared.add((pair, term, other_term))
+                    distance = similarity.distance(term, other_term)
+                    if distance is None:
+                        continue
+                    score = similarity.score(term, other_term, distance)
+                    if pair not in best or score > best[pair][2]:
+                        best[pair] = (kind, distance, score)
+
+        cls.objects.filter(
+            models.Q(brand_id__in=brand_ids) | models.Q(duplicate_of_id__in=brand_ids)
+        ).delete()
+        cls.objects.bulk_create(
+            [
+                cls(
+                    brand_id=brand_id,
+                    duplicate_of_id=other_id,
+                    kind=kind,
+                    distance=distance,
+                    score=score,
+                )
+                for (brand_id, other_id), (kind, distance, score) in best.items()
+            ],
+            batch_size=500,
+            ignore_conflicts=True,
+        )
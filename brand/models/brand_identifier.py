@@ -0,0 +1,146 @@
+import re
+from collections import defaultdict
+
+from django.db import connection, models
+from django.db.models import Count
+
+from .brand import Brand
+
+
+class BrandIdentifier(models.Model):
+    """
+    One row per non empty institutional identifier of a brand, normalized so equivalent
+    spellings ("0001234", "1234 ") meet on an indexed (scheme, value) lookup.
+    Kept in sync on save, see `BrandIdentifier.sync`. Values are not unique on purpose,
+    `conflicts` lists the ones claimed by several brands.
+    """
+
+    class Scheme(models.TextChoices):
+        PERMID = "permid"
+        ISIN = "isin"
+        VIAFID = "viafid"
+        LEI = "lei"
+        GOOGLEID = "googleid"
+        RSSD = "rssd"
+        RSSD_HD = "rssd_hd"
+        CUSIP = "cusip"
+        THRIFT = "thrift"
+        THRIFT_HC = "thrift_hc"
+        ABA_PRIM = "aba_prim"
+        NCUA = "ncua"
+        FDIC_CERT = "fdic_cert"
+        OCC = "occ"
+        EIN = "ein"
+        FRN = "frn"
+
+    # numbers that regulators publish with and without leading zeros
+    NUMERIC_SCHEMES = {"rssd", "rssd_hd", "thrift", "thrift_hc", "ncua", "fdic_cert", "occ"}
+
+    brand = models.ForeignKey(Brand, related_name="identifiers", on_delete=models.CASCADE)
+    scheme = models.CharField(max_length=16, choices=Scheme.choices)
+    value = models.CharField(max_length=255)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["brand", "scheme", "value"], name="unique_brand_identifier"
+            )
+        ]
+        indexes = [models.Index(fields=["scheme", "value"], name="brand_identifier_lookup")]
+
+    def __str__(self):
+        return f"{self.scheme} {self.value}: {self.brand_id}"
+
+    SYNC_CHUNK_SIZE = 500
+
+    @classmethod
+    def normalize(cls, scheme, value):
+        value = re.sub(r"[\s-]", "", str(value or "")).upper()
+        if scheme in cls.NUMERIC_SCHEMES and value.isdigit():
+            value = value.lstrip("0")
+        return value if value not in ("", "0") and len(value) <= 255 else ""
+
+    @classmethod
+    def identifiers_of(cls, brand):
+        identifiers = set()
+        for scheme in cls.Scheme.values:
+            value = cls.normalize(scheme, getattr(brand, scheme))
+            if value:
+                identifiers.add((scheme, value))
+        return identifiers
+
+    @classmethod
+    def sync(cls, brands):
+        """
+        Bring the identifier rows of `brands` in line with their fields, touching only rows
+        that changed. Use after bulk writes that skip Brand.save.
+        """
+        brands = [brand for brand in brands if brand.pk]
+        for start in range(0, len(brands), cls.SYNC_CHUNK_SIZE):
+            cls._sync_chunk(brands[start : start + cls.SYNC_CHUNK_SIZE])
+
+    @classmethod
+    def _sync_chunk(cls, brands):
+        wanted = {
+            (brand.pk, scheme, value)
+            for brand in brands
+            for scheme, value in cls.identifiers_of(brand)
+        }
+        existing = {
+            (brand_id, scheme, value): pk
+            for pk, brand_id, scheme, value in cls.objects.filter(
+                brand_id__in=[brand.pk for brand in brands]
+            ).values_list("pk", "brand_id", "scheme", "value")
+        }
+
+        stale = [pk for key, pk in existing.items() if key not in wanted]
+        if stale:
+            cls.objects.filter(pk__in=stale).delete()
+        cls.objects.bulk_create(
+            [
+                cls(brand_id=brand_id, scheme=scheme, value=value)
+                for brand_id, scheme, value in wanted - existing.keys()
+            ],
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+
+    @classmethod
+    def lookup(cls, scheme, values):
+        """
+        {value: [brand pks]} for each of `values` known under `scheme`, ambiguous values
+        map to several brands. Resolves as many values per query as the database allows.
+        """
+        by_normalized = defaultdict(list)
+        for value in values:
+            normalized = cls.normalize(scheme, value)
+            if normalized:
+                by_normalized[normalized].append(value)
+        normalized_values = list(by_normalized)
+
+        # one parameter goes to the scheme
+        chunk_size = (connection.features.max_query_params or 10000) - 1
+        matches = defaultdict(list)
+        for start in range(0, len(normalized_values), chunk_size):
+            rows = (
+                cls.objects.filter(
+                    scheme=scheme, value__in=normalized_values[start : start + chunk_size]
+                )
+                .order_by("value", "brand_id")
+                .values_list("value", "brand_id")
+            )
+            for normalized, brand_id in rows:
+                for value in by_normalized[normalized]:
+                    matches[value].append(brand_id)
+        return dict(matches)
+
+    @classmethod
+    def conflicts(cls, scheme=None):
+        """(scheme, value, brand count) of identifiers claimed by more than one brand"""
+        rows = cls.objects.all() if scheme is None else cls.objects.filter(scheme=scheme)
+        return (
+            rows.values("scheme", "value")
+            .annotate(brands=Count("brand_id"))
+            .filter(brands__gt=1)
+            .order_by("scheme", "-brands", "value")
+        )
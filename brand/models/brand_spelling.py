@@ -0,0 +1,145 @@
+from django.db import models
+
+from .brand import Brand
+
+
+class BrandSpelling(models.Model):
+    """
+    Every spelling `Brand.create_spelling_dictionary` would map to a brand, persisted so a
+    spelling resolves with one indexed lookup instead of rebuilding the dictionary.
+    Kept in sync on save, see `BrandSpelling.sync`.
+
+    Several brands can claim the same spelling; the lowest `rank` wins, then the lowest pk.
+    """
+
+    class Kind(models.IntegerChoices):
+        NAME = 0
+        ALIAS = 1
+        WEBSITE = 2
+        ABBREVIATION = 3
+        IDENTIFIER = 4
+
+    # identifier fields create_spelling_dictionary maps to a brand
+    IDENTIFIER_FIELDS = (
+        "lei",
+        "permid",
+        "viafid",
+        "googleid",
+        "rssd",
+        "rssd_hd",
+        "cusip",
+        "thrift",
+        "thrift_hc",
+        "aba_prim",
+        "ncua",
+        "fdic_cert",
+        "occ",
+        "ein",
+    )
+    SOURCE_FIELDS = ("name", "aliases", "website", *IDENTIFIER_FIELDS)
+
+    brand = models.ForeignKey(Brand, related_name="spellings", on_delete=models.CASCADE)
+    spelling = models.CharField(max_length=255)
+    rank = models.PositiveSmallIntegerField(choices=Kind.choices)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["spelling", "brand"], name="unique_brand_spelling")
+        ]
+        indexes = [models.Index(fields=["spelling", "rank", "brand"], name="brand_spelling_lookup")]
+
+    def __str__(self):
+        return f"{self.spelling}: {self.brand_id}"
+
+    SYNC_CHUNK_SIZE = 500
+
+    @staticmethod
+    def normalize(text):
+        return (text or "").strip().lower()
+
+    @classmethod
+    def spellings_of(cls, brand):
+        """{spelling: rank} of one brand, derived like create_spelling_dictionary does"""
+        candidates = [(brand.name, cls.Kind.NAME)]
+        candidates += [(s, cls.Kind.ALIAS) for s in Brand._aliases_into_spelling_dict(brand, {})]
+        candidates += [(s, cls.Kind.WEBSITE) for s in Brand.website_into_spelling_dict(brand, {})]
+        candidates += [
+            (s, cls.Kind.ABBREVIATION) for s in Brand._abbreviations_into_spelling_dict(brand, {})
+        ]
+        candidates += [(getattr(brand, f), cls.Kind.IDENTIFIER) for f in cls.IDENTIFIER_FIELDS]
+
+        spellings = {}
+        for text, rank in candidates:
+            spelling = cls.normalize(text)
+            if spelling in ("", "0") or len(spelling) > 255:
+                continue
+            spellings[spelling] = min(rank, spellings.get(spelling, rank))
+        return spellings
+
+    @classmethod
+    def sync(cls, brands):
+        """
+        Bring the spelling rows of `brands` in line with their fields, touching only rows
+        that changed. Use after bulk writes that skip Brand.save.
+        """
+        brands = [brand for brand in brands if brand.pk]
+        for start in range(0, len(brands), cls.SYNC_CHUNK_SIZE):
+            cls._sync_chunk(brands[start : start + cls.SYNC_CHUNK_SIZE])
+
+    @classmethod
+    def _sync_chunk(cls, brands):
+        wanted = {
+            (brand.pk, spelling): rank
+            for brand in brands
+            for spelling, rank in cls.spellings_of(brand).items()
+        }
+        existing = {
+            (brand_id, spelling): (pk, rank)
+            for pk, brand_id, spelling, rank in cls.objects.filter(
+                brand_id__in=[brand.pk for brand in brands]
+            ).values_list("pk", "brand_id", "spelling", "rank")
+        }
+
+        stale = [pk for key, (pk, rank) in existing.items() if wanted.get(key) != rank]
+        if stale:
+            cls.objects.filter(pk__in=stale).delete()
+        cls.objects.bulk_create(
+            [
+                cls(brand_id=brand_id, spelling=spelling, rank=rank)
+                for (brand_id, spelling), rank in wanted.items()
+                if existing.get((brand_id, spelling), (None, None))[1] != rank
+            ],
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+
+    @classmethod
+    def resolve(cls, text):
+        """pk of the brand `text` is a spelling of, or None"""
+        return (
+            cls.objects.filter(spelling=cls.normalize(text))
+            .order_by("rank", "brand_id")
+            .values_list("brand_id", flat=True)
+            .first()
+        )
+
+    @classmethod
+    def resolve_many(cls, texts):
+        """{text: brand pk} for every text that is a known spelling"""
+        by_spelling = {}
+        for text in texts:
+            by_spelling.setdefault(cls.normalize(text), []).append(text)
+        spellings = list(by_spelling)
+
+        resolved = {}
+        for start in range(0, len(spellings), cls.SYNC_CHUNK_SIZE):
+            rows = (
+                cls.objects.filter(spelling__in=spellings[start : start + cls.SYNC_CHUNK_SIZE])
+                .order_by("spelling", "-rank", "-brand_id")
+                .values_list("spelling", "brand_id")
+            )
+            # ordered worst first, so the best claim of each spelling is written last
+            for spelling, brand_id in rows:
+                for text in by_spelling[spelling]:
+                    resolved[text] = brand_id
+        return resolved
@@ -1,3 +1,5 @@
+import copy
+import hashlib
 import json
 from functools import lru_cache
 
@@ -11,6 +13,8 @@ from jsonschema.exceptions import ValidationError as JSONValidationError
 
 from brand.models import Brand
 from brand.models.embrace_campaign import EmbraceCampaign
+from brand.utils import query_cache
+from brand.utils.markdown_render import MARKDOWN_FIELDS, render_markdown
 
 
 @lru_cache(maxsize=1)
@@ -40,6 +44,25 @@ def validate_feature_override(feature_override) -> None:
         raise Exception(err)
 
 
+def merge_features(feature_json, feature_override):
+    """
+    Harvest data with the manual overrides applied: objects are merged key by key, any
+    other override value (lists included) replaces the harvested one.
+    """
+    if not isinstance(feature_json, dict) or not isinstance(feature_override, dict):
+        return copy.deepcopy(feature_json if feature_override is None else feature_override)
+    merged = copy.deepcopy(feature_json)
+    for key, value in feature_override.items():
+        merged[key] = merge_features(feature_json.get(key), value)
+    return merged
+
+
+def hash_features(feature_json):
+    """SHA-256 of a harvest payload, the same for equal payloads whatever their key order"""
+    canonical = json.dumps(feature_json, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
 class RatingChoice(models.TextChoices):
     GREAT = "great"
     GOOD = "good"
@@ -117,9 +140,101 @@ class Commentary(models.Model):
 
     embrace_campaign = models.ManyToManyField(EmbraceCampaign, blank=True)
 
-    @property
-    def rating_inherited(self):
-        return self.compute_inherited_rating()
+    # Effective rating after following `inherit_brand_rating`. Maintained by
+    # `recompute_inherited_ratings` so reads and filters never walk the chain.
+    rating_inherited = models.CharField(
+        max_length=8,
+        choices=RatingChoice.choices,
+        default=RatingChoice.UNKNOWN,
+        editable=False,
+        db_index=True,
+    )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_rating_inputs = (
+            instance.__dict__.get("rating"),
+            instance.__dict__.get("inherit_brand_rating_id"),
+        )
+        instance._loaded_markdown = {f: instance.__dict__.get(f) for f in MARKDOWN_FIELDS}
+        return instance
+
+    def render_markdown_fields(self, force=False):
+        """
+        Re-render the HTML of every markdown field whose text changed since it was loaded.
+        Returns the names of the HTML fields that were updated.
+        """
+        loaded = getattr(self, "_loaded_markdown", {})
+        rendered = []
+        for field, html_field in MARKDOWN_FIELDS.items():
+            if field not in self.__dict__:
+                # deferred and therefore unchanged
+                continue
+            text = getattr(self, field)
+            if force or field not in loaded or loaded[field] != text:
+                setattr(self, html_field, render_markdown(text))
+                rendered.append(html_field)
+        self._loaded_markdown = {f: self.__dict__.get(f) for f in MARKDOWN_FIELDS}
+        return rendered
+
+    @classmethod
+    def recompute_inherited_ratings(cls):
+        """
+        Recompute `rating_inherited` for the whole inheritance graph in a single pass and
+        write back only the rows whose effective rating changed.
+        Returns the brand_id -> effective rating mapping.
+        """
+        from brand.utils.rating_inheritance import resolve_inherited_ratings
+
+        rows = list(
+            cls.objects.values_list(
+                "pk", "brand_id", "rating", "inherit_brand_rating_id", "rating_inherited"
+            )
+        )
+        resolved, _ = resolve_inherited_ratings((row[1], row[2], row[3]) for row in rows)
+
+        stale = {
+            pk: brand_id for pk, brand_id, _, _, current in rows if resolved[brand_id] != current
+        }
+        cls.objects.bulk_update(
+            [cls(pk=pk, rating_inherited=resolved[brand_id]) for pk, brand_id in stale.items()],
+            ["rating_inherited"],
+            batch_size=500,
+        )
+
+        # bulk_update sends no signals, so drop cached brand queries for the inheritors here
+        query_cache.invalidate_brands(stale.values())
+        return resolved
+
+    def has_inheritors(self):
+        return (
+            Commentary.objects.filter(inherit_brand_rating_id=self.brand_id)
+            .exclude(pk=self.pk)
+            .exists()
+        )
+
+    def resolve_own_rating(self):
+        """
+        The effective rating of this commentary following its parents up, one query per
+        parent. Like `recompute_inherited_ratings`, a missing parent or a cycle resolves
+        to UNKNOWN.
+        """
+        seen = {self.brand_id}
+        rating, parent_id = self.rating, self.inherit_brand_rating_id
+        while rating == RatingChoice.INHERIT:
+            if parent_id is None or parent_id in seen:
+                return RatingChoice.UNKNOWN
+            seen.add(parent_id)
+            parent = (
+                Commentary.objects.filter(brand_id=parent_id)
+                .values_list("rating", "inherit_brand_rating_id")
+                .first()
+            )
+            if parent is None:
+                return RatingChoice.UNKNOWN
+            rating, parent_id = parent
+        return rating
 
     def compute_inherited_rating(self, inheritance_set=None, throw_error=False):
         inheritance_set = set() if inheritance_set is None else inheritance_set
@@ -205,6 +320,14 @@ class Commentary(models.Model):
 
     from_the_website = models.TextField(help_text="needed for site compatibility", blank=True)
 
+    # HTML rendered from the markdown fields above on save, served by the GraphQL API
+    headline_html = models.TextField(blank=True, default="", editable=False)
+    subtitle_html = models.TextField(blank=True, default="", editable=False)
+    description1_html = models.TextField(blank=True, default="", editable=False)
+    description2_html = models.TextField(blank=True, default="", editable=False)
+    description3_html = models.TextField(blank=True, default="", editable=False)
+    from_the_website_html = models.TextField(blank=True, default="", editable=False)
+
     # Shown on the sustainable banks pages
     our_take = models.TextField(
         help_text="Positive. used to to give our take on green banks", blank=True
@@ -212,6 +335,8 @@ class Commentary(models.Model):
 
     feature_refresh_date = models.DateTimeField(null=True, blank=True)
     feature_json = models.JSONField(null=True, blank=True, default=dict)
+    # hash_features(feature_json), harvest refreshes skip the write when it is unchanged
+    feature_hash = models.CharField(max_length=64, blank=True, editable=False)
     feature_override = models.JSONField(
         blank=True,
         default=dict,
@@ -219,6 +344,8 @@ class Commentary(models.Model):
         validators=[validate_feature_override],
         help_text="Provide harvest features in json with valid keys",
     )
+    # feature_json merged with feature_override on save, what harvestData serves
+    effective_features = models.JSONField(null=True, blank=True, default=dict, editable=False)
 
     @property
     def feature_yaml(self):
@@ -236,8 +363,12 @@ class Commentary(models.Model):
         # Ensure no cycles when saving
         self.compute_inherited_rating(throw_error=True)
 
-    def save(self, *args, **kwargs):
-        if self.inherit_brand_rating:
+    def apply_save_defaults(self):
+        """
+        Normalize the fields the way save() does, for bulk writes that skip save().
+        Returns the names of the HTML fields that were re-rendered.
+        """
+        if self.inherit_brand_rating_id:
             self.rating = RatingChoice.INHERIT
 
         if self.fossil_free_alliance and self.fossil_free_alliance_rating < 0:
@@ -245,4 +376,44 @@ class Commentary(models.Model):
         elif not self.fossil_free_alliance:
             self.fossil_free_alliance_rating = -1
 
-        return super().save(*args, **kwargs)
+        self.feature_hash = hash_features(self.feature_json)
+        self.refresh_effective_features()
+        return self.render_markdown_fields()
+
+    def refresh_effective_features(self):
+        self.effective_features = merge_features(self.feature_json, self.feature_override)
+        return self.effective_features
+
+    def save(self, *args, **kwargs):
+        rendered = self.apply_save_defaults()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = set(update_fields) | {
+                html_field
+                for field, html_field in MARKDOWN_FIELDS.items()
+                if field in update_fields and html_field in rendered
+            }
+            if {"feature_json", "feature_override"} & kwargs["update_fields"]:
+                kwargs["update_fields"].add("effective_features")
+            if "feature_json" in kwargs["update_fields"]:
+                kwargs["update_fields"].add("feature_hash")
+
+        rating_inputs = (self.rating, self.inherit_brand_rating_id)
+        rating_inputs_changed = rating_inputs != getattr(self, "_loaded_rating_inputs", None)
+        # a changed rating or parent can change the effective rating of every inheritor,
+        # without inheritors it only changes this commentary's
+        recompute_inheritors = rating_inputs_changed and self.has_inheritors()
+        if rating_inputs_changed and not recompute_inheritors:
+            self.rating_inherited = self.resolve_own_rating()
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = set(kwargs["update_fields"]) | {"rating_inherited"}
+
+        result = super().save(*args, **kwargs)
+
+        if recompute_inheritors:
+            resolved = Commentary.recompute_inherited_ratings()
+            self.rating_inherited = resolved.get(self.brand_id, self.rating_inherited)
+        if rating_inputs_changed:
+            self._loaded_rating_inputs = rating_inputs
+
+        return result
@@ -0,0 +1,122 @@
+from django.db import models
+
+from .commentary import Commentary
+
+
+class HarvestFeature(models.Model):
+    """
+    One row per feature of a commentary's effective features (harvest data with the
+    overrides applied) that says whether it is offered,
+    i.e. effective_features["deposit_products"]["savings"]["offered"], so `brands(harvestData:)`
+    filters are an indexed lookup instead of a JSON scan of every commentary.
+    Kept in sync on save, see `HarvestFeature.sync`.
+    """
+
+    commentary = models.ForeignKey(
+        Commentary, related_name="harvest_features", on_delete=models.CASCADE
+    )
+    section = models.CharField(max_length=64)
+    feature = models.CharField(max_length=64)
+    offered = models.BooleanField()
+    # customer types the feature is offered to, from its `offered_to`
+    customer_types = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["commentary", "section", "feature"], name="unique_harvest_feature"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["section", "feature", "offered", "commentary"],
+                name="harvest_feature_lookup",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.section}.{self.feature}: {self.offered}"
+
+    SYNC_CHUNK_SIZE = 500
+
+    @staticmethod
+    def customer_types_of(offered_to):
+        # deposit products: {"customer_type": [...]}, loan products: [{"customer_type": ...}]
+        entries = offered_to if isinstance(offered_to, list) else [offered_to]
+        types = set()
+        for entry in entries:
+            customer_type = entry.get("customer_type") if isinstance(entry, dict) else None
+            if isinstance(customer_type, str):
+                types.add(customer_type)
+            elif isinstance(customer_type, list):
+                types.update(t for t in customer_type if isinstance(t, str))
+        return sorted(types)
+
+    @classmethod
+    def features_of(cls, document):
+        """{(section, feature): (offered, customer types)} of a harvest document"""
+        features = {}
+        for section, section_features in (document or {}).items():
+            if not isinstance(section_features, dict):
+                continue
+            for feature, values in section_features.items():
+                if isinstance(values, dict) and "offered" in values:
+                    features[(section, feature)] = (
+                        values["offered"] is True,
+                        cls.customer_types_of(values.get("offered_to")),
+                    )
+        return features
+
+    @staticmethod
+    def document_of(commentary):
+        return commentary.effective_features
+
+    @classmethod
+    def sync(cls, commentaries):
+        """
+        Bring the feature rows of `commentaries` in line with their effective features, touching
+        only rows that changed. Use after bulk writes that skip Commentary.save.
+        """
+        commentaries = [commentary for commentary in commentaries if commentary.pk]
+        for start in range(0, len(commentaries), cls.SYNC_CHUNK_SIZE):
+            cls._sync_chunk(commentaries[start : start + cls.SYNC_CHUNK_SIZE])
+
+    @classmethod
+    def _sync_chunk(cls, commentaries):
+        wanted = {
+            (commentary.pk, section, feature): values
+            for commentary in commentaries
+            for (section, feature), values in cls.features_of(cls.document_of(commentary)).items()
+        }
+        existing = {
+            (commentary_id, section, feature): (pk, (offered, customer_types))
+            for pk, commentary_id, section, feature, offered, customer_types in cls.objects.filter(
+                commentary_id__in=[commentary.pk for commentary in commentaries]
+            ).values_list("pk", "commentary_id", "section", "feature", "offered", "customer_types")
+        }
+
+        stale = [pk for key, (pk, values) in existing.items() if wanted.get(key) != values]
+        if stale:
+            cls.objects.filter(pk__in=stale).delete()
+        cls.objects.bulk_create(
+            [
+                cls(
+                    commentary_id=commentary_id,
+                    section=section,
+                    feature=feature,
+                    offered=offered,
+                    customer_types=customer_types,
+                )
+                for (commentary_id, section, feature), (offered, customer_types) in wanted.items()
+                if existing.get((commentary_id, section, feature), (None, None))[1]
+                != (offered, customer_types)
+            ],
+            batch_size=500,
+        )
+
+    @classmethod
+    def offering(cls, section, feature):
+        """Subquery of the ids of commentaries offering `feature` of `section`"""
+        return cls.objects.filter(section=section, feature=feature, offered=True).values(
+            "commentary_id"
+        )
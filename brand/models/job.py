@@ -0,0 +1,121 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .brand import Brand
+
+
+class Job(models.Model):
+    """
+    A background refresh of one brand, queued from the admin and run by
+    `manage.py run_jobs`, see brand/utils/jobs.py. A brand has at most one queued or
+    running job of each kind. A failing job is attempted up to `max_attempts` times,
+    JOB_RETRY_BACKOFF * 2 ** (attempt - 1) seconds apart.
+    """
+
+    class Kind(models.TextChoices):
+        HARVEST_FEATURES = "harvest_features", "Harvest features"
+        HARVEST_LOCATIONS = "harvest_locations", "Harvest locations"
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        RUNNING = "running", "Running"
+        SUCCEEDED = "succeeded", "Succeeded"
+        FAILED = "failed", "Failed"
+
+    ACTIVE = [Status.QUEUED, Status.RUNNING]
+
+    kind = models.CharField(max_length=32, choices=Kind.choices)
+    brand = models.ForeignKey(Brand, related_name="jobs", on_delete=models.CASCADE)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(max_length=255, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["kind", "brand"],
+                condition=models.Q(status__in=["queued", "running"]),
+                name="unique_active_job",
+            )
+        ]
+        indexes = [models.Index(fields=["status", "run_after"], name="job_queue")]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} of {self.brand_id}: {self.status}"
+
+    @classmethod
+    def submit(cls, kind, brand_id):
+        """
+        (job, created): the queued or running job of `kind` for the brand, or a new
+        queued one when there is none
+        """
+        active = cls.objects.filter(kind=kind, brand_id=brand_id, status__in=cls.ACTIVE)
+        job = active.first()
+        if job is not None:
+            return job, False
+        try:
+            with transaction.atomic():
+                return cls.objects.create(kind=kind, brand_id=brand_id), True
+        except IntegrityError:
+            # submitted concurrently
+            return active.first(), False
+
+    @classmethod
+    def claim(cls, worker):
+        """Mark the next due job as running by `worker` and return it, None if none is due"""
+        now = timezone.now()
+        due = cls.objects.filter(status=cls.Status.QUEUED, run_after__lte=now)
+        for pk in due.order_by("run_after", "pk").values_list("pk", flat=True)[:10]:
+            # another worker may have claimed it since
+            claimed = cls.objects.filter(pk=pk, status=cls.Status.QUEUED).update(
+                status=cls.Status.RUNNING, attempts=F("attempts") + 1, started=now, worker=worker
+            )
+            if claimed:
+                return cls.objects.select_related("brand").get(pk=pk)
+        return None
+
+    @classmethod
+    def requeue_stale(cls):
+        """
+        Queue again the jobs running for longer than JOB_TIMEOUT, i.e. whose worker died,
+        or fail them after their last attempt. Returns the number queued again.
+        """
+        now = timezone.now()
+        stale = cls.objects.filter(
+            status=cls.Status.RUNNING, started__lt=now - timedelta(seconds=settings.JOB_TIMEOUT)
+        )
+        requeued = stale.filter(attempts__lt=F("max_attempts")).update(
+            status=cls.Status.QUEUED, run_after=now, last_error="Timed out"
+        )
+        stale.update(status=cls.Status.FAILED, finished=now, last_error="Timed out")
+        return requeued
+
+    def succeed(self):
+        self.status = self.Status.SUCCEEDED
+        self.finished = timezone.now()
+        self.last_error = ""
+        self.save(update_fields=["status", "finished", "last_error"])
+
+    def fail(self, error):
+        """Queue the job again after a backoff, or mark it failed after its last attempt"""
+        now = timezone.now()
+        self.last_error = error
+        if self.attempts < self.max_attempts:
+            self.status = self.Status.QUEUED
+            self.run_after = now + timedelta(
+                seconds=settings.JOB_RETRY_BACKOFF * 2 ** (self.attempts - 1)
+            )
+        else:
+            self.status = self.Status.FAILED
+            self.finished = now
+        self.save(update_fields=["status", "run_after", "finished", "last_error"])
@@ -0,0 +1,30 @@
+import hashlib
+
+from django.db import models
+
+
+class PersistedQuery(models.Model):
+    """
+    A GraphQL document clients may run by its SHA-256 hash alone, Apollo style:
+    `extensions={"persistedQuery": {"version": 1, "sha256Hash": ...}}`.
+    Register documents with `manage.py register_persisted_queries` or the admin.
+    """
+
+    sha256 = models.CharField(max_length=64, unique=True, editable=False)
+    name = models.CharField(max_length=255, blank=True)
+    query = models.TextField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = "Persisted queries"
+
+    def __str__(self):
+        return self.name or self.sha256
+
+    @staticmethod
+    def hash(query):
+        return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+    def save(self, *args, **kwargs):
+        self.sha256 = self.hash(self.query)
+        super().save(*args, **kwargs)
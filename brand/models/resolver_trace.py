@@ -0,0 +1,18 @@
+from django.db import models
+
+
+class ResolverTrace(models.Model):
+    """
+    Per field resolver timings of one traced /graphql request, see
+    brand/utils/resolver_tracing.py. Only the latest GRAPHQL_TRACING_KEEP are kept.
+    """
+
+    created = models.DateTimeField(auto_now_add=True)
+    operation_name = models.CharField(max_length=255, blank=True)
+    duration_ms = models.FloatField()
+    sql_count = models.PositiveIntegerField()
+    # {"Type.field": [calls, ms, sql count, sql ms]}
+    fields = models.JSONField()
+
+    def __str__(self):
+        return f"{self.operation_name or 'anonymous'} {self.created:%Y-%m-%d %H:%M:%S}"
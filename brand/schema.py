@@ -1,30 +1,35 @@
-import hashlib
 import json
 import logging
 import re
 
-from django.core.cache import cache
 from django.db.models import Case, Count, Q, When
+from django.db.models.fields.json import KeyTransform
 
 import graphene
 from django_countries import countries
 from django_countries.graphql.types import Country
 from django_filters import BooleanFilter, CharFilter, ChoiceFilter, FilterSet, MultipleChoiceFilter
 from graphene import Scalar, relay
+from graphene.utils.str_converters import to_camel_case
 from graphene_django import DjangoListField, DjangoObjectType
 from graphene_django.filter import DjangoFilterConnectionField, TypedFilter
-from graphql import GraphQLError, StringValueNode
-from markdown import markdown
-from markdown.extensions.footnotes import FootnoteExtension
+from graphql import FragmentSpreadNode, GraphQLError, InlineFragmentNode, StringValueNode
 
 from brand.models.commentary import RatingChoice
+from brand.utils import query_cache
+from brand.utils.markdown_render import MARKDOWN_FIELDS, render_markdown
 from utils.brand_utils import filter_json_field
 
 from .models import Brand as BrandModel
 from .models import BrandFeature as BrandFeatureModel
+from .models import BrandIdentifier as BrandIdentifierModel
+from .models import BrandSpelling as BrandSpellingModel
 from .models import Commentary as CommentaryModel
 from .models import EmbraceCampaign as EmbraceCampaignModel
 from .models import FeatureType as FeatureModel
+from .models import HarvestFeature as HarvestFeatureModel
+from .models import StateLicensed as StateLicensedModel
+from .models import StatePhysicalBranch as StatePhysicalBranchModel
 from .models.commentary import InstitutionCredential as InstitutionCredentialModel
 from .models.commentary import InstitutionType as InstitutionTypeModel
 from .models.state import State as StateModel
@@ -39,7 +44,7 @@ class BrandFilter(FilterSet):
     country = ChoiceFilter(choices=choices, method="filter_countries")
 
     def filter_countries(self, queryset, name, value):
-        return queryset.filter(countries__contains=value).order_by("name")
+        return queryset.filter(country_memberships__country=value).order_by("name")
 
     rating = MultipleChoiceFilter(
         method="filter_rating", field_name="commentary__rating", choices=RatingChoice.choices
@@ -97,19 +102,10 @@ class BrandFilter(FilterSet):
         return queryset
 
     def filter_rating(self, queryset, name, value):
-        # ratings matching the query exactly
-        direct_matches_qs = queryset.filter(commentary__rating__in=value)
-
-        # some brands have inherited ratings defined as a property
-        inherited_matches_pks = [
-            x.pk
-            for x in queryset.filter(commentary__rating=RatingChoice.INHERIT)
-            if x.commentary.rating_inherited in value
-        ]
-
-        inheritors_qs = queryset.filter(Q(pk__in=inherited_matches_pks))
-
-        return direct_matches_qs | inheritors_qs
+        # ratings matching the query exactly, or matching the stored inherited rating
+        return queryset.filter(
+            Q(commentary__rating__in=value) | Q(commentary__rating_inherited__in=value)
+        )
 
     state_physical_branch = CharFilter(field_name="state_physical_branch__tag", lookup_expr="exact")
     state_licensed = CharFilter(field_name="state_licensed__tag", lookup_expr="exact")
@@ -125,13 +121,26 @@ class State(DjangoObjectType):
 
 
 class HtmlFromMarkdown(Scalar):
-    """Markdown parsed into HTML"""
+    """Markdown parsed into HTML. Rendered when the Commentary is saved, see resolve_html"""
 
     @staticmethod
-    def serialize(md):
-        extensions = ["markdown_link_attr_modifier", FootnoteExtension()]
-        extension_configs = {"markdown_link_attr_modifier": {"new_tab": "external_only"}}
-        return markdown(md, extensions=extensions, extension_configs=extension_configs)
+    def serialize(html):
+        return html
+
+
+def resolve_html(field):
+    """Resolver serving the pre-rendered HTML of a Commentary markdown field"""
+    html_field = MARKDOWN_FIELDS[field]
+
+    def resolver(obj, info):
+        html = getattr(obj, html_field)
+        text = getattr(obj, field)
+        # rows saved before the HTML columns existed until render_commentary_markdown runs
+        if not html and text:
+            return render_markdown(text)
+        return html
+
+    return resolver
 
 
 class InstitutionTypeType(DjangoObjectType):
@@ -175,6 +184,188 @@ class HarvestDataDictionary(graphene.ObjectType):
     tag = graphene.String()
 
 
+def selection_tree(field_nodes, fragments):
+    """
+    Merge the selection sets of `field_nodes` into a nested {field name: subtree} dict,
+    expanding fragment spreads and inline fragments.
+    """
+    tree = {}
+
+    def visit(selection_set):
+        for selection in selection_set.selections if selection_set else ():
+            if isinstance(selection, FragmentSpreadNode):
+                visit(fragments[selection.name.value].selection_set)
+            elif isinstance(selection, InlineFragmentNode):
+                visit(selection.selection_set)
+            else:
+                subtree = selection_tree([selection], fragments)
+                tree.setdefault(selection.name.value, {}).update(subtree)
+
+    for node in field_nodes:
+        visit(node.selection_set)
+    return tree
+
+
+class DataLoader:
+    """
+    Batches lookups of one relation into a single `IN` query.
+
+    Execution is synchronous, so instead of deferring loads to the end of a tick the
+    loader is primed with every key it will be asked for (the brands of a connection page)
+    and the first `load` fetches all pending keys at once.
+    """
+
+    def __init__(self, batch_load_fn, default=None):
+        self.batch_load_fn = batch_load_fn
+        self.default = default
+        self._results = {}
+        self._pending = set()
+
+    def prime(self, keys):
+        self._pending.update(key for key in keys if key not in self._results)
+
+    def load(self, key):
+        if key not in self._results:
+            self._pending.add(key)
+            keys, self._pending = self._pending, set()
+            loaded = self.batch_load_fn(keys)
+            for k in keys:
+                self._results[k] = loaded.get(k, self.default() if self.default else None)
+        return self._results[key]
+
+
+def _group_by_brand(rows, value=lambda row: row):
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row.brand_id, []).append(value(row))
+    return grouped
+
+
+class BrandLoaders:
+    """
+    Per-request loaders for the relations rendered under a `Brand` node. One instance is
+    shared by every brand of a connection page and reached through `brand._loaders`.
+
+    `selection` is the selection tree of the Brand node; the commentary batch only reads
+    the columns and joins/prefetches the relations that the client asked for.
+    """
+
+    # commentary fields whose resolvers read columns other than their own
+    commentary_field_columns = {
+        "harvestData": ["effective_features"],
+        "featureYaml": ["feature_json"],
+        **{to_camel_case(f): [f, html] for f, html in MARKDOWN_FIELDS.items()},
+    }
+    commentary_select_related = {"brand": "brand", "inheritBrandRating": "inherit_brand_rating"}
+    commentary_prefetch_related = {
+        "institutionType": "institution_type",
+        "institutionCredentials": "institution_credentials",
+        "embraceCampaign": "embrace_campaign",
+    }
+
+    def __init__(self, selection=None):
+        self.commentary = DataLoader(
+            lambda ids: {
+                c.brand_id: c for c in self.commentary_queryset(selection).filter(brand_id__in=ids)
+            }
+        )
+        # the feature is joined in so BrandFeature.name/description cost no extra query
+        self.bank_features = DataLoader(
+            lambda ids: _group_by_brand(
+                BrandFeatureModel.objects.filter(brand_id__in=ids).select_related("feature")
+            ),
+            default=list,
+        )
+        self.state_licensed = DataLoader(
+            lambda ids: _group_by_brand(
+                StateLicensedModel.objects.filter(brand_id__in=ids).select_related("state"),
+                lambda row: row.state,
+            ),
+            default=list,
+        )
+        self.state_physical_branch = DataLoader(
+            lambda ids: _group_by_brand(
+                StatePhysicalBranchModel.objects.filter(brand_id__in=ids).select_related("state"),
+                lambda row: row.state,
+            ),
+            default=list,
+        )
+
+    @classmethod
+    def commentary_queryset(cls, selection):
+        queryset = CommentaryModel.objects.all()
+        if selection is None:
+            return queryset
+
+        requested = selection.get("commentary", {})
+        queryset = queryset.select_related(
+            *(
+                cls.commentary_select_related[f]
+                for f in requested
+                if f in cls.commentary_select_related
+            )
+        ).prefetch_related(
+            *(
+                cls.commentary_prefetch_related[f]
+                for f in requested
+                if f in cls.commentary_prefetch_related
+            )
+        )
+
+        columns = cls.commentary_columns(requested)
+        # the Brand node's own harvestData reads the commentary's effective_features
+        if columns is not None and "harvestData" in selection:
+            columns.add("effective_features")
+        return queryset if columns is None else queryset.only(*columns)
+
+    @classmethod
+    def commentary_columns(cls, requested):
+        """
+        Commentary columns needed to render `requested`, or None when a field is not
+        understood and every column has to be loaded.
+        """
+        concrete = {to_camel_case(f.name): f.name for f in CommentaryModel._meta.concrete_fields}
+        columns = {"id", "brand"}
+        for field in requested:
+            if field == "__typename":
+                continue
+            elif field in cls.commentary_field_columns:
+                columns.update(cls.commentary_field_columns[field])
+            elif field in concrete:
+                columns.add(concrete[field])
+            elif field not in cls.commentary_prefetch_related:
+                return None
+        for field in requested:
+            if field in cls.commentary_select_related:
+                # select_related needs the related fields to stay loadable
+                columns.add(cls.commentary_select_related[field])
+        return columns
+
+    @classmethod
+    def attach(cls, brands, selection=None):
+        brands = [brand for brand in brands if brand is not None]
+        if not brands:
+            return
+        loaders = cls(selection)
+        ids = [brand.pk for brand in brands]
+        for loader in (
+            loaders.commentary,
+            loaders.bank_features,
+            loaders.state_licensed,
+            loaders.state_physical_branch,
+        ):
+            loader.prime(ids)
+        for brand in brands:
+            brand._loaders = loaders
+
+
+def _load_or_get(brand, relation, fallback):
+    loaders = getattr(brand, "_loaders", None)
+    if loaders is None:
+        return fallback()
+    return getattr(loaders, relation).load(brand.pk)
+
+
 class Brand(DjangoObjectType):
     """ """
 
@@ -197,9 +388,22 @@ class Brand(DjangoObjectType):
         interfaces = (relay.Node,)
         filterset_class = BrandFilter
 
+    def resolve_commentary(self, info):
+        return _load_or_get(self, "commentary", lambda: getattr(self, "commentary", None))
+
+    def resolve_bank_features(self, info):
+        return _load_or_get(self, "bank_features", lambda: self.bank_features.all())
+
+    def resolve_state_licensed(self, info):
+        return _load_or_get(self, "state_licensed", lambda: self.state_licensed.all())
+
+    def resolve_state_physical_branch(self, info):
+        return _load_or_get(self, "state_physical_branch", lambda: self.state_physical_branch.all())
+
     def resolve_harvest_data(self, info, **kwargs):
         try:
-            if not self.commentary.feature_json:
+            commentary = Brand.resolve_commentary(self, info)
+            if not commentary.effective_features:
                 return None
 
             requested_fields = [
@@ -207,7 +411,7 @@ class Brand(DjangoObjectType):
             ]
 
             filtered_data = filter_harvest_data(
-                self.commentary.feature_json, requested_fields, **kwargs
+                commentary.effective_features, requested_fields, **kwargs
             )
             return HarvestData(**filtered_data)
         except:
@@ -216,15 +420,13 @@ class Brand(DjangoObjectType):
 
 class Commentary(DjangoObjectType):
     last_reviewed = graphene.DateTime()
-    description1 = HtmlFromMarkdown()
-    description2 = HtmlFromMarkdown()
-    description3 = HtmlFromMarkdown()
-    from_the_website = HtmlFromMarkdown()
-    headline = HtmlFromMarkdown()
-    subtitle = HtmlFromMarkdown()
-    rating_inherited = graphene.Field(
-        graphene.String, resolver=lambda obj, info: obj.rating_inherited
-    )
+    description1 = HtmlFromMarkdown(resolver=resolve_html("description1"))
+    description2 = HtmlFromMarkdown(resolver=resolve_html("description2"))
+    description3 = HtmlFromMarkdown(resolver=resolve_html("description3"))
+    from_the_website = HtmlFromMarkdown(resolver=resolve_html("from_the_website"))
+    headline = HtmlFromMarkdown(resolver=resolve_html("headline"))
+    subtitle = HtmlFromMarkdown(resolver=resolve_html("subtitle"))
+    rating_inherited = graphene.String()
     top_pick = graphene.Boolean()
     harvest_data = graphene.Field(
         HarvestData,
@@ -244,13 +446,13 @@ class Commentary(DjangoObjectType):
     def resolve_harvest_data(self, info, **kwargs):
         """returns filtered feature yaml"""
         try:
-            if not self.feature_json:
+            if not self.effective_features:
                 raise GraphQLError(f"No harvest data found for brand tag: {self.brand.tag}")
             requested_fields = [
                 field.name.value for field in info.field_nodes[0].selection_set.selections
             ]
 
-            filtered_data = filter_harvest_data(self.feature_json, requested_fields, **kwargs)
+            filtered_data = filter_harvest_data(self.effective_features, requested_fields, **kwargs)
             return HarvestData(**filtered_data)
         except Exception as e:
             logging.error(f"Error fetching harvest data for {self.brand.tag}: {str(e)}")
@@ -296,21 +498,25 @@ class EmbraceCampaignType(DjangoObjectType):
         fields = ("id", "name", "description", "configuration")
 
 
+CAMEL_CASE_BOUNDARY = re.compile("([a-z])([A-Z])")
+
+
+def snake_case(field):
+    return CAMEL_CASE_BOUNDARY.sub(r"\1_\2", field).lower()
+
+
 def filter_harvest_data(cached_harvest_data, requested_fields, **kwargs):
     # Apply filters
     filtered_data = {}
     try:
-        requested_fields = [
-            re.sub("([a-z])([A-Z])", r"\1_\2", field).lower() for field in requested_fields
-        ]
+        requested_fields = {snake_case(field) for field in requested_fields}
 
         # iterate over query params
         for field, value in kwargs.items():
             filtered_data[field] = filter_json_field(cached_harvest_data[field], value)
 
         # iterate over query requested fields
-        for field in set(requested_fields) - (set(kwargs.keys())):
-            field = re.sub("([a-z])([A-Z])", r"\1_\2", field).lower()
+        for field in requested_fields - set(kwargs.keys()):
             try:
                 filtered_data[field] = cached_harvest_data[field]
             except KeyError:
@@ -321,6 +527,84 @@ def filter_harvest_data(cached_harvest_data, requested_fields, **kwargs):
         raise GraphQLError(str(error))
 
 
+def iter_harvest_data_sections(sections, chunk_size=500):
+    """
+    Yield (brand tag, {section: value}) of every commentary, extracting only `sections`
+    of effective_features in the database instead of loading whole documents. A section
+    missing from effective_features comes back as None.
+    """
+    rows = CommentaryModel.objects.values_list(
+        "brand__tag", *[KeyTransform(section, "effective_features") for section in sections]
+    )
+    for tag, *values in rows.iterator(chunk_size=chunk_size):
+        yield tag, dict(zip(sections, values))
+
+
+class CachedBrandConnectionField(DjangoFilterConnectionField):
+    """
+    Filter connection whose evaluated result set is kept in `brand.utils.query_cache`.
+    Pagination is still applied per request on top of the cached rows.
+    """
+
+    # scalar columns rendered by the Brand node, in model field order as from_db expects
+    cached_fields = [
+        f.attname
+        for f in BrandModel._meta.concrete_fields
+        if f.attname in {"id", "name", "aliases", "website", "countries", "tag"}
+    ]
+
+    @classmethod
+    def resolve_queryset(cls, connection, iterable, info, args, filtering_args, filterset_class):
+        cache_args = {k: v for k, v in args.items() if k in filtering_args or k == "harvest_data"}
+        key = query_cache.make_key(cache_args)
+
+        cached = query_cache.lookup(key)
+        if cached is None:
+            versions = query_cache.tag_versions(query_cache.tags_for(cache_args), create=True)
+            queryset = super().resolve_queryset(
+                connection, iterable, info, args, filtering_args, filterset_class
+            )
+            fields = cls.cached_fields
+            rows = [list(row) for row in queryset.values_list(*fields)]
+            query_cache.store(key, versions, fields, rows)
+        else:
+            fields, rows = cached
+
+        db = BrandModel.objects.db
+        return [BrandModel.from_db(db, fields, row) for row in rows]
+
+    @classmethod
+    def connection_resolver(
+        cls,
+        resolver,
+        connection,
+        default_manager,
+        queryset_resolver,
+        max_limit,
+        enforce_first_or_last,
+        root,
+        info,
+        **args,
+    ):
+        connection = super().connection_resolver(
+            resolver,
+            connection,
+            default_manager,
+            queryset_resolver,
+            max_limit,
+            enforce_first_or_last,
+            root,
+            info,
+            **args,
+        )
+        # batch the nested relations of this page only, not the whole cached result set,
+        # loading only what the client selected under edges { node { ... } }
+        selection = selection_tree(info.field_nodes, info.fragments)
+        node_selection = selection.get("edges", {}).get("node", {})
+        BrandLoaders.attach([edge.node for edge in connection.edges], node_selection)
+        return connection
+
+
 class HarvestDataFilterInput(graphene.InputObjectType):
     customers_served = graphene.List(graphene.String)
     deposit_products = graphene.List(graphene.String)
@@ -328,6 +612,11 @@ class HarvestDataFilterInput(graphene.InputObjectType):
     services = graphene.List(graphene.String)
 
 
+class IdentifierMatch(graphene.ObjectType):
+    value = graphene.String(description="Identifier as it was asked for")
+    brands = graphene.List(Brand, description="More than one brand means the value is ambiguous")
+
+
 class Query(graphene.ObjectType):
     node = relay.Node.Field()
     commentary = relay.Node.Field(Commentary)
@@ -336,6 +625,21 @@ class Query(graphene.ObjectType):
 
     brand_by_name = graphene.Field(Brand, name=graphene.Argument(graphene.String, required=True))
 
+    # `resolve_brand` would clash with the resolver of `brand`
+    brand_from_spelling = graphene.Field(
+        Brand,
+        name="resolveBrand",
+        text=graphene.Argument(graphene.String, required=True),
+        description="Brand that a name, alias, abbreviation, website or identifier refers to",
+    )
+
+    brands_by_identifier = graphene.List(
+        IdentifierMatch,
+        scheme=graphene.Argument(graphene.String, required=True),
+        values=graphene.Argument(graphene.List(graphene.String), required=True),
+        description="Brands matching each identifier value, i.e. scheme: lei or rssd",
+    )
+
     embrace_campaigns = graphene.List(EmbraceCampaignType)
 
     brands_filtered_by_embrace_campaign = graphene.List(
@@ -373,6 +677,23 @@ class Query(graphene.ObjectType):
     def resolve_brand_by_name(root, info, name):
         return BrandModel.objects.get(name=name)
 
+    def resolve_brand_from_spelling(root, info, text):
+        brand_id = BrandSpellingModel.resolve(text)
+        return BrandModel.objects.filter(pk=brand_id).first() if brand_id else None
+
+    def resolve_brands_by_identifier(root, info, scheme, values):
+        if scheme not in BrandIdentifierModel.Scheme.values:
+            raise GraphQLError(
+                f"Unknown identifier scheme: {scheme}. "
+                f"Use one of {', '.join(BrandIdentifierModel.Scheme.values)}"
+            )
+        matches = BrandIdentifierModel.lookup(scheme, values)
+        brands = BrandModel.objects.in_bulk({pk for pks in matches.values() for pk in pks})
+        return [
+            IdentifierMatch(value=value, brands=[brands[pk] for pk in matches.get(value, [])])
+            for value in values
+        ]
+
     def resolve_embrace_campaigns(root, info):
         return EmbraceCampaignModel.objects.all()
 
@@ -395,7 +716,7 @@ class Query(graphene.ObjectType):
         try:
             # fetch feature yaml data from commentary model filtered by tag
             brand_qs = BrandModel.objects.get(tag=tag)
-            cached_data = brand_qs.commentary.feature_json
+            cached_data = brand_qs.commentary.effective_features
             requested_fields = [
                 field.name.value for field in info.field_nodes[0].selection_set.selections
             ]
@@ -417,82 +738,66 @@ class Query(graphene.ObjectType):
             return
 
     def resolve_all_harvest_data(self, info, **kwargs):
-        commentary_queries = CommentaryModel.objects.all()
-        tag_feature_json_dict = {
-            query.brand.tag: query.feature_json for query in commentary_queries
-        }
-
-        filtered_data = []
-
-        try:
-            features_field = next(
-                (
-                    field
-                    for field in info.field_nodes[0].selection_set.selections
-                    if field.name.value == "features"
-                ),
-                None,
-            )
-            if features_field and features_field.selection_set:
-                requested_fields = features_field.selection_set.selections
-                requested_fields = [field.name.value for field in requested_fields]
-
-            for tag, feature_json in tag_feature_json_dict.items():
-                filtered_data.append(
-                    {
-                        "tag": tag,
-                        "features": (
-                            filter_harvest_data(feature_json, requested_fields, **kwargs)
-                            if feature_json
-                            else {}
-                        ),
-                    }
+        features_field = next(
+            (
+                field
+                for field in info.field_nodes[0].selection_set.selections
+                if getattr(field, "name", None) and field.name.value == "features"
+            ),
+            None,
+        )
+        requested_fields = []
+        if features_field and features_field.selection_set:
+            requested_fields = [
+                field.name.value for field in features_field.selection_set.selections
+            ]
+        # only sections HarvestData can render are extracted
+        sections = sorted(
+            ({snake_case(field) for field in requested_fields} | set(kwargs))
+            & set(HarvestData._meta.fields)
+        )
+
+        # graphql-core completes the whole list before responding, the saving is in only
+        # extracting the requested sections in SQL rather than loading whole documents
+        results = []
+        for tag, features in iter_harvest_data_sections(sections):
+            # as before, brands without any of the sections get no features
+            has_data = any(value is not None for value in features.values())
+            results.append(
+                HarvestDataDictionary(
+                    tag=tag,
+                    features=(
+                        filter_harvest_data(features, requested_fields, **kwargs)
+                        if has_data
+                        else {}
+                    ),
                 )
+            )
+        return results
 
-            return [HarvestDataDictionary(**data) for data in filtered_data]
-        except Exception as e:
-            logger.error(f"Unexpected error resolving harvest data for {tag}: {str(e)}")
-            raise GraphQLError(str(e))
-
-    brands = DjangoFilterConnectionField(Brand, harvest_data=HarvestDataFilterInput())
+    brands = CachedBrandConnectionField(Brand, harvest_data=HarvestDataFilterInput())
 
     def resolve_brands(self, info, harvest_data=None, **kwargs):
-        cache_timeout_in_minutes = 20
-
-        sorted_args = json.dumps(kwargs | (harvest_data or {}), sort_keys=True)
-        cache_key = f"brand_query_cache{hashlib.md5(sorted_args.encode('utf-8')).hexdigest()}"
-
-        cached_result = cache.get(cache_key)
-        if cached_result:
-            return cached_result
-
+        # BrandFilter arguments are applied by the connection field itself
         queryset = BrandModel.objects.all()
-        filterset = BrandFilter(data=kwargs, queryset=queryset)
-
-        if filterset.is_valid():
-            result = filterset.qs
-            if harvest_data:
-                result = result.filter(harvest_data_filter_q(harvest_data))
-        else:
-            result = queryset
-
-        cache.set(cache_key, result, timeout=60 * cache_timeout_in_minutes)
-        return result
+        if harvest_data:
+            queryset = queryset.filter(harvest_data_filter_q(harvest_data))
+        return queryset
 
     features = DjangoListField(Feature)
 
 
 def harvest_data_filter_q(requested_fields):
-    base_path = "commentary__feature_json__"
-
+    """
+    Brands offering every requested feature. Each feature is a semi-join on the
+    HarvestFeature index, which beat grouping all features in one subquery.
+    """
     query = Q()
     if not requested_fields:
         return query
-    for key in requested_fields:
-        path = base_path + key
-        for feature in requested_fields[key]:
-            is_feature_offered = {f"{path}__{feature.strip()}__offered": True}
-            query &= Q(**is_feature_offered)
+    for section, features in requested_fields.items():
+        for feature in {feature.strip() for feature in features or ()}:
+            query &= Q(commentary__in=HarvestFeatureModel.offering(section, feature))
     return query
 
 
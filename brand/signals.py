@@ -0,0 +1,145 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from brand.admin_utils import STATE_CHOICES_CACHE_KEY
+from brand.models import (
+    Brand,
+    BrandCountry,
+    BrandFeature,
+    BrandIdentifier,
+    BrandSimilarityKey,
+    BrandSpelling,
+    BrandSuggestion,
+    Commentary,
+    HarvestFeature,
+    State,
+)
+from brand.models.brand_state import StateLicensed, StatePhysicalBranch
+from brand.utils import query_cache
+from brand.utils.countries import country_codes
+
+
+SIMILARITY_FIELDS = ("name", "tag", "aliases", "website")
+TRACKED_FIELDS = tuple(
+    dict.fromkeys(
+        (
+            "countries",
+            *SIMILARITY_FIELDS,
+            *BrandSpelling.SOURCE_FIELDS,
+            *BrandIdentifier.Scheme.values,
+        )
+    )
+)
+
+
+@receiver(pre_delete, sender=Commentary)
+def remember_inheritors(sender, instance, **kwargs):
+    # deleting the brand too sets the inheritors' parent to null before post_delete
+    instance._had_inheritors = instance.has_inheritors()
+
+
+@receiver(post_delete, sender=Commentary)
+def refresh_inherited_ratings_on_delete(sender, instance, **kwargs):
+    # inheritors of a deleted commentary's brand fall back to unknown
+    if getattr(instance, "_had_inheritors", True):
+        Commentary.recompute_inherited_ratings()
+
+
+@receiver(pre_save, sender=BrandSuggestion)
+def flag_suggestions(sender, instance, **kwargs):
+    instance.is_suggestion = True
+
+
+@receiver(post_delete, sender=BrandSuggestion)
+def unflag_kept_parents(sender, instance, **kwargs):
+    # deleting with keep_parents turns the suggestion into a plain brand
+    Brand.objects.filter(pk=instance.pk).update(is_suggestion=False)
+
+
+@receiver(pre_save, sender=Brand)
+@receiver(pre_save, sender=BrandSuggestion)
+def remember_previous_brand_values(sender, instance, raw=False, **kwargs):
+    # a brand moving out of a country must also invalidate that country's entries,
+    # and the lookup indexes only need a refresh when their source fields changed
+    instance._previous_values = (
+        Brand.objects.filter(pk=instance.pk).values(*TRACKED_FIELDS).first()
+        if instance.pk and not raw
+        else None
+    )
+
+
+def previous_value(instance, name):
+    return (getattr(instance, "_previous_values", None) or {}).get(name)
+
+
+def changed(instance, fields):
+    previous = getattr(instance, "_previous_values", None)
+    return previous is None or any(previous[name] != getattr(instance, name) for name in fields)
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=BrandSuggestion)
+@receiver(post_delete, sender=Brand)
+@receiver(post_delete, sender=BrandSuggestion)
+def invalidate_brand_queries_on_brand_change(sender, instance, **kwargs):
+    countries = country_codes(instance.countries)
+    countries += country_codes(previous_value(instance, "countries"))
+    query_cache.invalidate_countries(countries)
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=BrandSuggestion)
+def sync_brand_countries(sender, instance, created=False, **kwargs):
+    previous = previous_value(instance, "countries")
+    if created or sorted(country_codes(previous)) != sorted(country_codes(instance.countries)):
+        BrandCountry.sync([instance])
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=BrandSuggestion)
+def index_brand_similarity(sender, instance, raw=False, **kwargs):
+    if not raw and changed(instance, SIMILARITY_FIELDS):
+        BrandSimilarityKey.index([instance])
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=BrandSuggestion)
+def sync_brand_spellings(sender, instance, raw=False, **kwargs):
+    if not raw and changed(instance, BrandSpelling.SOURCE_FIELDS):
+        BrandSpelling.sync([instance])
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=BrandSuggestion)
+def sync_brand_identifiers(sender, instance, raw=False, **kwargs):
+    if not raw and changed(instance, BrandIdentifier.Scheme.values):
+        BrandIdentifier.sync([instance])
+
+
+@receiver(post_save, sender=Commentary)
+def sync_harvest_features(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is None or {"feature_json", "feature_override"} & set(update_fields):
+        HarvestFeature.sync([instance])
+
+
+@receiver(post_save, sender=Commentary)
+@receiver(post_delete, sender=Commentary)
+@receiver(post_save, sender=BrandFeature)
+@receiver(post_delete, sender=BrandFeature)
+@receiver(post_save, sender=StateLicensed)
+@receiver(post_delete, sender=StateLicensed)
+@receiver(post_save, sender=StatePhysicalBranch)
+@receiver(post_delete, sender=StatePhysicalBranch)
+def invalidate_brand_queries_on_related_change(sender, instance, **kwargs):
+    query_cache.invalidate_brands([instance.brand_id])
+
+
+@receiver(post_save, sender=State)
+@receiver(post_delete, sender=State)
+def invalidate_state_choices(sender, raw=False, **kwargs):
+    # fixtures may be loaded before the cache table exists
+    if not raw:
+        cache.delete(STATE_CHOICES_CACHE_KEY)
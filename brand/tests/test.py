@@ -1,24 +1,70 @@
 import copy
+import csv
+import io
+import itertools
 import json
+import os
+import re
+import tempfile
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from typing import Any
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
+from django.contrib import admin
 from django.contrib.auth.models import User
 from django.core.management import call_command
+from django.db import IntegrityError, connection
 from django.forms import ValidationError
-from django.test import TestCase
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
 import graphene.test
 import pandas as pd
+from graphql import parse, validate
 from rest_framework.test import APIClient
 
+from api.streaming import iter_json_array
+from api.views import BrandsBatchView
+from brand.admin import BrandAdmin
+from brand.models.brand_country import BrandCountry
+from brand.models.brand_duplicate import BrandDuplicate
+from brand.models.brand_identifier import BrandIdentifier
+from brand.models.brand_spelling import BrandSpelling
 from brand.models.brand_state import StateLicensed, StatePhysicalBranch
-from brand.models.commentary import Commentary, RatingChoice
+from brand.models.brand_suggestion import BrandSuggestion
+from brand.models.commentary import (
+    Commentary,
+    InstitutionType,
+    RatingChoice,
+    hash_features,
+    merge_features,
+)
 from brand.models.contact import Contact
+from brand.models.features import BrandFeature, FeatureType
+from brand.models.harvest_feature import HarvestFeature
+from brand.models.job import Job
+from brand.models.persisted_query import PersistedQuery
+from brand.models.resolver_trace import ResolverTrace
 from brand.models.state import State
-from brand.schema import schema
+from brand.schema import harvest_data_filter_q, schema
 from brand.tests.test_data.feature_json import dummy_all_features, dummy_no_features
 from brand.tests.utils import create_test_brands
+from brand.utils import brand_upsert, csv_export, http_client, query_cache, query_documents
+from brand.utils.brand_locations import BrandLocationSync
+from brand.utils.harvest_data import (
+    HarvestRetryableError,
+    fetch_harvest_data_once,
+    save_commentary_feature_data,
+)
+from brand.utils.harvest_refresh import HarvestRefreshPipeline
+from brand.utils.jobs import JobWorker
+from brand.utils.query_cost import cost_limit_rule
+from brand.utils.rating_inheritance import resolve_inherited_ratings
 
 from ..models import Brand
 
@@ -139,6 +185,99 @@ class CommentaryTestCase(TestCase):
             self.commentary5.compute_inherited_rating(throw_error=False), RatingChoice.UNKNOWN
         )
 
+    def test_rating_inherited_column_follows_parent_change(self):
+        self.commentary3.refresh_from_db()
+        self.assertEqual(self.commentary3.rating_inherited, RatingChoice.UNKNOWN)
+
+        self.commentary1.rating = RatingChoice.GREAT
+        self.commentary1.save()
+
+        self.commentary2.refresh_from_db()
+        self.commentary3.refresh_from_db()
+        self.assertEqual(self.commentary2.rating_inherited, RatingChoice.GREAT)
+        self.assertEqual(self.commentary3.rating_inherited, RatingChoice.GREAT)
+
+    def test_rating_inherited_column_resets_when_parent_deleted(self):
+        self.commentary1.rating = RatingChoice.GOOD
+        self.commentary1.save()
+        self.commentary1.delete()
+
+        self.commentary2.refresh_from_db()
+        self.assertEqual(self.commentary2.rating_inherited, RatingChoice.UNKNOWN)
+
+    def test_rating_inherited_column_resets_when_parent_brand_deleted(self):
+        self.commentary1.rating = RatingChoice.GOOD
+        self.commentary1.save()
+        self.commentary1.brand.delete()
+
+        self.commentary2.refresh_from_db()
+        self.assertEqual(self.commentary2.rating_inherited, RatingChoice.UNKNOWN)
+
+    def test_new_commentary_without_inheritors_resolves_only_its_chain(self):
+        self.commentary1.rating = RatingChoice.GOOD
+        self.commentary1.save()
+        brand = Brand.objects.create(tag="leaf", name="Leaf")
+        with mock.patch.object(Commentary, "recompute_inherited_ratings") as recompute:
+            commentary = Commentary.objects.create(
+                brand=brand,
+                rating=RatingChoice.INHERIT,
+                inherit_brand_rating=self.commentary3.brand,
+            )
+            self.commentary3.comment = "unrelated"
+            self.commentary3.save()
+            Commentary.objects.get(pk=commentary.pk).delete()
+        recompute.assert_not_called()
+        self.assertEqual(commentary.rating_inherited, RatingChoice.GOOD)
+
+    def test_new_commentary_with_inheritors_updates_them(self):
+        brand = Brand.objects.create(tag="late_parent", name="Late parent")
+        Commentary.objects.filter(pk=self.commentary1.pk).update(inherit_brand_rating=brand)
+        Commentary.objects.create(brand=brand, rating=RatingChoice.OK)
+
+        self.commentary3.refresh_from_db()
+        self.assertEqual(self.commentary3.rating_inherited, RatingChoice.OK)
+
+    def test_resolve_inherited_ratings_detects_cycles(self):
+        rows = [(1, RatingChoice.OK, None), (2, RatingChoice.INHERIT, 1)]
+        rows += [(3, RatingChoice.INHERIT, 4), (4, RatingChoice.INHERIT, 3)]
+        rows += [(5, RatingChoice.INHERIT, 3), (6, RatingChoice.INHERIT, 999)]
+
+        resolved, cyclic = resolve_inherited_ratings(rows)
+
+        self.assertEqual(resolved[2], RatingChoice.OK)
+        self.assertEqual(resolved[3], RatingChoice.UNKNOWN)
+        self.assertEqual(resolved[5], RatingChoice.UNKNOWN)
+        self.assertEqual(resolved[6], RatingChoice.UNKNOWN)
+        self.assertEqual(cyclic, {3, 4, 5})
+
+    def test_brands_filter_by_inherited_rating(self):
+        self.commentary1.rating = RatingChoice.GREAT
+        self.commentary1.save()
+
+        query = """
+        query {
+            brands(rating: ["great"]) {
+                edges {
+                    node {
+                        tag
+                        commentary {
+                            ratingInherited
+                        }
+                    }
+                }
+            }
+        }
+        """
+        res: Any = graphene.test.Client(schema).execute(query)
+        edges = res["data"]["brands"]["edges"]
+
+        self.assertEqual(
+            sorted(e["node"]["tag"] for e in edges),
+            ["another_brand_2", "another_brand_3", "test_brand_1"],
+        )
+        for e in edges:
+            self.assertEqual(e["node"]["commentary"]["ratingInherited"], RatingChoice.GREAT)
+
     def test_feature_override_failure(self):
         """
         Test validation error raised when user tries to update feature_override field with invalid harvest feture yaml.
@@ -339,6 +478,153 @@ class BankTestCase(TestCase):
             self.assertEqual("Existing Description", brand_instance[0].description)
 
 
+class BankBatchTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.token = "XYZSSAAA"
+        self.url = reverse("rest_api:bank_batch")
+        self.existing_brand = Brand.objects.create(
+            name="Existing bank", tag="existing_tag", description="Existing Description"
+        )
+        Commentary.objects.create(
+            brand=self.existing_brand, rating="worst", description1="Existing Summary"
+        )
+        self.payloads = [
+            {"name": "New bank", "tag": "new_tag", "commentary": {"rating": "good"}},
+            {
+                "name": "Existing bank new name",
+                "tag": "existing_tag",
+                "commentary": {"rating": "good"},
+            },
+            {"name": "No tag"},
+            {"tag": "bad_rating", "name": "Bad", "commentary": {"rating": "excellent"}},
+        ]
+
+    def post(self, body, content_type="application/json", query=""):
+        with self.settings(REST_API_CONTACT_SINGLE_TOKEN=self.token):
+            return self.client.post(
+                self.url + query,
+                data=body,
+                content_type=content_type,
+                HTTP_AUTHORIZATION=f"Token {self.token}",
+            )
+
+    def test_json_array_upserts_valid_items(self):
+        response = self.post(json.dumps(self.payloads))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data["created"], data["updated"], data["invalid"]), (1, 1, 2))
+        self.assertEqual(
+            [r["status"] for r in data["results"]], ["created", "updated", "invalid", "invalid"]
+        )
+        self.assertIn("tag", data["results"][2]["errors"])
+        self.assertIn("commentary.rating", data["results"][3]["errors"])
+
+        self.assertEqual(Brand.objects.get(tag="new_tag").commentary.rating, "good")
+        existing = Brand.objects.get(tag="existing_tag")
+        self.assertEqual(existing.name, "Existing bank new name")
+        self.assertEqual(existing.description, "Existing Description")
+        self.assertEqual(existing.commentary.rating, "good")
+        self.assertEqual(existing.commentary.description1, "Existing Summary")
+        self.assertFalse(Brand.objects.filter(tag="bad_rating").exists())
+
+    def test_ndjson_atomic_writes_nothing_when_an_item_is_invalid(self):
+        body = "\n".join(json.dumps(payload) for payload in self.payloads)
+        response = self.post(body, content_type="application/x-ndjson", query="?atomic=true")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["skipped"], 2)
+        self.assertFalse(Brand.objects.filter(tag="new_tag").exists())
+
+        body = "\n".join(json.dumps(payload) for payload in self.payloads[:2])
+        response = self.post(body, content_type="application/x-ndjson", query="?atomic=true")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["created"], 1)
+
+    def test_writes_cleaned_values_and_resolves_inherited_ratings(self):
+        payloads = [
+            {"tag": "cleaned", "name": "Cleaned", "name_locked": "1"},
+            {"tag": "orphan", "name": "Orphan", "commentary": {"rating": "inherit"}},
+            {"tag": "unnamed", "name": ""},
+        ]
+        data = self.post(json.dumps(payloads)).json()
+        self.assertEqual([r["status"] for r in data["results"]], ["created", "created", "invalid"])
+        self.assertIn("name", data["results"][2]["errors"])
+        self.assertIs(Brand.objects.get(tag="cleaned").name_locked, True)
+        # an inherited rating without a parent resolves to unknown, not "inherit"
+        self.assertEqual(
+            Commentary.objects.get(brand__tag="orphan").rating_inherited, RatingChoice.UNKNOWN
+        )
+
+    def test_queries_do_not_grow_with_the_chunk(self):
+        def batch(start, count):
+            return json.dumps(
+                [
+                    {"tag": f"bulk_{i}", "name": f"Bulk {i}", "commentary": {"rating": "good"}}
+                    for i in range(start, start + count)
+                ]
+            )
+
+        with CaptureQueriesContext(connection) as small:
+            self.post(batch(0, 2))
+        with CaptureQueriesContext(connection) as large:
+            data = self.post(batch(2, 20)).json()
+        self.assertEqual(data["created"], 20)
+
+        def queries_before_writing(ctx):
+            return next(
+                i for i, q in enumerate(ctx.captured_queries) if q["sql"].startswith("INSERT")
+            )
+
+        self.assertEqual(queries_before_writing(large), queries_before_writing(small))
+
+    def test_names_are_checked_against_other_brands(self):
+        payloads = [
+            {"tag": "same_name", "name": "Existing bank"},
+            {"tag": "existing_tag", "name": "Existing bank", "description": "Edited"},
+            {"tag": "first", "name": "Twin"},
+            {"tag": "second", "name": "Twin"},
+        ]
+        data = self.post(json.dumps(payloads)).json()
+        self.assertEqual(
+            [r["status"] for r in data["results"]], ["invalid", "updated", "created", "invalid"]
+        )
+        self.assertIn("existing_tag", data["results"][0]["errors"]["name"][0])
+        self.assertIn("first", data["results"][3]["errors"]["name"][0])
+
+    def test_integrity_error_fails_its_chunk(self):
+        upsert = brand_upsert.upsert
+
+        def failing_second_chunk(payloads):
+            if payloads[0]["tag"] == "existing_tag":
+                raise IntegrityError("UNIQUE constraint failed")
+            return upsert(payloads)
+
+        with (
+            mock.patch.object(BrandsBatchView, "CHUNK_SIZE", 1),
+            mock.patch("brand.utils.brand_upsert.upsert", side_effect=failing_second_chunk),
+        ):
+            data = self.post(json.dumps(self.payloads[:2])).json()
+            self.assertEqual([r["status"] for r in data["results"]], ["created", "invalid"])
+            self.assertIn("non_field_errors", data["results"][1]["errors"])
+            Brand.objects.filter(tag="new_tag").delete()
+
+            # an atomic batch rolls back the chunks written before the failing one
+            response = self.post(json.dumps(self.payloads[:2]), query="?atomic=true")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([r["status"] for r in response.json()["results"]], ["skipped", "invalid"])
+        self.assertFalse(Brand.objects.filter(tag="new_tag").exists())
+
+    def test_malformed_body(self):
+        response = self.post('[{"tag": "a"')
+        self.assertEqual(response.status_code, 400)
+
+    def test_iter_json_array_across_reads(self):
+        items = [{"tag": "a", "name": "\u00e9" * 20}, 12345, [1, 2], "x"]
+        stream = io.BytesIO(json.dumps(items).encode())
+        self.assertEqual(list(iter_json_array(stream, read_size=3)), items)
+        self.assertEqual(list(iter_json_array(io.BytesIO(b" [ ] "))), [])
+
+
 class CommentaryFeatureOverrideTestCase(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -488,6 +774,42 @@ class BrandStatesTestCase(TestCase):
         with self.assertRaises(ValidationError):
             StateLicensed.objects.create(brand=usa_brand, state=self.usa_state1)
 
+    def test_location_sync_diffs_states_in_bulk(self):
+        brand = Brand.objects.create(name="b", tag="b", description="d", countries=["US", "CA"])
+        StateLicensed.objects.create(brand=brand, state=self.usa_state1)
+        StateLicensed.objects.create(brand=brand, state=self.canada_state)
+
+        sync = BrandLocationSync()
+        sync.add(
+            brand,
+            "US",
+            {
+                "licensed_to_operate_in": ["alabama-us", "british-columbia-ca", "unknown-us"],
+                "physical_branches": ["alabama-us"],
+            },
+        )
+        with CaptureQueriesContext(connection) as ctx:
+            results = sync.apply()
+
+        # new-hampshire is stale, the CA state is kept as CA was not refreshed
+        self.assertEqual(results["StateLicensed"], (1, 1))
+        self.assertEqual(results["StatePhysicalBranch"], (1, 0))
+        self.assertEqual(
+            sorted(brand.state_licensed.values_list("tag", flat=True)),
+            ["alabama-us", "british-columbia-ca"],
+        )
+        self.assertEqual(
+            list(brand.state_physical_branch.values_list("tag", flat=True)), ["alabama-us"]
+        )
+        self.assertLess(len(ctx.captured_queries), 15)
+
+    def test_location_sync_ignores_countries_outside_brand(self):
+        brand = Brand.objects.create(name="b", tag="b", description="d", countries=["US"])
+        sync = BrandLocationSync()
+        sync.add(brand, "CA", {"licensed_to_operate_in": ["british-columbia-ca"]})
+        sync.apply()
+        self.assertFalse(brand.state_licensed.exists())
+
 
 class TestUpdateContacts(TestCase):
     def setUp(self):
@@ -649,3 +971,1246 @@ class BrandsFilterHarvestDataTest(TestCase):
         res = res["data"]["brands"]["edges"]
 
         self.assertEqual(len(res), 9)
+
+    def test_all_harvest_data_extracts_requested_sections(self):
+        query = """
+        {
+            allHarvestData(customersServed: "sme") {
+                tag
+                features { customersServed depositProducts }
+            }
+        }
+        """
+        with CaptureQueriesContext(connection) as ctx:
+            res: Any = self.gql_client.execute(query)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        # only the requested sections are extracted
+        sql = ctx.captured_queries[0]["sql"]
+        self.assertIn('$."customers_served"', sql)
+        self.assertNotIn('$."services"', sql)
+
+        by_tag = {row["tag"]: row["features"] for row in res["data"]["allHarvestData"]}
+        self.assertEqual(len(by_tag), 8)
+        self.assertEqual(
+            by_tag["brand_with_all_features0"]["customersServed"],
+            {"sme": dummy_all_features["customers_served"]["sme"]},
+        )
+        self.assertEqual(
+            by_tag["brand_with_all_features0"]["depositProducts"],
+            dummy_all_features["deposit_products"],
+        )
+        self.assertIsNone(by_tag["brand_with_empty_features_json0"]["customersServed"])
+
+
+class BrandQueryCacheTest(TestCase):
+    """
+    Tests for the evaluated `brands` result cache in brand/utils/query_cache.py
+    """
+
+    query = """
+    query Brands($country: String) {
+        brands(country: $country) {
+            edges {
+                node {
+                    tag
+                    name
+                }
+            }
+        }
+    }
+    """
+
+    def setUp(self) -> None:
+        query_cache.clear()
+        self.us_brand = Brand.objects.create(tag="us_brand", name="US Brand", countries=["US"])
+        self.gb_brand = Brand.objects.create(tag="gb_brand", name="GB Brand", countries=["GB"])
+        self.gql_client = graphene.test.Client(schema)
+
+    def names(self, country):
+        res: Any = self.gql_client.execute(self.query, variables={"country": country})
+        return [e["node"]["name"] for e in res["data"]["brands"]["edges"]]
+
+    def test_repeated_query_is_served_without_sql(self):
+        self.assertEqual(self.names("US"), ["US Brand"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names("US"), ["US Brand"])
+
+        stats = query_cache.stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"], 1)
+
+    def test_brand_change_evicts_only_dependent_entries(self):
+        self.names("US")
+        self.names("GB")
+
+        self.gb_brand.name = "GB Brand Renamed"
+        self.gb_brand.save()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names("US"), ["US Brand"])
+        self.assertEqual(self.names("GB"), ["GB Brand Renamed"])
+
+    def test_moving_brand_between_countries_evicts_both(self):
+        self.names("US")
+        self.names("GB")
+
+        self.gb_brand.countries = ["US"]
+        self.gb_brand.save()
+
+        self.assertEqual(self.names("GB"), [])
+        self.assertEqual(sorted(self.names("US")), ["GB Brand", "US Brand"])
+
+    def test_commentary_change_evicts_brand_entries(self):
+        Commentary.objects.create(brand=self.us_brand, rating=RatingChoice.GOOD)
+        query = '{ brands(rating: ["good"]) { edges { node { tag } } } }'
+        res: Any = self.gql_client.execute(query)
+        self.assertEqual(len(res["data"]["brands"]["edges"]), 1)
+
+        self.us_brand.commentary.rating = RatingChoice.BAD
+        self.us_brand.commentary.save()
+
+        res = self.gql_client.execute(query)
+        self.assertEqual(len(res["data"]["brands"]["edges"]), 0)
+
+
+class BrandNestedResolverQueryCountTest(TestCase):
+    """
+    The number of SQL statements for a `brands` query with nested relations must not grow
+    with the number of brands returned, see BrandLoaders in brand/schema.py
+    """
+
+    query = """
+    query {
+        brands {
+            edges {
+                node {
+                    tag
+                    commentary {
+                        rating
+                        ratingInherited
+                    }
+                    bankFeatures {
+                        name
+                        description
+                        offered
+                    }
+                    stateLicensed {
+                        tag
+                    }
+                    statePhysicalBranch {
+                        tag
+                    }
+                }
+            }
+        }
+    }
+    """
+
+    def setUp(self) -> None:
+        query_cache.clear()
+        self.state = State.objects.create(tag="alabama-us", name="Alabama", country_code="US")
+        self.features = [
+            FeatureType.objects.create(name=f"feature {n}", description=f"description {n}")
+            for n in range(2)
+        ]
+        self.gql_client = graphene.test.Client(schema)
+
+    def add_brands(self, start, count):
+        for n in range(start, start + count):
+            brand = Brand.objects.create(tag=f"brand_{n}", name=f"Brand {n}", countries=["US"])
+            Commentary.objects.create(brand=brand, rating=RatingChoice.GOOD)
+            for feature in self.features:
+                BrandFeature.objects.create(brand=brand, feature=feature)
+            StateLicensed.objects.create(brand=brand, state=self.state)
+            StatePhysicalBranch.objects.create(brand=brand, state=self.state)
+
+    def count_queries(self, expected_brands):
+        with CaptureQueriesContext(connection) as queries:
+            res: Any = self.gql_client.execute(self.query)
+        self.assertNotIn("errors", res)
+
+        edges = res["data"]["brands"]["edges"]
+        self.assertEqual(len(edges), expected_brands)
+        for edge in edges:
+            self.assertEqual(edge["node"]["commentary"]["rating"], RatingChoice.GOOD)
+            self.assertEqual(len(edge["node"]["bankFeatures"]), 2)
+            self.assertEqual(edge["node"]["stateLicensed"], [{"tag": "alabama-us"}])
+        return len(queries)
+
+    def test_query_count_is_constant_in_brand_count(self):
+        self.add_brands(0, 2)
+        small = self.count_queries(expected_brands=2)
+
+        self.add_brands(2, 10)
+        large = self.count_queries(expected_brands=12)
+
+        self.assertEqual(small, large)
+        # brands + one query per batched relation
+        self.assertLessEqual(large, 5)
+
+    def test_commentary_columns_follow_selection(self):
+        self.add_brands(0, 3)
+        Brand.objects.get(tag="brand_0").commentary.institution_type.add(
+            InstitutionType.objects.create(name="credit union")
+        )
+        query = """
+        fragment CommentaryFields on Commentary {
+            rating
+            institutionType {
+                name
+            }
+        }
+        query {
+            brands {
+                edges {
+                    node {
+                        tag
+                        commentary {
+                            ...CommentaryFields
+                        }
+                    }
+                }
+            }
+        }
+        """
+        with CaptureQueriesContext(connection) as queries:
+            res: Any = self.gql_client.execute(query)
+        self.assertNotIn("errors", res)
+
+        commentary_sql = [q["sql"] for q in queries if 'FROM "brand_commentary"' in q["sql"]]
+        self.assertEqual(len(commentary_sql), 1)
+        self.assertNotIn("feature_json", commentary_sql[0])
+        self.assertNotIn("description1", commentary_sql[0])
+
+        types = {
+            e["node"]["tag"]: [t["name"] for t in e["node"]["commentary"]["institutionType"]]
+            for e in res["data"]["brands"]["edges"]
+        }
+        self.assertEqual(types, {"brand_0": ["credit union"], "brand_1": [], "brand_2": []})
+        # brands, commentaries, prefetched institution types
+        self.assertEqual(len(queries), 3)
+
+
+class CommentaryMarkdownHtmlTest(TestCase):
+    def setUp(self) -> None:
+        self.brand = Brand.objects.create(tag="markdown_brand", name="Markdown Brand")
+        self.commentary = Commentary.objects.create(
+            brand=self.brand, description1="Read [more](https://example.com)", headline="**Hi**"
+        )
+
+    def test_html_rendered_on_save(self):
+        self.commentary.refresh_from_db()
+        self.assertEqual(self.commentary.headline_html, "<p><strong>Hi</strong></p>")
+        self.assertIn('target="_blank"', self.commentary.description1_html)
+
+    def test_only_changed_text_is_rendered_again(self):
+        commentary = Commentary.objects.get(pk=self.commentary.pk)
+        commentary.headline = "**Bye**"
+        self.assertEqual(commentary.render_markdown_fields(), ["headline_html"])
+
+    def test_graphql_serves_stored_html(self):
+        Commentary.objects.filter(pk=self.commentary.pk).update(headline_html="<p>stored</p>")
+        query = '{ brand(tag: "markdown_brand") { commentary { headline description2 } } }'
+        res: Any = graphene.test.Client(schema).execute(query)
+        commentary = res["data"]["brand"]["commentary"]
+        self.assertEqual(commentary["headline"], "<p>stored</p>")
+        self.assertEqual(commentary["description2"], "")
+
+    def test_backfill_command(self):
+        Commentary.objects.update(headline_html="", description1_html="")
+        call_command("render_commentary_markdown", stdout=io.StringIO())
+        self.commentary.refresh_from_db()
+        self.assertEqual(self.commentary.headline_html, "<p><strong>Hi</strong></p>")
+        self.assertIn("example.com", self.commentary.description1_html)
+
+
+class BrandCountryTest(TestCase):
+    def memberships(self, brand):
+        return sorted(brand.country_memberships.values_list("country", flat=True))
+
+    def test_memberships_follow_countries_field(self):
+        brand = Brand.objects.create(tag="multi", name="Multi", countries=["US", "GB"])
+        self.assertEqual(self.memberships(brand), ["GB", "US"])
+
+        brand.countries = ["GB", "FR"]
+        brand.save()
+        self.assertEqual(self.memberships(brand), ["FR", "GB"])
+
+    def test_sync_after_bulk_update(self):
+        brand = Brand.objects.create(tag="bulk", name="Bulk", countries=["US"])
+        brand.countries = ["CA"]
+        Brand.objects.bulk_update([brand], ["countries"])
+        BrandCountry.sync([brand])
+        self.assertEqual(self.memberships(brand), ["CA"])
+
+    def test_graphql_country_filter_uses_memberships(self):
+        query_cache.clear()
+        Brand.objects.create(tag="us_gb", name="US GB", countries=["US", "GB"])
+        Brand.objects.create(tag="gb", name="GB", countries=["GB"])
+        Brand.objects.create(tag="us", name="US", countries=["US"])
+
+        query = '{ brands(country: "GB") { edges { node { tag } } } }'
+        res: Any = graphene.test.Client(schema).execute(query)
+        tags = [e["node"]["tag"] for e in res["data"]["brands"]["edges"]]
+        self.assertEqual(tags, ["gb", "us_gb"])
+
+    def test_benchmark_command_runs(self):
+        out = io.StringIO()
+        call_command("benchmark_country_filter", brands=50, repeat=1, stdout=out)
+        self.assertIn("country_memberships__country", out.getvalue())
+        self.assertFalse(Brand.objects.filter(tag__startswith="benchmark_brand_").exists())
+
+
+class StubHarvestHandler(BaseHTTPRequestHandler):
+    # bankTag -> list of status codes to answer with before succeeding
+    plans = {}
+    requests = []
+    lock = threading.Lock()
+
+    def do_GET(self):
+        tag = parse_qs(urlparse(self.path).query)["bankTag"][0]
+        with self.lock:
+            self.requests.append(tag)
+            plan = self.plans.get(tag, [])
+            status = plan.pop(0) if plan else 200
+        body = json.dumps({"tag": tag}).encode() if status == 200 else b"error"
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class HarvestRefreshPipelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHarvestHandler)
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        StubHarvestHandler.plans = {}
+        StubHarvestHandler.requests = []
+        self.commentaries = [
+            Commentary.objects.create(
+                brand=Brand.objects.create(tag=f"sfi_{i}", name=f"SFI {i}", countries=["GB"]),
+                show_on_sustainable_banks_page=True,
+            )
+            for i in range(5)
+        ]
+
+    def run_pipeline(self, **kwargs):
+        commentaries = Commentary.objects.select_related("brand").order_by("pk")
+        with override_settings(HARVEST_BASE_URL=self.base_url):
+            return HarvestRefreshPipeline(backoff=0.01, **kwargs).run(commentaries)
+
+    def test_refreshes_all_commentaries_in_batches(self):
+        with CaptureQueriesContext(connection) as ctx:
+            report = self.run_pipeline(workers=3, per_host=2, batch_size=2)
+        self.assertEqual((report.total, report.succeeded, report.failed), (5, 5, 0))
+        updates = [q for q in ctx.captured_queries if q["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 3)
+        for commentary in Commentary.objects.select_related("brand"):
+            self.assertEqual(commentary.feature_json, {"tag": commentary.brand.tag})
+            self.assertIsNotNone(commentary.feature_refresh_date)
+
+    def test_merges_the_override_current_at_write_time(self):
+        def edit_override(report, job, result):
+            # an admin edit made while the harvest data is being fetched
+            Commentary.objects.filter(brand__tag="sfi_0").update(feature_override={"extra": 1})
+
+        self.run_pipeline(progress=edit_override)
+        commentary = Commentary.objects.get(brand__tag="sfi_0")
+        self.assertEqual(commentary.effective_features, {"tag": "sfi_0", "extra": 1})
+
+    def test_retries_gateway_timeouts_with_backoff(self):
+        StubHarvestHandler.plans = {"sfi_1": [504, 524], "sfi_2": [504, 504, 504]}
+        report = self.run_pipeline(max_retries=2)
+        self.assertEqual((report.succeeded, report.failed, report.retries), (4, 1, 4))
+        self.assertEqual(StubHarvestHandler.requests.count("sfi_1"), 3)
+        self.assertEqual(Commentary.objects.get(brand__tag="sfi_1").feature_json, {"tag": "sfi_1"})
+        self.assertIn("sfi_2", report.errors)
+
+    def test_non_retryable_errors_fail_immediately(self):
+        StubHarvestHandler.plans = {"sfi_3": [500]}
+        report = self.run_pipeline()
+        self.assertEqual((report.succeeded, report.failed, report.retries), (4, 1, 0))
+        self.assertIsNone(Commentary.objects.get(brand__tag="sfi_3").feature_refresh_date)
+
+    def test_unchanged_payloads_only_touch_the_refresh_date(self):
+        self.run_pipeline()
+        refreshed = Commentary.objects.get(brand__tag="sfi_0").feature_refresh_date
+        with CaptureQueriesContext(connection) as ctx:
+            report = self.run_pipeline()
+        self.assertEqual((report.succeeded, report.unchanged), (5, 5))
+        writes = [q["sql"] for q in ctx.captured_queries if not q["sql"].startswith("SELECT")]
+        self.assertEqual(len(writes), 1)
+        self.assertIn('SET "feature_refresh_date"', writes[0])
+        self.assertGreater(
+            Commentary.objects.get(brand__tag="sfi_0").feature_refresh_date, refreshed
+        )
+
+        commentary = Commentary.objects.get(brand__tag="sfi_1")
+        self.assertFalse(save_commentary_feature_data(commentary, {"tag": "sfi_1"}))
+        self.assertTrue(save_commentary_feature_data(commentary, {"tag": "renamed"}))
+        self.assertEqual(commentary.feature_hash, hash_features({"tag": "renamed"}))
+
+    def test_command_refreshes_stale_brands_most_due_first(self):
+        now = timezone.now()
+        Commentary.objects.filter(brand__tag="sfi_0").update(feature_refresh_date=now)
+        Commentary.objects.filter(brand__tag="sfi_1").update(
+            feature_refresh_date=now - timedelta(days=200)
+        )
+        Commentary.objects.filter(brand__tag="sfi_3").update(display_on_website=True)
+
+        out = io.StringIO()
+        with override_settings(HARVEST_BASE_URL=self.base_url, HARVEST_STALE_DAYS=90):
+            call_command("refresh_sfi_harvest_data", workers=1, limit=3, stdout=out)
+        self.assertEqual(StubHarvestHandler.requests, ["sfi_3", "sfi_2", "sfi_4"])
+        self.assertIn("Updating 3 of 4 due commentaries, 1 refreshed more recently", out.getvalue())
+        self.assertIn(
+            "Avoided: 1 fetches of fresh data, 0 writes of unchanged data", out.getvalue()
+        )
+
+    def test_command_reports_throughput(self):
+        out = io.StringIO()
+        with override_settings(HARVEST_BASE_URL=self.base_url):
+            call_command("refresh_sfi_harvest_data", workers=2, stdout=out)
+        self.assertIn("[5/5]", out.getvalue())
+        self.assertIn("Success: 5, Failed: 0", out.getvalue())
+        self.assertIn("brands/min", out.getvalue())
+
+
+class ExportCsvTest(TestCase):
+    def setUp(self):
+        self.state = State.objects.create(tag="alabama-us", name="Alabama", country_code="US")
+        self.feature = FeatureType.objects.create(name="checking")
+        InstitutionType.objects.create(name="Bank")
+        InstitutionType.objects.create(name="Credit Union")
+        for i in range(5):
+            brand = Brand.objects.create(tag=f"csv_{i}", name=f"CSV {i}", countries=["US"])
+            Commentary.objects.create(brand=brand, rating=RatingChoice.GOOD)
+            BrandFeature.objects.create(brand=brand, feature=self.feature)
+            StateLicensed.objects.create(brand=brand, state=self.state)
+        Brand.objects.create(tag="csv_bare", name="CSV bare", countries=["GB"])
+
+    def export(self):
+        response = self.client.get(reverse("export_csv"))
+        self.assertEqual(response["Content-Type"], "text/csv")
+        content = b"".join(response.streaming_content).decode()
+        return list(csv.DictReader(io.StringIO(content)))
+
+    def test_streams_one_row_per_brand(self):
+        rows = self.export()
+        self.assertEqual(len(rows), 6)
+        row = next(r for r in rows if r["tag"] == "csv_0")
+        self.assertEqual(row["countries"], "United States of America")
+        self.assertEqual(row["rating"], "good")
+        self.assertEqual(row["feature"], "checking")
+        self.assertNotIn("state_licensed", row)
+        self.assertNotIn("rating_inherited", row)
+        self.assertEqual(row["institution_type"], "Bank,Credit Union")
+        self.assertRegex(row["created"], r"^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{3}Z$")
+        bare = next(r for r in rows if r["tag"] == "csv_bare")
+        self.assertEqual((bare["rating"], bare["feature"]), ("", ""))
+
+    def test_queries_per_chunk_do_not_grow_with_brands(self):
+        with CaptureQueriesContext(connection) as ctx:
+            list(csv_export.iter_csv_lines())
+        queries = len(ctx.captured_queries)
+        Brand.objects.create(tag="csv_more", name="CSV more", countries=["US"])
+        with CaptureQueriesContext(connection) as ctx:
+            list(csv_export.iter_csv_lines())
+        self.assertEqual(len(ctx.captured_queries), queries)
+
+
+class BrandDuplicateIndexTest(TestCase):
+    def pairs(self):
+        return {
+            (d.brand.tag, d.duplicate_of.tag): d.kind
+            for d in BrandDuplicate.objects.select_related("brand", "duplicate_of")
+        }
+
+    def test_candidates_follow_brand_saves(self):
+        first = Brand.objects.create(tag="first_bank", name="First Bank")
+        Brand.objects.create(tag="other", name="Completely Different")
+        second = Brand.objects.create(tag="frst_bank", name="Frist Bank")
+        self.assertEqual(self.pairs(), {("frst_bank", "first_bank"): "name"})
+
+        second.name = "Something Else"
+        second.tag = "something_else"
+        second.save()
+        self.assertEqual(self.pairs(), {})
+
+        second.website = "https://www.firstbank.com/"
+        second.save()
+        first.website = "http://firstbank.com"
+        first.save()
+        self.assertEqual(self.pairs(), {("something_else", "first_bank"): "website"})
+
+        first.delete()
+        self.assertFalse(BrandDuplicate.objects.exists())
+
+    def test_aliases_match_names(self):
+        Brand.objects.create(tag="bofa", name="Bank of America")
+        Brand.objects.create(tag="boa_us", name="BOA US", aliases="Bank of Amerika, BOA")
+        duplicate = BrandDuplicate.objects.get()
+        self.assertEqual((duplicate.kind, duplicate.distance), ("name", 1))
+
+    def test_rebuild_command_and_paginated_view(self):
+        for i in range(3):
+            Brand.objects.create(tag=f"dup_{i}", name=f"Duplicate {i}")
+        BrandDuplicate.objects.all().delete()
+
+        call_command("rebuild_duplicate_index", chunk_size=2, stdout=io.StringIO())
+        self.assertEqual(BrandDuplicate.objects.count(), 3)
+
+        user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(user)
+        response = self.client.get(reverse("check_duplicates"), {"page": 1})
+        self.assertEqual(len(response.context["page"]), 3)
+        self.assertContains(response, "Duplicate 2")
+
+
+class BrandSpellingTest(TestCase):
+    def setUp(self):
+        self.brand1, self.brand2 = create_test_brands()
+
+    def test_index_matches_spelling_dictionary(self):
+        spelling_dict = Brand.create_spelling_dictionary()
+        resolved = BrandSpelling.resolve_many(spelling_dict.keys())
+        self.assertEqual(resolved, spelling_dict)
+
+    def test_index_follows_saves_and_deletes(self):
+        self.assertEqual(BrandSpelling.resolve("  Test Brand 1 "), self.brand1.pk)
+        self.brand1.lei = "NEW-LEI"
+        self.brand1.save()
+        self.assertEqual(BrandSpelling.resolve("new-lei"), self.brand1.pk)
+
+        self.brand1.delete()
+        self.assertIsNone(BrandSpelling.resolve("test brand 1"))
+
+    def test_name_claim_beats_abbreviation(self):
+        Brand.objects.create(tag="tb", name="TB")
+        self.assertEqual(BrandSpelling.resolve("tb"), Brand.objects.get(tag="tb").pk)
+
+    def test_graphql_resolve_brand(self):
+        query = '{ resolveBrand(text: "anotherbwebsite.com") { tag } }'
+        res: Any = graphene.test.Client(schema).execute(query)
+        self.assertEqual(res["data"]["resolveBrand"], {"tag": self.brand2.tag})
+
+        query = '{ resolveBrand(text: "nothing like it") { tag } }'
+        res = graphene.test.Client(schema).execute(query)
+        self.assertIsNone(res["data"]["resolveBrand"])
+
+    def test_benchmark_command_runs(self):
+        out = io.StringIO()
+        call_command("benchmark_spelling_lookup", brands=20, lookups=5, repeat=1, stdout=out)
+        self.assertIn("BrandSpelling.resolve_many", out.getvalue())
+        self.assertFalse(Brand.objects.filter(tag__startswith="benchmark_brand_").exists())
+
+
+class BrandIdentifierTest(TestCase):
+    def setUp(self):
+        self.first = Brand.objects.create(tag="first", name="First", rssd="0012345", lei="ab-12")
+        self.second = Brand.objects.create(tag="second", name="Second", rssd="12345")
+        self.third = Brand.objects.create(tag="third", name="Third", fdic_cert="777")
+
+    def test_lookup_normalizes_and_batches(self):
+        values = ["12345", "00777", "missing", *[str(n) for n in range(2000)]]
+        with CaptureQueriesContext(connection) as ctx:
+            rssd = BrandIdentifier.lookup("rssd", values)
+        self.assertLessEqual(len(ctx.captured_queries), 3)
+        self.assertEqual(rssd, {"12345": [self.first.pk, self.second.pk]})
+        self.assertEqual(BrandIdentifier.lookup("fdic_cert", ["00777"]), {"00777": [self.third.pk]})
+        self.assertEqual(BrandIdentifier.lookup("lei", ["AB12 "]), {"AB12 ": [self.first.pk]})
+
+    def test_rows_follow_saves(self):
+        self.second.rssd = ""
+        self.second.ncua = "42"
+        self.second.save()
+        self.assertEqual(BrandIdentifier.lookup("rssd", ["12345"]), {"12345": [self.first.pk]})
+        self.assertEqual(BrandIdentifier.lookup("ncua", ["42"]), {"42": [self.second.pk]})
+
+    def test_conflicts(self):
+        self.assertEqual(
+            list(BrandIdentifier.conflicts()), [{"scheme": "rssd", "value": "12345", "brands": 2}]
+        )
+        out = io.StringIO()
+        with mock.patch.object(BrandIdentifier, "SYNC_CHUNK_SIZE", 1):
+            call_command("check_identifier_conflicts", stdout=out)
+        self.assertIn("rssd 12345: first, second", out.getvalue())
+
+    def test_graphql_brands_by_identifier(self):
+        query = '{ brandsByIdentifier(scheme: "rssd", values: ["12345", "nope"]) { value brands { tag } } }'
+        res: Any = graphene.test.Client(schema).execute(query)
+        self.assertEqual(
+            res["data"]["brandsByIdentifier"],
+            [
+                {"value": "12345", "brands": [{"tag": "first"}, {"tag": "second"}]},
+                {"value": "nope", "brands": []},
+            ],
+        )
+
+        query = '{ brandsByIdentifier(scheme: "name", values: ["x"]) { value } }'
+        res = graphene.test.Client(schema).execute(query)
+        self.assertIn("Unknown identifier scheme", res["errors"][0]["message"])
+
+
+class ImportBrandsTest(TestCase):
+    def setUp(self):
+        self.credit_union = InstitutionType.objects.create(name="Credit Union")
+        Brand.objects.create(tag="existing_cu", name="Existing CU")
+        Brand.objects.create(tag="new_cu", name="Other name")
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "cus.csv")
+        with open(self.path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["Firm", "FRN", "Site"])
+            writer.writerow(["New CU", "111", "newcu.co.uk"])
+            writer.writerow(["Existing CU", "222", ""])
+            writer.writerow(["Broken CU", "333", "not a url"])
+            writer.writerow(["New CU!", "444", ""])
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def import_brands(self, *args, **kwargs):
+        out = io.StringIO()
+        call_command(
+            "import_brands",
+            self.path,
+            "--map=name=Firm",
+            "--map=frn=FRN",
+            "--map=website=Site",
+            "--set=countries=GB",
+            "--set=commentary__display_on_website=true",
+            "--institution-type=Credit Union",
+            *args,
+            stdout=out,
+            stderr=io.StringIO(),
+            **kwargs,
+        )
+        return out.getvalue()
+
+    def test_dry_run_reports_diff_without_writing(self):
+        out = self.import_brands("--dry-run")
+        self.assertIn("+ row 1: create new_cu_01 (New CU)", out)
+        self.assertIn("= row 2: skip, brand existing_cu exists", out)
+        self.assertIn("! row 3:", out)
+        self.assertIn("+ row 4: create new_cu_02 (New CU!)", out)
+        self.assertFalse(Brand.objects.filter(name="New CU").exists())
+
+    def test_bulk_import_writes_brands_commentary_and_links(self):
+        with CaptureQueriesContext(connection) as ctx:
+            out = self.import_brands("--chunk-size=10")
+        self.assertIn("Created: 2, Skipped: 1, Invalid: 1", out)
+        brand = Brand.objects.get(name="New CU")
+        self.assertEqual(
+            (brand.tag, brand.frn, brand.website), ("new_cu_01", "111", "https://newcu.co.uk")
+        )
+        self.assertEqual([c.code for c in brand.countries], ["GB"])
+        self.assertTrue(brand.commentary.display_on_website)
+        self.assertEqual(brand.commentary.rating_inherited, "unknown")
+        self.assertEqual(list(brand.commentary.institution_type.all()), [self.credit_union])
+        self.assertEqual(list(brand.country_memberships.values_list("country", flat=True)), ["GB"])
+        inserts = [
+            q for q in ctx.captured_queries if q["sql"].startswith('INSERT INTO "brand_brand"')
+        ]
+        self.assertEqual(len(inserts), 1)
+
+    def test_imported_inherit_rating_resolves(self):
+        self.import_brands("--set=commentary__rating=inherit")
+        commentary = Brand.objects.get(name="New CU").commentary
+        # no parent to inherit from
+        self.assertEqual(
+            (commentary.rating, commentary.rating_inherited),
+            (RatingChoice.INHERIT, RatingChoice.UNKNOWN),
+        )
+
+    def test_checkpoint_resumes_after_committed_rows(self):
+        checkpoint = os.path.join(self.dir.name, "checkpoint.json")
+        self.import_brands("--chunk-size=2", f"--checkpoint={checkpoint}")
+        self.assertEqual(Brand.objects.filter(name__startswith="New CU").count(), 2)
+
+        out = self.import_brands("--chunk-size=2", f"--checkpoint={checkpoint}")
+        self.assertIn("Resumed after row 4", out)
+        self.assertIn("Created: 0", out)
+        self.assertEqual(Brand.objects.filter(name__startswith="New CU").count(), 2)
+
+
+class GraphQLQueryCostTest(TestCase):
+    query = """
+    query Brands($first: Int) {
+        brands(first: $first) {
+            edges { node { tag commentary { rating } ...features } }
+        }
+    }
+    fragment features on Brand { bankFeatures { offered } }
+    """
+
+    def setUp(self):
+        create_test_brands()
+
+    def estimate(self, query, variables=None):
+        estimates = {}
+        errors = validate(
+            schema.graphql_schema, parse(query), [cost_limit_rule(variables, estimates)]
+        )
+        return estimates, errors
+
+    def test_estimate_follows_first_and_fragments(self):
+        estimates, errors = self.estimate(self.query, {"first": 5})
+        # connection + 5 nodes + 5 commentaries + 5 x 10 bank features
+        self.assertEqual(estimates, {"Brands": 61})
+        self.assertEqual(errors, [])
+
+        estimates, _ = self.estimate(self.query)
+        self.assertEqual(estimates["Brands"], 1 + 10000 * 12)
+
+    def post(self, query, variables=None):
+        return self.client.post(
+            "/graphql",
+            data=json.dumps({"query": query, "variables": variables}),
+            content_type="application/json",
+        )
+
+    @override_settings(GRAPHQL_MAX_QUERY_COST=100)
+    def test_queries_over_budget_are_rejected_before_execution(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post(self.query)
+        self.assertIn("exceeds the limit of 100", response.json()["errors"][0]["message"])
+        self.assertIsNone(response.json().get("data"))
+        self.assertFalse(any("brand_brand" in q["sql"] for q in ctx.captured_queries))
+
+        with self.assertLogs("brand.views", "INFO") as logs:
+            response = self.post(self.query, {"first": 5})
+        self.assertEqual(len(response.json()["data"]["brands"]["edges"]), 2)
+        self.assertIn("graphql Brands: estimated cost 61, actual", logs.output[0])
+
+    @override_settings(GRAPHQL_MAX_QUERY_DEPTH=3)
+    def test_depth_limit(self):
+        response = self.post(self.query, {"first": 5})
+        self.assertIn("Query depth 4 exceeds", response.json()["errors"][0]["message"])
+
+
+class PersistedQueryTest(TestCase):
+    query = "query Tags { brands(first: 5) { edges { node { tag } } } }"
+
+    def setUp(self):
+        create_test_brands()
+        query_documents.documents.clear()
+        self.hash = PersistedQuery.hash(self.query)
+        self.extensions = json.dumps({"persistedQuery": {"version": 1, "sha256Hash": self.hash}})
+
+    def get(self, **params):
+        return self.client.get("/graphql", params, HTTP_ACCEPT="application/json")
+
+    def test_registered_query_runs_by_hash_and_is_parsed_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "tags.graphql")
+            with open(path, "w") as file:
+                file.write(self.query)
+            out = io.StringIO()
+            call_command("register_persisted_queries", path, stdout=out)
+        self.assertIn(f"{self.hash} tags", out.getvalue())
+
+        with mock.patch.object(query_documents, "parse", wraps=query_documents.parse) as parse:
+            for _ in range(2):
+                response = self.get(extensions=self.extensions)
+                self.assertEqual(len(response.json()["data"]["brands"]["edges"]), 2)
+            # a plain query with the same text shares the cached document
+            response = self.get(query=self.query)
+            self.assertEqual(len(response.json()["data"]["brands"]["edges"]), 2)
+        self.assertEqual(parse.call_count, 1)
+
+    def test_unknown_hash_and_mismatched_query(self):
+        response = self.get(extensions=self.extensions)
+        self.assertEqual(response.json()["errors"][0]["message"], "PersistedQueryNotFound")
+
+        response = self.get(extensions=self.extensions, query="{ brands { edges { cursor } } }")
+        self.assertIn("does not match", response.json()["errors"][0]["message"])
+        self.assertFalse(PersistedQuery.objects.exists())
+
+    @override_settings(GRAPHQL_AUTO_PERSIST_QUERIES=True)
+    def test_auto_persist(self):
+        self.get(extensions=self.extensions, query=self.query)
+        self.assertFalse(PersistedQuery.objects.exists())
+
+        self.client.force_login(User.objects.create_user("staff", password="x", is_staff=True))
+        self.get(extensions=self.extensions, query=self.query)
+        self.assertEqual(PersistedQuery.objects.get().sha256, self.hash)
+
+    def test_get_request_cannot_run_a_mutation(self):
+        response = self.get(query="mutation { noop }")
+        self.assertEqual(response.status_code, 405)
+
+    def test_document_cache_evicts_least_recently_used(self):
+        cache = query_documents.DocumentCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertEqual((cache.get("a"), cache.get("b"), cache.get("c")), (1, None, 3))
+
+
+class ResolverTracingTest(TestCase):
+    query = "{ brands(first: 5) { edges { node { tag commentary { rating } } } } }"
+
+    def setUp(self):
+        create_test_brands()
+
+    def post(self, **headers):
+        return self.client.post(
+            "/graphql",
+            data=json.dumps({"query": self.query}),
+            content_type="application/json",
+            **headers,
+        )
+
+    def test_untraced_requests_skip_the_middleware(self):
+        response = self.post()
+        self.assertNotIn("extensions", response.json())
+        self.assertFalse(ResolverTrace.objects.exists())
+
+    def test_tracing_header_returns_and_records_timings(self):
+        staff = User.objects.create_user("staff", password="x", is_staff=True)
+        self.client.force_login(staff)
+        response = self.post(HTTP_X_GRAPHQL_TRACING="true")
+        self.assertIn("no-store", response["Cache-Control"])
+        self.assertIn("X-GraphQL-Tracing", response["Vary"])
+        tracing = response.json()["extensions"]["tracing"]
+        resolvers = {r["field"]: r for r in tracing["resolvers"]}
+        self.assertEqual(resolvers["Query.brands"]["calls"], 1)
+        self.assertGreater(resolvers["Query.brands"]["sql_count"], 0)
+        self.assertEqual(resolvers["Brand.tag"]["calls"], 2)
+        self.assertEqual(ResolverTrace.objects.get().fields["Brand.tag"][0], 2)
+
+        page = self.client.get(reverse("resolver_stats"))
+        self.assertContains(page, "Query.brands")
+
+    def test_tracing_header_needs_staff_or_token(self):
+        response = self.post(HTTP_X_GRAPHQL_TRACING="true")
+        self.assertNotIn("extensions", response.json())
+        self.assertFalse(ResolverTrace.objects.exists())
+
+        with self.settings(GRAPHQL_TRACING_TOKEN="s3cret"):
+            self.assertNotIn("extensions", self.post(HTTP_X_GRAPHQL_TRACING="wrong").json())
+            response = self.post(HTTP_X_GRAPHQL_TRACING="s3cret")
+        self.assertIn("tracing", response.json()["extensions"])
+        self.assertEqual(ResolverTrace.objects.count(), 1)
+
+    @override_settings(GRAPHQL_TRACING_SAMPLE_RATE=1)
+    def test_sampled_requests_are_recorded_without_extensions(self):
+        response = self.post()
+        self.assertNotIn("extensions", response.json())
+        self.assertEqual(ResolverTrace.objects.count(), 1)
+
+
+class HarvestFeatureTest(TestCase):
+    def setUp(self):
+        self.brand = Brand.objects.create(tag="harvested", name="Harvested")
+        self.commentary = Commentary.objects.create(
+            brand=self.brand,
+            feature_json={
+                "deposit_products": {
+                    "savings": {
+                        "offered": True,
+                        "additional_details": "",
+                        "offered_to": {"customer_type": ["sme", "corporate"]},
+                    },
+                    "ISAs": {"offered": False, "additional_details": ""},
+                },
+                "loan_products": {
+                    "mortgages_or_loans": {
+                        "offered": True,
+                        "additional_details": "",
+                        "offered_to": [{"customer_type": "retail_and_individual"}],
+                    }
+                },
+                "institutional_information": {
+                    "year_founded": {"founded": 1900, "additional_details": ""}
+                },
+            },
+        )
+
+    def rows(self):
+        return set(HarvestFeature.objects.values_list("section", "feature", "offered").order_by())
+
+    def test_rows_follow_feature_json(self):
+        self.assertEqual(
+            self.rows(),
+            {
+                ("deposit_products", "savings", True),
+                ("deposit_products", "ISAs", False),
+                ("loan_products", "mortgages_or_loans", True),
+            },
+        )
+        savings = HarvestFeature.objects.get(feature="savings")
+        self.assertEqual(savings.customer_types, ["corporate", "sme"])
+
+        self.commentary.feature_json["deposit_products"]["ISAs"]["offered"] = True
+        del self.commentary.feature_json["loan_products"]
+        self.commentary.save(update_fields=["feature_json"])
+        self.assertEqual(
+            self.rows(), {("deposit_products", "savings", True), ("deposit_products", "ISAs", True)}
+        )
+
+    def test_brand_filter_uses_the_index(self):
+        with CaptureQueriesContext(connection) as ctx:
+            tags = list(
+                Brand.objects.filter(
+                    harvest_data_filter_q({"deposit_products": ["savings", " ISAs"]})
+                ).values_list("tag", flat=True)
+            )
+        self.assertEqual(tags, [])
+        self.assertIn("brand_harvestfeature", ctx.captured_queries[0]["sql"])
+        self.assertNotIn("feature_json", ctx.captured_queries[0]["sql"])
+
+        tags = Brand.objects.filter(
+            harvest_data_filter_q({"deposit_products": ["savings"], "loan_products": []})
+        ).values_list("tag", flat=True)
+        self.assertEqual(list(tags), ["harvested"])
+
+
+class EffectiveFeaturesTest(TestCase):
+    harvested = {
+        "services": {
+            "mobile_banking": {"offered": False, "additional_details": "", "urls": ["a"]},
+            "ATM_network": {"offered": True, "additional_details": "", "urls": []},
+        }
+    }
+    override = {"services": {"mobile_banking": {"offered": True, "urls": ["b"]}}}
+
+    def setUp(self):
+        self.brand = Brand.objects.create(tag="overridden", name="Overridden")
+        self.commentary = Commentary.objects.create(brand=self.brand, feature_json=self.harvested)
+
+    def test_merge_is_deep_and_override_wins(self):
+        merged = merge_features(self.harvested, self.override)
+        self.assertEqual(
+            merged["services"]["mobile_banking"],
+            {"offered": True, "additional_details": "", "urls": ["b"]},
+        )
+        self.assertEqual(
+            merged["services"]["ATM_network"], self.harvested["services"]["ATM_network"]
+        )
+        self.assertFalse(self.harvested["services"]["mobile_banking"]["offered"])
+        self.assertEqual(merge_features(None, {}), {})
+        self.assertEqual(merge_features(self.harvested, None), self.harvested)
+
+    def test_override_is_served_and_indexed(self):
+        self.commentary.feature_override = self.override
+        self.commentary.save(update_fields=["feature_override"])
+
+        tags = Brand.objects.filter(
+            harvest_data_filter_q({"services": ["mobile_banking"]})
+        ).values_list("tag", flat=True)
+        self.assertEqual(list(tags), ["overridden"])
+
+        res: Any = graphene.test.Client(schema).execute(
+            '{ harvestData(tag: "overridden") { services } }'
+        )
+        self.assertTrue(res["data"]["harvestData"]["services"]["mobile_banking"]["offered"])
+
+    def test_recompute_command_repairs_bulk_writes(self):
+        Commentary.objects.filter(pk=self.commentary.pk).update(feature_override=self.override)
+        out = io.StringIO()
+        call_command("recompute_effective_features", "--chunk-size=1", stdout=out)
+        self.assertIn("Recomputed 1 commentaries, 1 changed", out.getvalue())
+        self.commentary.refresh_from_db()
+        self.assertTrue(self.commentary.effective_features["services"]["mobile_banking"]["offered"])
+        self.assertTrue(HarvestFeature.objects.get(feature="mobile_banking").offered)
+
+    def test_benchmark_command_counts_match(self):
+        out = io.StringIO()
+        call_command("benchmark_feature_filters", brands=30, repeat=1, stdout=out)
+        counts = re.findall(
+            r"(\d+) filters: (\d+) brands by JSON path, (\d+) by index", out.getvalue()
+        )
+        self.assertEqual([count for count, _, _ in counts], ["1", "5", "10"])
+        self.assertTrue(all(by_path == by_index for _, by_path, by_index in counts))
+        # with 80% of features offered, most brands match a single filter
+        self.assertGreater(int(counts[0][2]), 0)
+        self.assertFalse(Brand.objects.filter(tag__startswith="benchmark_brand_").exists())
+
+
+class JobQueueTest(TestCase):
+    def setUp(self):
+        self.brand = Brand.objects.create(tag="queued", name="Queued Bank", countries=["GB"])
+        user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(user)
+
+    def run_jobs(self):
+        out = io.StringIO()
+        call_command("run_jobs", "--once", "--concurrency=1", stdout=out, stderr=io.StringIO())
+        return out.getvalue()
+
+    def test_admin_refreshes_are_queued_once(self):
+        url = reverse("admin:brand_refresh_features", args=[self.brand.pk])
+        self.client.post(url)
+        self.client.post(url)
+        self.client.post(reverse("admin:brand_refresh_location", args=[self.brand.pk]))
+
+        jobs = Job.objects.filter(brand=self.brand)
+        self.assertEqual(
+            sorted(jobs.values_list("kind", flat=True)),
+            [Job.Kind.HARVEST_FEATURES, Job.Kind.HARVEST_LOCATIONS],
+        )
+        self.assertEqual(set(jobs.values_list("status", flat=True)), {Job.Status.QUEUED})
+        self.assertEqual(self.client.get(reverse("admin:brand_job_changelist")).status_code, 200)
+
+    def test_admin_save_queues_harvest_of_published_brands_only(self):
+        model_admin = BrandAdmin(Brand, admin.site)
+        request = RequestFactory().post("/")
+        model_admin.save_model(request, self.brand, None, True)
+        self.assertFalse(Job.objects.exists())
+
+        Commentary.objects.filter(brand=self.brand).update(display_on_website=True)
+        self.brand.refresh_from_db()
+        model_admin.save_model(request, self.brand, None, True)
+        self.assertEqual(Job.objects.get().kind, Job.Kind.HARVEST_FEATURES)
+
+    def test_worker_saves_harvest_data(self):
+        Job.submit(Job.Kind.HARVEST_FEATURES, self.brand.pk)
+        with mock.patch(
+            "brand.utils.jobs.fetch_harvest_data_once", return_value=dummy_all_features
+        ) as fetch:
+            out = self.run_jobs()
+
+        self.assertEqual(fetch.call_args.kwargs["brand_tag"], "queued")
+        self.assertIn("Done. Ran 1 jobs", out)
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.Status.SUCCEEDED, 1))
+        self.assertEqual(Commentary.objects.get(brand=self.brand).feature_json, dummy_all_features)
+        # finished jobs don't block new ones
+        self.assertTrue(Job.submit(Job.Kind.HARVEST_FEATURES, self.brand.pk)[1])
+
+    @override_settings(JOB_RETRY_BACKOFF=0)
+    def test_failures_are_retried_then_failed(self):
+        job, _ = Job.submit(Job.Kind.HARVEST_FEATURES, self.brand.pk)
+        with mock.patch(
+            "brand.utils.jobs.fetch_harvest_data_once", return_value=Exception("Harvest is down")
+        ) as fetch:
+            self.run_jobs()
+
+        self.assertEqual(fetch.call_count, job.max_attempts)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.FAILED)
+        self.assertEqual(job.last_error, "Exception: Harvest is down")
+
+    def test_stale_running_jobs_are_queued_again(self):
+        job, _ = Job.submit(Job.Kind.HARVEST_LOCATIONS, self.brand.pk)
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.Status.RUNNING, attempts=1, started=timezone.now() - timedelta(days=1)
+        )
+        self.assertEqual(Job.requeue_stale(), 1)
+        self.assertEqual(Job.claim("test").pk, job.pk)
+        self.assertIsNone(Job.claim("test"))
+
+    @override_settings(JOB_TIMEOUT=60)
+    def test_busy_workers_requeue_stale_jobs_on_a_timer(self):
+        for i in range(3):
+            brand = Brand.objects.create(tag=f"busy_{i}", name=f"Busy {i}")
+            Job.submit(Job.Kind.HARVEST_FEATURES, brand.pk)
+        # every reading of the clock is 20s after the previous one
+        clock = itertools.count(step=20)
+        with (
+            mock.patch("brand.utils.jobs.time.monotonic", side_effect=lambda: next(clock)),
+            mock.patch.object(Job, "requeue_stale") as requeue_stale,
+            mock.patch("brand.utils.jobs.fetch_harvest_data_once", return_value={}),
+        ):
+            self.assertEqual(JobWorker(concurrency=1).run(once=True), 3)
+        # never idle, yet checked again once JOB_TIMEOUT / 2 had passed
+        self.assertEqual(requeue_stale.call_count, 2)
+
+
+class KeepAliveHarvestHandler(StubHarvestHandler):
+    protocol_version = "HTTP/1.1"
+    ports = []
+
+    def do_GET(self):
+        self.ports.append(self.client_address[1])
+        super().do_GET()
+
+
+class HttpClientTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHarvestHandler)
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        StubHarvestHandler.plans = {}
+        StubHarvestHandler.requests = []
+        KeepAliveHarvestHandler.ports = []
+        http_client.metrics.reset()
+
+    def fetch(self, tag):
+        with override_settings(HARVEST_BASE_URL=self.base_url):
+            return fetch_harvest_data_once(brand_tag=tag)
+
+    def test_connections_are_reused_and_measured(self):
+        StubHarvestHandler.plans = {"b": [500]}
+        self.assertEqual(self.fetch("a"), {"tag": "a"})
+        self.assertIsInstance(self.fetch("b"), Exception)
+        self.assertEqual(self.fetch("c"), {"tag": "c"})
+
+        self.assertEqual(len(set(KeepAliveHarvestHandler.ports)), 1)
+        stats = http_client.metrics.snapshot()["harvest"]
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["statuses"], {200: 2, 500: 1})
+        self.assertIn("harvest: 3 requests", http_client.metrics.summary())
+
+    def test_unavailable_is_retried_but_gateway_timeouts_are_left_to_callers(self):
+        StubHarvestHandler.plans = {"flaky": [503], "slow": [504]}
+        self.assertEqual(self.fetch("flaky"), {"tag": "flaky"})
+        self.assertIsInstance(self.fetch("slow"), HarvestRetryableError)
+        self.assertEqual(StubHarvestHandler.requests, ["flaky", "flaky", "slow"])
+
+
+class PrismicMismatchTest(TestCase):
+    PAGES = {
+        "bankpage": [["listed", "page_only"], ["sfi_listed"], ["Spaced "]],
+        "sfipage": [["sfi_listed", "sfi_page_only"]],
+    }
+
+    def setUp(self):
+        for tag in ["listed", "sfi_listed", "spaced", "unlisted", "sfi_unlisted"]:
+            brand = Brand.objects.create(tag=tag, name=tag)
+            Commentary.objects.create(
+                brand=brand, show_on_sustainable_banks_page=tag.startswith("sfi_")
+            )
+        self.requests = []
+
+    def fake_get(self, endpoint, url, params=None):
+        self.requests.append(params and (params["q"], params["page"]))
+        if params is None:
+            body = {"refs": [{"ref": "ref-1"}]}
+        else:
+            document_type = "sfipage" if "sfipage" in params["q"] else "bankpage"
+            pages = self.PAGES[document_type]
+            body = {
+                "total_pages": len(pages),
+                "results": [{"uid": uid} for uid in pages[params["page"] - 1]],
+            }
+        return mock.Mock(status_code=200, json=mock.Mock(return_value=body))
+
+    def check(self):
+        with mock.patch("scripts.find_missing_brands_vs_pages.http_client.get", self.fake_get):
+            return self.client.get(reverse("check_prismic_mismatches"))
+
+    def test_listings_are_fetched_concurrently_and_cached_per_ref(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.check()
+        pages = response.context["missing_brands_pages"]
+        # matched case-insensitively once stripped
+        self.assertEqual(pages["missing_brands"], ["page_only"])
+        self.assertEqual(
+            [tag for tag, _ in pages["missing_bank_pages"]], ["sfi_unlisted", "unlisted"]
+        )
+        self.assertEqual(
+            pages["missing_bank_pages"][1][1],
+            reverse("admin:brand_brand_change", args=[Brand.objects.get(tag="unlisted").pk]),
+        )
+        self.assertEqual(pages["sfi_missing_brands"], ["sfi_page_only"])
+        self.assertEqual([tag for tag, _ in pages["missing_sfi_pages"]], ["sfi_unlisted"])
+        self.assertEqual(len(self.requests), 5)
+        brand_queries = [q for q in ctx.captured_queries if '"brand_brand"' in q["sql"]]
+        self.assertEqual(len(brand_queries), 2)
+
+        self.requests = []
+        self.check()
+        self.assertEqual(self.requests, [None])
+
+
+class BrandChangelistTest(TestCase):
+    def setUp(self):
+        for i in range(5):
+            Brand.objects.create(tag=f"listed_{i}", name=f"Listed {i}")
+        BrandSuggestion.objects.create(tag="suggested", name="Suggested")
+        State.objects.create(tag="alabama-us", name="Alabama", country_code="US")
+        user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(user)
+        self.url = reverse("admin:brand_brand_changelist")
+
+    def tags(self, response):
+        return [brand.tag for brand in response.context["cl"].result_list]
+
+    def test_suggestions_are_flagged_and_hidden(self):
+        self.assertTrue(Brand.objects.get(tag="suggested").is_suggestion)
+        self.assertFalse(Brand.objects.get(tag="listed_0").is_suggestion)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertNotIn("suggested", self.tags(response))
+        self.assertEqual(len(self.tags(response)), 5)
+        self.assertContains(response, "Alabama")
+        sql = " ".join(q["sql"] for q in ctx.captured_queries)
+        self.assertNotIn("brand_brandsuggestion", sql)
+
+        # the state filter choices come from the cache until a State changes
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(self.url)
+        self.assertFalse(any('FROM "brand_state"' in q["sql"] for q in ctx.captured_queries))
+        State.objects.create(tag="alaska-us", name="Alaska", country_code="US")
+        self.assertContains(self.client.get(self.url), "Alaska")
+
+    def test_fast_list_pages_by_id_without_counting(self):
+        response = self.client.get(self.url, {"fast": "1", "commentary__rating": ""})
+        self.assertRedirects(
+            response, f"{self.url}?commentary__rating=", fetch_redirect_response=False
+        )
+
+        with mock.patch.object(BrandAdmin, "list_per_page", 2):
+            with CaptureQueriesContext(connection) as ctx:
+                first = self.client.get(self.url)
+            second = self.client.get(self.url + first.context["cl"].next_page_query())
+            last = self.client.get(self.url + second.context["cl"].next_page_query())
+        self.assertFalse(any("COUNT(" in q["sql"] for q in ctx.captured_queries))
+        ids = list(
+            Brand.objects.filter(is_suggestion=False).order_by("pk").values_list("tag", flat=True)
+        )
+        self.assertEqual(self.tags(first), ids[:2])
+        self.assertEqual(self.tags(second), ids[2:4])
+        self.assertEqual(self.tags(last), ids[4:])
+        self.assertIsNone(last.context["cl"].next_after)
+        self.assertContains(first, "Next page")
+
+        self.client.get(self.url, {"fast": "0"})
+        self.assertFalse(self.client.get(self.url).context["cl"].fast_list)
+
+    def test_list_toggle_keeps_filters_and_search(self):
+        response = self.client.get(self.url, {"q": "Listed", "commentary__rating": "good"})
+        self.assertEqual(
+            response.context["cl"].toggle_list_query(), "?commentary__rating=good&fast=1&q=Listed"
+        )
+        self.assertContains(response, 'href="?commentary__rating=good&amp;fast=1&amp;q=Listed"')
+
+        # the other list opens on its first page
+        with mock.patch.object(BrandAdmin, "list_per_page", 1):
+            paged = self.client.get(self.url, {"q": "Listed", "p": "2"})
+            self.assertEqual(paged.context["cl"].toggle_list_query(), "?fast=1&q=Listed")
+            self.client.get(self.url, {"fast": "1"})
+            after = self.client.get(self.url, {"q": "Listed", "after": "1"})
+        self.assertEqual(after.context["cl"].toggle_list_query(), "?fast=0&q=Listed")
@@ -0,0 +1,30 @@
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.db import transaction
+
+
+@contextmanager
+def rolled_back():
+    """Run a block in a transaction that is always rolled back, for synthetic benchmark data"""
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def time_calls(fn, repeat=5):
+    """Call fn `repeat` times, returning min/median/max wall time in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {"min": min(timings), "median": statistics.median(timings), "max": max(timings)}
+
+
+def format_timings(label, timings):
+    return (
+        f"{label:<40} min {timings['min']:9.2f} ms   "
+        f"median {timings['median']:9.2f} ms   max {timings['max']:9.2f} ms"
+    )
@@ -0,0 +1,251 @@
+"""
+Bulk import of brands (with their commentary and institution types) from CSV or JSON rows.
+
+Rows are handled in chunks. Each chunk is validated in passes that need no per-row
+queries (field validation in Python, one query for name clashes, tags checked against a
+tag set loaded once), then written in one transaction with bulk_create. After every
+committed chunk the next row number is written to the checkpoint, so an interrupted
+import resumes where it stopped.
+"""
+
+import csv
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from itertools import islice
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import transaction
+from django.db.models import BooleanField
+
+from brand.models import Brand, Commentary, HarvestFeature
+from brand.models.commentary import InstitutionType, RatingChoice
+from brand.utils.brand_indexes import sync_brand_indexes
+
+
+COMMENTARY_PREFIX = "commentary__"
+TRUE_VALUES = ("true", "t", "yes", "y", "1")
+
+
+def read_rows(path):
+    """Yield dict rows from a .csv, .json (list of objects) or .jsonl/.ndjson file"""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, newline="", encoding="utf-8") as file:
+        if extension == ".csv":
+            yield from csv.DictReader(file)
+        elif extension in (".jsonl", ".ndjson"):
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(file)
+
+
+def tag_from_name(name):
+    name = name.lower().replace(" ", "_")
+    return re.sub(r"[^a-z0-9_]", "", name)
+
+
+def unique_tag(desired_tag, existing_tags):
+    tag, increment = desired_tag, 0
+    while tag in existing_tags:
+        increment += 1
+        tag = f"{desired_tag}_{str(increment).zfill(2)}"
+    return tag
+
+
+def make_valid_website(url):
+    url = url.strip()
+    if url and not url.startswith(("http://", "https://")):
+        url = "https://" + url
+    return url
+
+
+@dataclass
+class ImportReport:
+    created: list = field(default_factory=list)  # (row number, tag, name)
+    skipped: list = field(default_factory=list)  # (row number, reason)
+    invalid: list = field(default_factory=list)  # (row number, errors)
+    resumed_from: int = 0
+
+    def diff_lines(self):
+        lines = [(row, f"+ row {row}: create {tag} ({name})") for row, tag, name in self.created]
+        lines += [(row, f"= row {row}: skip, {reason}") for row, reason in self.skipped]
+        lines += [(row, f"! row {row}: {errors}") for row, errors in self.invalid]
+        return [line for _, line in sorted(lines)]
+
+    def summary(self):
+        return (
+            f"Created: {len(self.created)}, Skipped: {len(self.skipped)}, "
+            f"Invalid: {len(self.invalid)}"
+        )
+
+
+class BrandImporter:
+    """
+    `mapping` maps Brand fields, or Commentary fields prefixed with `commentary__`, to
+    source columns. `constants` sets fields to the same value on every row.
+    """
+
+    def __init__(
+        self,
+        mapping,
+        constants=None,
+        institution_types=(),
+        chunk_size=500,
+        checkpoint=None,
+        dry_run=False,
+    ):
+        self.mapping = mapping
+        self.constants = constants or {}
+        self.chunk_size = chunk_size
+        self.checkpoint = checkpoint
+        self.dry_run = dry_run
+
+        for target in {**self.mapping, **self.constants}:
+            model, name = self._target(target)
+            try:
+                model._meta.get_field(name)
+            except FieldDoesNotExist:
+                raise ValueError(f"Unknown field: {target}")
+        if "name" not in self.mapping and "name" not in self.constants:
+            raise ValueError("A column has to be mapped to name")
+
+        found = {t.name: t for t in InstitutionType.objects.filter(name__in=institution_types)}
+        missing = set(institution_types) - found.keys()
+        if missing:
+            raise ValueError(f"Unknown institution types: {', '.join(sorted(missing))}")
+        self.institution_types = list(found.values())
+
+        self.existing_tags = set(Brand.objects.values_list("tag", flat=True))
+
+    @staticmethod
+    def _target(target):
+        if target.startswith(COMMENTARY_PREFIX):
+            return Commentary, target[len(COMMENTARY_PREFIX) :]
+        return Brand, target
+
+    def _values(self, source):
+        values = {}
+        for target, column in self.mapping.items():
+            value = source.get(column)
+            if value not in (None, ""):
+                values[target] = value.strip() if isinstance(value, str) else value
+        return {**self.constants, **values}
+
+    def _build(self, source):
+        brand_fields, commentary_fields = {}, {"rating": RatingChoice.UNKNOWN}
+        for target, value in self._values(source).items():
+            model, name = self._target(target)
+            if model is Brand and name == "countries" and isinstance(value, str):
+                value = [code.strip().upper() for code in value.split(",") if code.strip()]
+            if model is Brand and name == "website":
+                value = make_valid_website(value)
+            if isinstance(model._meta.get_field(name), BooleanField) and isinstance(value, str):
+                value = value.lower() in TRUE_VALUES
+            (brand_fields if model is Brand else commentary_fields)[name] = value
+        return Brand(**brand_fields), Commentary(**commentary_fields)
+
+    def _load_checkpoint(self, source_path):
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return 0
+        with open(self.checkpoint) as file:
+            state = json.load(file)
+        return state["next_row"] if state.get("source") == os.path.abspath(source_path) else 0
+
+    def _save_checkpoint(self, source_path, next_row):
+        if self.checkpoint and not self.dry_run:
+            with open(self.checkpoint, "w") as file:
+                json.dump({"source": os.path.abspath(source_path), "next_row": next_row}, file)
+
+    def run(self, source_path, rows=None):
+        """Import `rows` (read from source_path when not given), returns an ImportReport"""
+        rows = read_rows(source_path) if rows is None else iter(rows)
+        report = ImportReport(resumed_from=self._load_checkpoint(source_path))
+        row_number = report.resumed_from
+        rows = islice(rows, report.resumed_from, None)
+
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            numbered = list(enumerate(chunk, start=row_number + 1))
+            row_number += len(chunk)
+            valid = self.validate(numbered, report)
+            if not self.dry_run:
+                self.write(valid)
+            self._save_checkpoint(source_path, row_number)
+        return report
+
+    def validate(self, numbered_rows, report):
+        """Validate a chunk of (row number, source) rows, returns the rows to create"""
+        built = []
+        for number, source in numbered_rows:
+            try:
+                brand, commentary = self._build(source)
+            except (TypeError, ValueError) as e:
+                report.invalid.append((number, str(e)))
+                continue
+            built.append((number, brand, commentary))
+
+        # one query for every name of the chunk
+        names = {brand.name for _, brand, _ in built}
+        existing_names = dict(Brand.objects.filter(name__in=names).values_list("name", "tag"))
+
+        valid = []
+        for number, brand, commentary in built:
+            if brand.name in existing_names:
+                report.skipped.append((number, f"brand {existing_names[brand.name]} exists"))
+                continue
+            if brand.tag:
+                if brand.tag in self.existing_tags:
+                    report.skipped.append((number, f"tag {brand.tag} exists"))
+                    continue
+            else:
+                brand.tag = unique_tag(tag_from_name(brand.name), self.existing_tags)
+
+            errors = {}
+            try:
+                brand.clean_fields()
+            except ValidationError as e:
+                errors.update(e.message_dict)
+            try:
+                commentary.clean_fields(exclude=["brand", "inherit_brand_rating"])
+            except ValidationError as e:
+                errors.update({f"{COMMENTARY_PREFIX}{k}": v for k, v in e.message_dict.items()})
+            if errors:
+                report.invalid.append((number, errors))
+                continue
+
+            self.existing_tags.add(brand.tag)
+            existing_names[brand.name] = brand.tag
+            report.created.append((number, brand.tag, brand.name))
+            valid.append((brand, commentary))
+        return valid
+
+    def write(self, valid):
+        if not valid:
+            return
+        with transaction.atomic():
+            brands = Brand.objects.bulk_create([brand for brand, _ in valid])
+            commentaries = []
+            for brand, commentary in valid:
+                commentary.brand = brand
+                commentary.apply_save_defaults()
+                commentaries.append(commentary)
+            commentaries = Commentary.objects.bulk_create(commentaries)
+            HarvestFeature.sync(commentaries)
+
+            through = Commentary.institution_type.through
+            through.objects.bulk_create(
+                [
+                    through(commentary_id=commentary.pk, institutiontype_id=institution_type.pk)
+                    for commentary in commentaries
+                    for institution_type in self.institution_types
+                ],
+                batch_size=500,
+            )
+            sync_brand_indexes(brands)
+            # bulk_create skips save(), which resolves the effective rating of inherit
+            Commentary.recompute_inherited_ratings()
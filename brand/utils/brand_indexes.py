@@ -0,0 +1,16 @@
+"""
+Derived tables that Brand post_save signals keep in sync, refreshed in bulk for writes that
+skip Brand.save (bulk_create/bulk_update).
+"""
+
+from brand.models import BrandCountry, BrandIdentifier, BrandSimilarityKey, BrandSpelling
+from brand.utils import query_cache
+
+
+def sync_brand_indexes(brands):
+    brands = [brand for brand in brands if brand.pk]
+    BrandCountry.sync(brands)
+    BrandSpelling.sync(brands)
+    BrandIdentifier.sync(brands)
+    BrandSimilarityKey.index(brands)
+    query_cache.invalidate_brands(brand.pk for brand in brands)
@@ -0,0 +1,147 @@
+"""
+Bulk sync of the states a brand is licensed in / has physical branches in, from harvest
+location data.
+
+Results are collected per (brand, country) with `add`, then `apply` diffs them against the
+existing through rows in a handful of queries: missing rows are bulk created, rows of a
+refreshed country that harvest no longer reports are deleted. Countries whose fetch failed
+are never touched, except for rows of a country the brand no longer belongs to.
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+
+from brand.models import State
+from brand.models.brand_state import StateLicensed, StatePhysicalBranch
+from brand.utils import query_cache
+from brand.utils.countries import country_codes
+from brand.utils.harvest_data import fetch_harvest_location_data
+
+
+LOCATION_COUNTRIES = list(State.CountryCode.values)
+
+# harvest location key -> through model
+RELATIONS = {"licensed_to_operate_in": StateLicensed, "physical_branches": StatePhysicalBranch}
+
+
+def location_countries(brand):
+    """Countries of the brand that harvest has state level location data for"""
+    codes = set(country_codes(brand.countries))
+    return [country for country in LOCATION_COUNTRIES if country in codes]
+
+
+class BrandLocationSync:
+    def __init__(self):
+        # tag -> country code, loaded once instead of a query per state code
+        self.state_countries = dict(State.objects.values_list("tag", "country_code"))
+        self.refreshed = defaultdict(set)  # brand id -> countries with fetched data
+        self.wanted = {model: set() for model in RELATIONS.values()}  # (brand id, state tag)
+        self.brand_countries = {}
+
+    def add(self, brand, country, location_data):
+        """
+        Record harvest `location_data` for brand in country. State codes that are unknown,
+        belong to another country or to none of the brand's countries are ignored.
+        """
+        codes = set(country_codes(brand.countries))
+        if country not in codes:
+            return
+        self.brand_countries[brand.pk] = codes
+        self.refreshed[brand.pk].add(country)
+        for key, model in RELATIONS.items():
+            for state_code in location_data.get(key) or []:
+                if self.state_countries.get(state_code) == country:
+                    self.wanted[model].add((brand.pk, state_code))
+
+    def apply(self):
+        """Write and reset the collected rows, returns {model name: (created, deleted)}"""
+        results = {}
+        changed_brands = set()
+        with transaction.atomic():
+            for model, wanted in self.wanted.items():
+                created, deleted = self._apply_model(model, wanted, changed_brands)
+                results[model.__name__] = (created, deleted)
+        self.refreshed.clear()
+        self.brand_countries.clear()
+        for wanted in self.wanted.values():
+            wanted.clear()
+        # bulk writes send no signals
+        query_cache.invalidate_brands(changed_brands)
+        return results
+
+    def _replaced(self, brand_id, state_id):
+        # rows of a refreshed country, or of a country the brand is no longer in
+        country = self.state_countries.get(state_id)
+        return country in self.refreshed[brand_id] or country not in self.brand_countries[brand_id]
+
+    def _apply_model(self, model, wanted, changed_brands):
+        brand_ids = list(self.refreshed)
+        existing = {}
+        for start in range(0, len(brand_ids), 500):
+            rows = model.objects.filter(brand_id__in=brand_ids[start : start + 500])
+            for pk, brand_id, state_id in rows.values_list("pk", "brand_id", "state_id"):
+                existing[(brand_id, state_id)] = pk
+
+        stale = {
+            pk: brand_id
+            for (brand_id, state_id), pk in existing.items()
+            if (brand_id, state_id) not in wanted and self._replaced(brand_id, state_id)
+        }
+        missing = [key for key in wanted if key not in existing]
+
+        stale_pks = list(stale)
+        for start in range(0, len(stale_pks), 500):
+            model.objects.filter(pk__in=stale_pks[start : start + 500]).delete()
+        # validated against the preloaded countries above, StateBaseModel.save is skipped
+        model.objects.bulk_create(
+            [model(brand_id=brand_id, state_id=state_id) for brand_id, state_id in missing],
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+
+        changed_brands.update(brand_id for brand_id, _ in missing)
+        changed_brands.update(stale.values())
+        return len(missing), len(stale)
+
+
+def refresh_locations(brands, batch_size=100, log=None):
+    """
+    Fetch harvest location data for every location country of each brand and sync the
+    state relations, writing every `batch_size` brands. Returns (fetched, failed) counts.
+    """
+    log = log or (lambda message: None)
+    sync = BrandLocationSync()
+    fetched = failed = pending = 0
+    for brand in brands:
+        for country in location_countries(brand):
+            log(f"Attempt for: {brand.tag}, {country}")
+            data = fetch_harvest_location_data(
+                brand_tag=brand.tag,
+                brand_url=brand.website,
+                brand_country=country,
+                brand_name=brand.name,
+            )
+
+            if isinstance(data, Exception):
+                failed += 1
+                log(f"\tError: {brand.tag}, failed to fetch: {data}")
+                continue
+
+            location_data = data.get("location") if isinstance(data, dict) else None
+            if not location_data:
+                failed += 1
+                log(f"\tError: {brand.tag}: missing location data")
+                continue
+
+            sync.add(brand, country, location_data)
+            fetched += 1
+            log(f"\tCompleted: {brand.tag}, {country}")
+
+        pending += 1
+        if pending >= batch_size:
+            log(f"Saved: {sync.apply()}")
+            pending = 0
+    if pending:
+        log(f"Saved: {sync.apply()}")
+    return fetched, failed
@@ -0,0 +1,216 @@
+"""
+Batch upsert of brand + commentary payloads keyed by brand tag, used by the REST batch
+endpoint.
+
+Payloads are plain dicts: Brand fields plus an optional "commentary" dict of Commentary
+fields. The supplied fields are applied to the existing brand and commentary of the tag,
+or to new ones, like a partial PUT, and the result is validated like a save from the
+admin. `validate` checks a chunk of payloads without writing; `upsert` validates a chunk
+once and writes its cleaned values in one transaction with a fixed number of bulk
+queries.
+"""
+
+import copy
+
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from brand.models import Brand, Commentary, HarvestFeature
+from brand.models.commentary import RatingChoice
+from brand.utils import query_cache
+from brand.utils.brand_indexes import sync_brand_indexes
+from brand.utils.countries import country_codes
+
+
+def _writable_fields(model, exclude=()):
+    return {
+        field.name
+        for field in model._meta.concrete_fields
+        if field.editable and not field.primary_key and not field.is_relation
+    } - set(exclude)
+
+
+BRAND_FIELDS = _writable_fields(Brand, exclude=["created", "modified"])
+COMMENTARY_FIELDS = _writable_fields(Commentary)
+
+
+def _shape_errors(payload):
+    if not isinstance(payload, dict):
+        return {"non_field_errors": ["Expected an object"]}
+    if not payload.get("tag"):
+        return {"tag": ["Tag is required"]}
+
+    commentary = payload.get("commentary") or {}
+    if not isinstance(commentary, dict):
+        return {"commentary": ["Expected an object"]}
+
+    unknown = set(payload) - BRAND_FIELDS - {"commentary"}
+    unknown |= {f"commentary.{name}" for name in set(commentary) - COMMENTARY_FIELDS}
+    return {name: ["Unknown field"] for name in sorted(unknown)}
+
+
+def _errors_of(error, prefix=""):
+    return {
+        prefix + ("non_field_errors" if name == NON_FIELD_ERRORS else name): messages
+        for name, messages in error.message_dict.items()
+    }
+
+
+def _prepare(payloads, lock=False):
+    """
+    Apply each payload to a copy of the brand and commentary of its tag so far and clean
+    them. Returns (existing, brands, commentaries, errors): the stored brands by tag, the
+    cleaned brand and commentary by tag of the valid payloads, a payload later in the
+    chunk applying over an earlier one of the same tag, and the errors of each payload.
+
+    Like import_brands, the fields are cleaned in Python and the chunk's names are
+    checked with one query: tags need no check as brands are looked up by tag, and
+    payloads can't set inherit_brand_rating, so the stored inheritance chain that
+    Commentary.clean walks can't gain a cycle.
+    """
+    shape_errors = [_shape_errors(payload) for payload in payloads]
+    valid = [payload for payload, errors in zip(payloads, shape_errors) if not errors]
+    existing = Brand.objects.all()
+    if lock:
+        existing = existing.select_for_update()
+    existing = existing.in_bulk([payload["tag"] for payload in valid], field_name="tag")
+    commentaries = Commentary.objects.in_bulk(
+        [brand.pk for brand in existing.values()], field_name="brand_id"
+    )
+    commentaries = {brand.tag: commentaries.get(brand.pk) for brand in existing.values()}
+    brands = dict(existing)
+
+    # one query for every name of the chunk
+    names = {str(payload["name"]) for payload in valid if payload.get("name") is not None}
+    named = {}
+    for name, tag in Brand.objects.filter(name__in=names).values_list("name", "tag"):
+        named.setdefault(name, set()).add(tag)
+
+    errors_list = []
+    for payload, errors in zip(payloads, shape_errors):
+        if errors:
+            errors_list.append(errors)
+            continue
+
+        tag = payload["tag"]
+        brand = copy.copy(brands.get(tag)) or Brand()
+        for name, value in payload.items():
+            if name != "commentary":
+                setattr(brand, name, value)
+        try:
+            brand.clean_fields()
+        except ValidationError as e:
+            errors.update(_errors_of(e))
+        renamed = "name" in payload and brand.name != getattr(existing.get(tag), "name", None)
+        if renamed and "name" not in errors:
+            others = named.get(brand.name, set()) - {tag}
+            if others:
+                errors["name"] = [f"A brand named {brand.name} already exists: {min(others)}"]
+
+        commentary = commentaries.get(tag)
+        if payload.get("commentary"):
+            commentary = copy.copy(commentary) or Commentary(rating=RatingChoice.UNKNOWN)
+            commentary.brand = brand
+            for name, value in payload["commentary"].items():
+                setattr(commentary, name, value)
+            try:
+                # the brand may be new, its one commentary is checked by the brand tag
+                commentary.clean_fields(exclude=["brand", "inherit_brand_rating"])
+            except ValidationError as e:
+                errors.update(_errors_of(e, prefix="commentary."))
+
+        if not errors:
+            brands[tag] = brand
+            commentaries[tag] = commentary
+            named.setdefault(brand.name, set()).add(tag)
+        errors_list.append(errors)
+    return existing, brands, commentaries, errors_list
+
+
+def validate(payloads):
+    """Errors of each payload as {field: [messages]}, empty when it is valid"""
+    if not payloads:
+        return []
+    return _prepare(payloads)[3]
+
+
+def upsert(payloads):
+    """
+    Create or update the brands (by tag) and commentaries of payloads in one transaction,
+    writing the cleaned values. Returns ("created", "updated" or "invalid", errors) per
+    payload, in order.
+    """
+    if not payloads:
+        return []
+
+    with transaction.atomic():
+        existing, brands, commentaries, errors_list = _prepare(payloads, lock=True)
+        previous_countries = {
+            code for brand in existing.values() for code in country_codes(brand.countries)
+        }
+
+        results, written, updated_fields = [], {}, {"modified"}
+        now = timezone.now()
+        for payload, errors in zip(payloads, errors_list):
+            if errors:
+                results.append(("invalid", errors))
+                continue
+            tag = payload["tag"]
+            written[tag] = brands[tag]
+            written[tag].modified = now
+            updated_fields |= set(payload) - {"commentary"}
+            results.append(("updated" if tag in existing else "created", {}))
+        if not written:
+            return results
+
+        Brand.objects.bulk_create([brand for tag, brand in written.items() if tag not in existing])
+        updated = [brand for tag, brand in written.items() if tag in existing]
+        if updated:
+            Brand.objects.bulk_update(updated, updated_fields - {"tag"})
+
+        changed_ratings = _upsert_commentaries(payloads, errors_list, written, commentaries)
+
+        sync_brand_indexes(written.values())
+        # brands moved out of a country also leave that country's cached queries
+        query_cache.invalidate_countries(previous_countries)
+        if changed_ratings:
+            Commentary.recompute_inherited_ratings()
+    return results
+
+
+def _upsert_commentaries(payloads, errors_list, brands, commentaries):
+    fields_by_tag = {}
+    for payload, errors in zip(payloads, errors_list):
+        if not errors and payload.get("commentary"):
+            fields_by_tag.setdefault(payload["tag"], set()).update(payload["commentary"])
+    if not fields_by_tag:
+        return False
+
+    created, updated, fields = [], [], set()
+    for tag, names in fields_by_tag.items():
+        commentary = commentaries[tag]
+        # the brand of a new commentary was saved since it was cleaned
+        commentary.brand = brands[tag]
+        (updated if commentary.pk else created).append(commentary)
+        fields |= names
+    # a brand gaining a commentary changes what its inheritors resolve to
+    ratings_changed = bool(created) or "rating" in fields
+
+    for commentary in created:
+        commentary.apply_save_defaults()
+    Commentary.objects.bulk_create(created)
+    if updated:
+        for commentary in updated:
+            fields.update(commentary.apply_save_defaults())
+        # apply_save_defaults may also normalize these
+        fields |= {"rating", "fossil_free_alliance_rating"}
+        if {"feature_json", "feature_override"} & fields:
+            fields.add("effective_features")
+        if "feature_json" in fields:
+            fields.add("feature_hash")
+        Commentary.objects.bulk_update(updated, fields)
+    HarvestFeature.sync(
+        created + (updated if {"feature_json", "feature_override"} & fields else [])
+    )
+    return ratings_changed
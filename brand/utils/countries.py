@@ -0,0 +1,7 @@
+def country_codes(countries):
+    """Normalize a CountryField value (list of Country or comma separated string) to codes"""
+    if not countries:
+        return []
+    if isinstance(countries, str):
+        return [code for code in countries.split(",") if code]
+    return [getattr(country, "code", country) for country in countries]
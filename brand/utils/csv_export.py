@@ -0,0 +1,170 @@
+"""
+Streaming CSV export of brands with their commentary and features.
+
+Rows come from a single `values()` iterator over Brand joined to Commentary. Many to many
+and feature columns are fetched per chunk of brands, so memory stays bounded by the chunk
+size and the first rows can be sent before the last brand is read.
+
+The columns and their formatting are those of the export that went through the JSON
+serializer: fields as serialized, dates as DjangoJSONEncoder writes them, and every
+institution type and credential name on each row.
+"""
+
+import csv
+import datetime
+from collections import defaultdict
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from django_countries import countries as country_registry
+
+from brand.models import Brand, BrandFeature
+from brand.models.commentary import Commentary, InstitutionCredential, InstitutionType
+from brand.utils.markdown_render import MARKDOWN_FIELDS
+
+
+CHUNK_SIZE = 500
+
+
+class Echo:
+    """Pseudo buffer for csv.writer, returns the written line instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+# kept for lookups and rendering, derived from the exported columns
+DERIVED_FIELDS = {
+    "is_suggestion",
+    "rating_inherited",
+    "effective_features",
+    "feature_hash",
+    *MARKDOWN_FIELDS.values(),
+}
+# every name, on every row
+INSTITUTION_COLUMNS = {
+    "institution_type": InstitutionType,
+    "institution_credentials": InstitutionCredential,
+}
+
+
+def _local_fields(model):
+    return [
+        field.name
+        for field in model._meta.concrete_fields
+        if not field.primary_key and field.name not in DERIVED_FIELDS
+    ]
+
+
+def _many_to_many(model):
+    # the serializer skips relations with their own through model
+    return [
+        field.name
+        for field in model._meta.many_to_many
+        if field.remote_field.through._meta.auto_created and field.name not in INSTITUTION_COLUMNS
+    ]
+
+
+BRAND_FIELDS = _local_fields(Brand)
+COMMENTARY_FIELDS = _local_fields(Commentary)
+FEATURE_COLUMNS = ["brand_feature_id", "feature"]
+
+
+def export_columns():
+    columns = {"brand_id", *BRAND_FIELDS, *_many_to_many(Brand)}
+    columns.update(COMMENTARY_FIELDS, _many_to_many(Commentary), FEATURE_COLUMNS)
+    columns.update(INSTITUTION_COLUMNS)
+    return sorted(columns)
+
+
+def _format(value):
+    if value is None:
+        return ""
+    if isinstance(value, (datetime.date, datetime.time)):
+        return DjangoJSONEncoder().default(value)
+    return value
+
+
+def _related_ids(model, name, owner_ids):
+    field = model._meta.get_field(name)
+    owner, target = field.m2m_field_name(), field.m2m_reverse_name()
+    grouped = defaultdict(list)
+    for owner_id, target_id in (
+        field.remote_field.through.objects.filter(**{f"{owner}__in": owner_ids})
+        .order_by(owner, target)
+        .values_list(owner, target)
+    ):
+        grouped[owner_id].append(target_id)
+    return grouped
+
+
+def _enrich(rows):
+    """Fill the many to many and feature columns of a chunk of rows in place"""
+    brand_ids = [row["brand_id"] for row in rows]
+    commentary_ids = [row["commentary_id"] for row in rows if row["commentary_id"]]
+    brand_related = {name: _related_ids(Brand, name, brand_ids) for name in _many_to_many(Brand)}
+    commentary_related = {
+        name: _related_ids(Commentary, name, commentary_ids) for name in _many_to_many(Commentary)
+    }
+
+    features = defaultdict(list)
+    for brand_id, feature_id, feature_name in (
+        BrandFeature.objects.filter(brand_id__in=brand_ids)
+        .order_by("pk")
+        .values_list("brand_id", "pk", "feature__name")
+    ):
+        features[brand_id].append((str(feature_id), feature_name))
+
+    for row in rows:
+        commentary_id = row.pop("commentary_id")
+        for name, grouped in brand_related.items():
+            row[name] = grouped.get(row["brand_id"], [])
+        for name, grouped in commentary_related.items():
+            row[name] = grouped.get(commentary_id, []) if commentary_id else ""
+        if features[row["brand_id"]]:
+            ids, names = zip(*features[row["brand_id"]])
+            row["brand_feature_id"] = ",".join(ids)
+            row["feature"] = ",".join(names)
+        row["countries"] = ",".join(
+            str(country_registry.name(code)) for code in (row["countries"] or "").split(",") if code
+        )
+
+
+def _rename(row):
+    renamed = {"brand_id": row.pop("pk"), "commentary_id": row.pop("commentary__pk")}
+    for name in BRAND_FIELDS:
+        renamed[name] = row.pop(name)
+    # commentary columns win over brand columns of the same name, as they always have
+    for name in COMMENTARY_FIELDS:
+        renamed[name] = row.pop(f"commentary__{name}")
+    return renamed
+
+
+def iter_export_rows(chunk_size=CHUNK_SIZE):
+    """Yield one dict per brand keyed by `export_columns()`"""
+    institutions = {
+        column: ",".join(model.objects.values_list("name", flat=True))
+        for column, model in INSTITUTION_COLUMNS.items()
+    }
+    lookups = ["pk", "commentary__pk", *BRAND_FIELDS]
+    lookups += [f"commentary__{name}" for name in COMMENTARY_FIELDS]
+    rows = Brand.objects.order_by("pk").values(*lookups).iterator(chunk_size=chunk_size)
+
+    chunk = []
+    for row in rows:
+        chunk.append({**_rename(row), **institutions})
+        if len(chunk) >= chunk_size:
+            _enrich(chunk)
+            yield from chunk
+            chunk = []
+    if chunk:
+        _enrich(chunk)
+        yield from chunk
+
+
+def iter_csv_lines(chunk_size=CHUNK_SIZE):
+    columns = export_columns()
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in iter_export_rows(chunk_size):
+        yield writer.writerow([_format(row.get(column)) for column in columns])
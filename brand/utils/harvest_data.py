@@ -7,14 +7,22 @@ from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 
-import requests
+from brand.models.commentary import hash_features
+from brand.utils import http_client
 
 
-def fetch_harvest_data(
-    brand_tag, brand_url="", brand_country="", brand_name="", retry_count=0, max_retries=2
-) -> Union[Dict, Exception]:
-    base_url = "https://harvest.bank.green/harvest"
+RETRYABLE_STATUS_CODES = (524, 504)
+
+
+class HarvestRetryableError(Exception):
+    """Harvest answered with a gateway timeout; the request can be retried later"""
+
+    def __init__(self, status_code):
+        super().__init__(f"Harvest responded with retryable status code {status_code}")
+        self.status_code = status_code
+
 
+def harvest_url(endpoint, brand_tag, brand_url="", brand_country="", brand_name=""):
     params = {
         "bankTag": brand_tag,
         "bankUrl": brand_url,
@@ -25,62 +33,76 @@ def fetch_harvest_data(
     # URL encode the parameters
     encoded_params = urlencode(params, doseq=True)
 
-    url = f"{base_url}?{encoded_params}"
+    return f"{settings.HARVEST_BASE_URL}/{endpoint}?{encoded_params}"
+
+
+def fetch_harvest_data_once(
+    brand_tag, brand_url="", brand_country="", brand_name="", timeout=None
+) -> Union[Dict, Exception]:
+    """
+    Single attempt at fetching harvest data that never sleeps. Returns the payload,
+    a HarvestRetryableError for 524/504 responses, or any other exception raised.
+    """
+    url = harvest_url("harvest", brand_tag, brand_url, brand_country, brand_name)
 
     try:
-        response = requests.get(
-            url, headers={"Authorization": f"Token {settings.HARVEST_TOKEN}"}, timeout=600
+        response = http_client.get(
+            "harvest",
+            url,
+            headers={"Authorization": f"Token {settings.HARVEST_TOKEN}"},
+            timeout=timeout,
         )
 
         # Explicitly check for 524 and 504 status codes
-        if response.status_code in [524, 504]:
-            if retry_count < max_retries:
-                print(
-                    f"Received {response.status_code} status code. Waiting 5 minutes before retry {retry_count + 1}..."
-                )
-                time.sleep(300)  # 5 minutes = 300 seconds
-                return fetch_harvest_data(
-                    brand_tag,
-                    brand_url,
-                    brand_country,
-                    brand_name,
-                    retry_count=retry_count + 1,
-                    max_retries=max_retries,
-                )
-            else:
-                print(f"Max retries reached for {response.status_code} status code")
-                return Exception(
-                    f"Failed after {max_retries} attempts due to {response.status_code} status code"
-                )
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            return HarvestRetryableError(response.status_code)
 
+        response.raise_for_status()
         return response.json()
-
     except Exception as e:
         return e
 
 
-def fetch_harvest_location_data(
+def fetch_harvest_data(
     brand_tag, brand_url="", brand_country="", brand_name="", retry_count=0, max_retries=2
 ) -> Union[Dict, Exception]:
-    base_url = "https://harvest.bank.green/location"
+    data = fetch_harvest_data_once(brand_tag, brand_url, brand_country, brand_name)
+
+    if isinstance(data, HarvestRetryableError):
+        if retry_count < max_retries:
+            print(
+                f"Received {data.status_code} status code. Waiting 5 minutes before retry {retry_count + 1}..."
+            )
+            time.sleep(300)  # 5 minutes = 300 seconds
+            return fetch_harvest_data(
+                brand_tag,
+                brand_url,
+                brand_country,
+                brand_name,
+                retry_count=retry_count + 1,
+                max_retries=max_retries,
+            )
+        else:
+            print(f"Max retries reached for {data.status_code} status code")
+            return Exception(
+                f"Failed after {max_retries} attempts due to {data.status_code} status code"
+            )
 
-    params = {
-        "bankTag": brand_tag,
-        "bankUrl": brand_url,
-        "bankCountry": brand_country,
-        "bankName": brand_name,
-    }
+    return data
 
-    # URL encode the parameters
-    encoded_params = urlencode(params, doseq=True)
 
-    url = f"{base_url}?{encoded_params}"
+def fetch_harvest_location_data(
+    brand_tag, brand_url="", brand_country="", brand_name="", retry_count=0, max_retries=2
+) -> Union[Dict, Exception]:
+    url = harvest_url("location", brand_tag, brand_url, brand_country, brand_name)
 
     try:
-        response = requests.get(url, headers={"Authorization": f"Token {settings.HARVEST_TOKEN}"})
+        response = http_client.get(
+            "harvest_location", url, headers={"Authorization": f"Token {settings.HARVEST_TOKEN}"}
+        )
 
         # Explicitly check for 524 and 504 status codes
-        if response.status_code in [524, 504]:
+        if response.status_code in RETRYABLE_STATUS_CODES:
             if retry_count < max_retries:
                 print(
                     f"Received {response.status_code} status code. Waiting 2 minutes before retry {retry_count + 1}..."
@@ -106,19 +128,42 @@ def fetch_harvest_location_data(
         return e
 
 
+def stale_before(stale_days=None):
+    """Harvest data refreshed before this is due for a refresh"""
+    days = settings.HARVEST_STALE_DAYS if stale_days is None else stale_days
+    return timezone.now() - timedelta(days=days)
+
+
+def feature_data_is_stale(commentary):
+    return not commentary.feature_refresh_date or commentary.feature_refresh_date < stale_before()
+
+
+def save_commentary_feature_data(commentary, data):
+    """
+    Store a harvest payload. When it hashes the same as the stored one only the refresh
+    date is written. Returns whether the data changed.
+    """
+    commentary.feature_refresh_date = timezone.now()
+    if hash_features(data) == commentary.feature_hash:
+        type(commentary).objects.filter(pk=commentary.pk).update(
+            feature_refresh_date=commentary.feature_refresh_date
+        )
+        return False
+    commentary.feature_json = data
+    commentary.save()
+    return True
+
+
 def update_commentary_feature_data(commentary, overwrite=False):
     """
-    Refresh and persist feature data for the given commentary.
-    Returns the saved commentary on success, or None on failure/no-op.
+    Refresh and persist feature data for the given commentary when `overwrite` or when it
+    is older than HARVEST_STALE_DAYS.
+    Returns the commentary on success, or None on failure/no-op.
     """
     if commentary is None:
         return None
 
-    if (
-        overwrite
-        # or not commentary.feature_refresh_date
-        # or commentary.feature_refresh_date < timezone.now() - timedelta(days=90)
-    ):
+    if overwrite or feature_data_is_stale(commentary):
         data = fetch_harvest_data(
             brand_tag=commentary.brand.tag,
             brand_url=commentary.brand.website,
@@ -126,9 +171,7 @@ def update_commentary_feature_data(commentary, overwrite=False):
             brand_name=commentary.brand.name,
         )
         if isinstance(data, dict):
-            commentary.feature_json = data
-            commentary.feature_refresh_date = timezone.now()
-            commentary.save()
+            save_commentary_feature_data(commentary, data)
             return commentary
         else:
             # Gracefully indicate failure; callers can decide how to report it
@@ -0,0 +1,237 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from brand.models import Commentary, HarvestFeature
+from brand.models.commentary import hash_features
+from brand.utils import query_cache
+from brand.utils.harvest_data import HarvestRetryableError, fetch_harvest_data_once, stale_before
+
+
+def refresh_plan(commentaries, stale_days=None, force=False):
+    """
+    The commentaries of `commentaries` whose harvest data is older than `stale_days`
+    (HARVEST_STALE_DAYS), or all of them with `force`: brands shown on the website first,
+    then the longest unrefreshed first
+    """
+    if not force:
+        commentaries = commentaries.filter(
+            Q(feature_refresh_date__isnull=True)
+            | Q(feature_refresh_date__lt=stale_before(stale_days))
+        )
+    return commentaries.order_by(
+        "-display_on_website", F("feature_refresh_date").asc(nulls_first=True), "pk"
+    )
+
+
+@dataclass
+class HarvestJob:
+    commentary_id: int
+    brand_id: int
+    brand_tag: str
+    brand_url: str = ""
+    brand_country: str = ""
+    brand_name: str = ""
+    feature_hash: str = ""
+    attempts: int = 0
+
+    @classmethod
+    def from_commentary(cls, commentary):
+        brand = commentary.brand
+        return cls(
+            commentary_id=commentary.pk,
+            brand_id=brand.pk,
+            brand_tag=brand.tag,
+            brand_url=brand.website or "",
+            brand_country=brand.countries[0].name if brand.countries else "",
+            brand_name=brand.name,
+            feature_hash=commentary.feature_hash,
+        )
+
+
+@dataclass
+class HarvestRefreshReport:
+    total: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    retries: int = 0
+    # fetched but identical to the stored data, so not written
+    unchanged: int = 0
+    # not fetched, refreshed within the staleness window
+    fresh: int = 0
+    started: float = field(default_factory=time.monotonic)
+    finished: Optional[float] = None
+    errors: dict = field(default_factory=dict)
+
+    @property
+    def done(self):
+        return self.succeeded + self.failed
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def throughput(self):
+        """Brands processed per minute"""
+        return self.done / self.elapsed * 60 if self.elapsed else 0.0
+
+    def summary(self):
+        return (
+            f"Done. Success: {self.succeeded}, Failed: {self.failed}, Retries: {self.retries}, "
+            f"Elapsed: {self.elapsed:.1f}s, Throughput: {self.throughput:.1f} brands/min\n"
+            f"Avoided: {self.fresh} fetches of fresh data, "
+            f"{self.unchanged} writes of unchanged data"
+        )
+
+
+class HarvestRefreshPipeline:
+    """
+    Fetches harvest data for many commentaries concurrently and writes it back in batches.
+
+    `workers` threads issue the HTTP requests, at most `per_host` at a time against the
+    same harvest host. Retryable responses (504/524) are not slept on inside a worker:
+    the job is rescheduled `backoff * 2 ** attempt` seconds later and the worker moves on.
+    Database writes happen on the calling thread, `batch_size` commentaries per bulk_update.
+    Payloads hashing the same as the stored data only have their refresh date written.
+    """
+
+    def __init__(
+        self,
+        workers=8,
+        per_host=4,
+        max_retries=2,
+        backoff=30.0,
+        batch_size=50,
+        timeout=None,
+        fetch: Callable = fetch_harvest_data_once,
+        progress: Optional[Callable] = None,
+    ):
+        self.workers = workers
+        self.per_host = per_host
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.fetch = fetch
+        self.progress = progress
+        self._host_limits = {}
+        self._host_limits_lock = threading.Lock()
+
+    def _host_limit(self, host):
+        with self._host_limits_lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_limits[host]
+
+    def _fetch(self, job):
+        host = urlparse(settings.HARVEST_BASE_URL).netloc
+        with self._host_limit(host):
+            try:
+                return self.fetch(
+                    brand_tag=job.brand_tag,
+                    brand_url=job.brand_url,
+                    brand_country=job.brand_country,
+                    brand_name=job.brand_name,
+                    timeout=self.timeout,
+                )
+            except Exception as e:
+                return e
+
+    def _flush(self, batch):
+        changed = [(commentary, brand_id) for commentary, brand_id, same in batch if not same]
+        unchanged = [commentary.pk for commentary, _, same in batch if same]
+        if changed:
+            # the override may have been edited since the plan was read
+            overrides = dict(
+                Commentary.objects.filter(
+                    pk__in=[commentary.pk for commentary, _ in changed]
+                ).values_list("pk", "feature_override")
+            )
+            for commentary, _ in changed:
+                commentary.feature_override = overrides.get(commentary.pk)
+                commentary.refresh_effective_features()
+            Commentary.objects.bulk_update(
+                [commentary for commentary, _ in changed],
+                ["feature_json", "feature_hash", "effective_features", "feature_refresh_date"],
+                batch_size=self.batch_size,
+            )
+            # bulk_update sends no signals
+            HarvestFeature.sync([commentary for commentary, _ in changed])
+            query_cache.invalidate_brands(brand_id for _, brand_id in changed)
+        if unchanged:
+            Commentary.objects.filter(pk__in=unchanged).update(feature_refresh_date=timezone.now())
+        batch.clear()
+
+    def run(self, commentaries, fresh=0):
+        """Refresh `commentaries`; `fresh` is the number left out of them by refresh_plan"""
+        jobs = deque(HarvestJob.from_commentary(c) for c in commentaries)
+        report = HarvestRefreshReport(total=len(jobs), fresh=fresh)
+        delayed = []
+        sequence = itertools.count()
+        in_flight = {}
+        batch = []
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while jobs or delayed or in_flight:
+                now = time.monotonic()
+                while delayed and delayed[0][0] <= now:
+                    jobs.append(heapq.heappop(delayed)[2])
+                while jobs and len(in_flight) < self.workers:
+                    job = jobs.popleft()
+                    in_flight[pool.submit(self._fetch, job)] = job
+
+                next_retry = delayed[0][0] - now if delayed else None
+                if not in_flight:
+                    # only backed-off jobs left
+                    time.sleep(max(next_retry, 0))
+                    continue
+
+                done, _ = wait(in_flight, timeout=next_retry, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = in_flight.pop(future)
+                    result = future.result()
+
+                    if (
+                        isinstance(result, HarvestRetryableError)
+                        and job.attempts < self.max_retries
+                    ):
+                        delay = self.backoff * 2**job.attempts
+                        job.attempts += 1
+                        report.retries += 1
+                        heapq.heappush(delayed, (time.monotonic() + delay, next(sequence), job))
+                        continue
+
+                    if isinstance(result, dict):
+                        report.succeeded += 1
+                        commentary = Commentary(
+                            pk=job.commentary_id,
+                            feature_json=result,
+                            feature_hash=hash_features(result),
+                            feature_refresh_date=timezone.now(),
+                        )
+                        same = commentary.feature_hash == job.feature_hash
+                        report.unchanged += same
+                        batch.append((commentary, job.brand_id, same))
+                        if len(batch) >= self.batch_size:
+                            self._flush(batch)
+                    else:
+                        report.failed += 1
+                        report.errors[job.brand_tag] = str(result)
+
+                    if self.progress:
+                        self.progress(report, job, result)
+
+        self._flush(batch)
+        report.finished = time.monotonic()
+        return report
@@ -0,0 +1,142 @@
+"""
+Shared HTTP client of the outbound integrations (harvest, Prismic).
+
+One requests.Session per process keeps connections alive in a pool of HTTP_POOL_SIZE per
+host, so a refresh run does one TLS handshake per worker rather than one per brand. Each
+request names its endpoint, which sets its read timeout (HTTP_TIMEOUTS) and the bucket its
+latency and status are counted in, see `metrics`.
+
+Connection errors and 502/503 responses are retried HTTP_RETRIES times with a backoff.
+Read timeouts and harvest's 504/524 are not: the callers already reschedule those
+without holding a connection.
+"""
+
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = (502, 503)
+
+
+class HttpMetrics:
+    """Requests, errors, status codes and latency per endpoint, since the process started"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = defaultdict(
+                lambda: {
+                    "requests": 0,
+                    "errors": 0,
+                    "statuses": Counter(),
+                    "ms": 0.0,
+                    "max_ms": 0.0,
+                }
+            )
+
+    def record(self, endpoint, status, ms):
+        with self._lock:
+            stats = self._endpoints[endpoint]
+            stats["requests"] += 1
+            if status is None:
+                stats["errors"] += 1
+            else:
+                stats["statuses"][status] += 1
+            stats["ms"] += ms
+            stats["max_ms"] = max(stats["max_ms"], ms)
+
+    def snapshot(self):
+        """{endpoint: {requests, errors, statuses, mean_ms, max_ms}}"""
+        with self._lock:
+            return {
+                endpoint: {
+                    "requests": stats["requests"],
+                    "errors": stats["errors"],
+                    "statuses": dict(stats["statuses"]),
+                    "mean_ms": stats["ms"] / stats["requests"],
+                    "max_ms": stats["max_ms"],
+                }
+                for endpoint, stats in self._endpoints.items()
+            }
+
+    def summary(self):
+        return ", ".join(
+            f"{endpoint}: {stats['requests']} requests, {stats['errors']} errors, "
+            f"statuses {stats['statuses']}, mean {stats['mean_ms']:.0f} ms, "
+            f"max {stats['max_ms']:.0f} ms"
+            for endpoint, stats in sorted(self.snapshot().items())
+        )
+
+
+metrics = HttpMetrics()
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _build_session():
+    retry = Retry(
+        total=settings.HTTP_RETRIES,
+        read=0,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=["GET"],
+        backoff_factor=0.5,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=4, pool_maxsize=settings.HTTP_POOL_SIZE, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+    return session
+
+
+def session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = _build_session()
+        return _session
+
+
+def get(endpoint, url, timeout=None, **kwargs):
+    """
+    GET `url` through the shared session with the timeout of `endpoint` unless one is
+    given. Raises like requests.get; the outcome is recorded in `metrics` either way.
+    """
+    read_timeout = timeout or settings.HTTP_TIMEOUTS.get(
+        endpoint, settings.HTTP_TIMEOUTS["default"]
+    )
+    started = time.perf_counter()
+    status = None
+    try:
+        response = session().get(
+            url, timeout=(settings.HTTP_CONNECT_TIMEOUT, read_timeout), **kwargs
+        )
+        status = response.status_code
+        return response
+    finally:
+        ms = (time.perf_counter() - started) * 1000
+        metrics.record(endpoint, status, ms)
+        logger.info(
+            "http %s %s in %.0f ms",
+            endpoint,
+            status or "error",
+            ms,
+            extra={"endpoint": endpoint, "status": status, "duration_ms": ms},
+        )
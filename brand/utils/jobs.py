@@ -0,0 +1,134 @@
+"""
+Runs the queued Job rows, see brand/models/job.py and `manage.py run_jobs`.
+
+The admin only submits jobs, so slow harvest requests never hold a gunicorn worker and
+survive its reloads: a job whose worker died is picked up again after JOB_TIMEOUT.
+"""
+
+import logging
+import os
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import connections
+
+from brand.models import Brand, Commentary, Job
+from brand.utils.brand_locations import refresh_locations
+from brand.utils.harvest_data import fetch_harvest_data_once, save_commentary_feature_data
+
+
+logger = logging.getLogger(__name__)
+
+
+def refresh_features(brand):
+    commentary = getattr(brand, "commentary", None)
+    if commentary is None:
+        commentary = Commentary.objects.create(brand=brand)
+    data = fetch_harvest_data_once(
+        brand_tag=brand.tag,
+        brand_url=brand.website,
+        brand_country=brand.countries[0].name if brand.countries else "",
+        brand_name=brand.name,
+    )
+    # retryable 504/524 responses come back as exceptions too, the queue retries them
+    if isinstance(data, Exception):
+        raise data
+    save_commentary_feature_data(commentary, data)
+
+
+def refresh_brand_locations(brand):
+    fetched, failed = refresh_locations(Brand.objects.filter(pk=brand.pk))
+    if failed:
+        raise Exception(f"{failed} of {fetched + failed} location requests failed")
+
+
+HANDLERS = {
+    Job.Kind.HARVEST_FEATURES: refresh_features,
+    Job.Kind.HARVEST_LOCATIONS: refresh_brand_locations,
+}
+
+
+def run_job(job):
+    """Run a claimed job and record its outcome"""
+    try:
+        HANDLERS[job.kind](job.brand)
+    except Exception as e:
+        logger.warning("job %s (%s of %s) failed: %s", job.pk, job.kind, job.brand.tag, e)
+        job.fail(f"{type(e).__name__}: {e}")
+        return False
+    job.succeed()
+    return True
+
+
+class JobWorker:
+    """
+    Claims due jobs and runs up to `concurrency` of them at a time, in threads when more
+    than one. Looks for new jobs every `poll` seconds when idle, and for the jobs of dead
+    workers every JOB_TIMEOUT / 2 seconds, busy or not.
+    """
+
+    def __init__(self, concurrency=1, poll=5.0, name=None, progress=None):
+        self.concurrency = concurrency
+        self.poll = poll
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.progress = progress or (lambda job, succeeded: None)
+        self._next_requeue = 0.0
+
+    def _run(self, job):
+        succeeded = run_job(job)
+        self.progress(job, succeeded)
+        return succeeded
+
+    def _run_in_thread(self, job):
+        try:
+            return self._run(job)
+        finally:
+            # connections are per thread
+            connections.close_all()
+
+    def _requeue_stale(self):
+        now = time.monotonic()
+        if now >= self._next_requeue:
+            Job.requeue_stale()
+            self._next_requeue = now + settings.JOB_TIMEOUT / 2
+
+    def _idle(self, once):
+        if once:
+            return False
+        time.sleep(self.poll)
+        return True
+
+    def run(self, once=False):
+        """
+        Run jobs as they come due, or until none is due with `once`. Returns the number of
+        jobs run.
+        """
+        done = 0
+        if self.concurrency == 1:
+            while True:
+                self._requeue_stale()
+                job = Job.claim(self.name)
+                if job is not None:
+                    self._run(job)
+                    done += 1
+                elif not self._idle(once):
+                    return done
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            in_flight = set()
+            while True:
+                self._requeue_stale()
+                while len(in_flight) < self.concurrency:
+                    job = Job.claim(self.name)
+                    if job is None:
+                        break
+                    in_flight.add(pool.submit(self._run_in_thread, job))
+                if in_flight:
+                    finished, in_flight = wait(
+                        in_flight, timeout=self.poll, return_when=FIRST_COMPLETED
+                    )
+                    done += len(finished)
+                elif not self._idle(once):
+                    return done
@@ -0,0 +1,39 @@
+import threading
+
+from markdown import Markdown
+from markdown.extensions.footnotes import FootnoteExtension
+
+
+# Commentary text fields served as HTML, mapped to the column holding their rendered HTML
+MARKDOWN_FIELDS = {
+    "headline": "headline_html",
+    "subtitle": "subtitle_html",
+    "description1": "description1_html",
+    "description2": "description2_html",
+    "description3": "description3_html",
+    "from_the_website": "from_the_website_html",
+}
+
+_local = threading.local()
+
+
+def _converter():
+    # Markdown instances hold per-document state, so keep one per thread and reset it
+    converter = getattr(_local, "converter", None)
+    if converter is None:
+        converter = Markdown(
+            extensions=["markdown_link_attr_modifier", FootnoteExtension()],
+            extension_configs={"markdown_link_attr_modifier": {"new_tab": "external_only"}},
+        )
+        _local.converter = converter
+    return converter
+
+
+def render_markdown(text):
+    if not text:
+        return ""
+    converter = _converter()
+    try:
+        return converter.convert(text)
+    finally:
+        converter.reset()
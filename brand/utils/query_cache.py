@@ -0,0 +1,119 @@
+"""
+Result cache for the GraphQL `brands` connection.
+
+Entries hold the evaluated connection payload (brand ids plus the scalar fields the
+`Brand` node renders) rather than a pickled QuerySet, so a hit costs no SQL at all.
+
+Every entry is tagged with the countries it depends on: the `country` filter when one is
+given, otherwise the wildcard tag. A brand can only ever appear in entries tagged with one
+of its countries or the wildcard, so changing a brand only has to invalidate those tags.
+Invalidation bumps a per-tag version token; entries written under an older token are
+treated as misses.
+"""
+
+import hashlib
+import json
+import uuid
+
+from django.core.cache import caches
+
+from brand.utils.countries import country_codes
+
+
+CACHE_ALIAS = "brand_queries"
+CACHE_TIMEOUT = 60 * 20
+ALL_COUNTRIES = "*"
+STATS = ("hits", "misses", "evictions")
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _version_key(tag):
+    return f"brand_query_tag:{tag}"
+
+
+def _stat_key(name):
+    return f"brand_query_stat:{name}"
+
+
+def _incr(key, delta=1):
+    cache = _cache()
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, timeout=None):
+            cache.incr(key, delta)
+
+
+def make_key(args):
+    sorted_args = json.dumps(args, sort_keys=True, default=str)
+    return f"brand_query_cache{hashlib.md5(sorted_args.encode('utf-8')).hexdigest()}"
+
+
+def tags_for(args):
+    country = args.get("country")
+    return [country] if country else [ALL_COUNTRIES]
+
+
+def tag_versions(tags, create=False):
+    cache = _cache()
+    keys = {_version_key(tag): tag for tag in tags}
+    versions = cache.get_many(keys.keys())
+    if create:
+        for key in set(keys) - set(versions):
+            cache.add(key, uuid.uuid4().hex, timeout=None)
+        versions = cache.get_many(keys.keys())
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def lookup(key):
+    """Return the cached (fields, rows) for key, or None if missing or invalidated"""
+    entry = _cache().get(key)
+    if entry and tag_versions(entry["tags"].keys()) == entry["tags"]:
+        _incr(_stat_key("hits"))
+        return entry["fields"], entry["rows"]
+    _incr(_stat_key("misses"))
+    return None
+
+
+def store(key, versions, fields, rows):
+    """
+    `versions` must be read with `tag_versions(tags, create=True)` before the rows are
+    queried, so an invalidation racing with the query leaves the entry stale rather than
+    the cache wrong.
+    """
+    entry = {"tags": versions, "fields": fields, "rows": rows}
+    _cache().set(key, entry, timeout=CACHE_TIMEOUT)
+
+
+def invalidate_countries(countries):
+    """Invalidate every entry that a brand in these countries could appear in"""
+    tags = {ALL_COUNTRIES, *country_codes(countries)}
+    _cache().set_many({_version_key(tag): uuid.uuid4().hex for tag in tags}, timeout=None)
+    _incr(_stat_key("evictions"), len(tags))
+
+
+def invalidate_brands(brand_ids):
+    """Invalidate the entries of brands changed by writes that send no signals (bulk_update)"""
+    from brand.models import Brand
+
+    brand_ids = list(brand_ids)
+    if not brand_ids:
+        return
+    countries = set()
+    for start in range(0, len(brand_ids), 500):
+        chunk = brand_ids[start : start + 500]
+        for value in Brand.objects.filter(pk__in=chunk).values_list("countries", flat=True):
+            countries.update(country_codes(value))
+    invalidate_countries(countries)
+
+
+def stats():
+    values = _cache().get_many([_stat_key(name) for name in STATS])
+    return {name: values.get(_stat_key(name), 0) for name in STATS}
+
+
+def clear():
+    _cache().clear()
@@ -0,0 +1,197 @@
+"""
+Cost and depth limits for /graphql.
+
+Before execution each operation gets an estimated cost: every object the query would
+resolve counts as its field weight (1 unless listed in FIELD_WEIGHTS) times the number of
+times its parent is resolved. Connections are sized by their `first`/`last` argument,
+capped at RELAY_CONNECTION_MAX_LIMIT, which is also the size assumed without one. Other
+lists of objects are assumed to hold DEFAULT_LIST_SIZE items, or as many as the argument
+named in LIST_SIZE_ARGUMENTS. Operations over GRAPHQL_MAX_QUERY_COST or nested deeper
+than GRAPHQL_MAX_QUERY_DEPTH fail validation, so nothing runs for them.
+"""
+
+from django.conf import settings
+
+from graphene_django.settings import graphene_settings
+from graphql import (
+    FieldNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    GraphQLList,
+    GraphQLObjectType,
+    ValidationRule,
+    get_named_type,
+    get_nullable_type,
+    value_from_ast_untyped,
+)
+
+
+# cost of resolving a field once, per object
+FIELD_WEIGHTS = {
+    # read from the brand row, no query
+    "Brand.countries": 0,
+    # filters the whole feature_json in Python
+    "Brand.harvestData": 2,
+    "Commentary.harvestData": 2,
+    "HarvestDataDictionary.features": 2,
+}
+# list fields whose size is the length of one of their arguments
+LIST_SIZE_ARGUMENTS = {"Query.brandsByIdentifier": "values"}
+DEFAULT_LIST_SIZE = 10
+
+
+def _is_connection(graphql_type):
+    return isinstance(graphql_type, GraphQLObjectType) and {"edges", "pageInfo"} <= set(
+        graphql_type.fields
+    )
+
+
+def _is_edge(graphql_type):
+    return isinstance(graphql_type, GraphQLObjectType) and {"node", "cursor"} <= set(
+        graphql_type.fields
+    )
+
+
+class QueryCost:
+    """Estimated cost and depth of one operation"""
+
+    def __init__(self, context, variables):
+        self.context = context
+        self.variables = variables or {}
+        self.max_limit = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+
+    def of_operation(self, operation):
+        schema = self.context.schema
+        root_type = getattr(schema, f"{operation.operation.value}_type")
+        return self.of_selection_set(operation.selection_set, root_type, 1, set())
+
+    def of_selection_set(self, selection_set, parent_type, multiplier, fragments):
+        """(cost, depth) of a selection set resolved `multiplier` times"""
+        cost, depth = 0, 0
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                field_cost, field_depth = self.of_field(
+                    selection, parent_type, multiplier, fragments
+                )
+            else:
+                if isinstance(selection, FragmentSpreadNode):
+                    name = selection.name.value
+                    fragment = self.context.get_fragment(name)
+                    # unknown fragments and cycles are reported by the standard rules
+                    if fragment is None or name in fragments:
+                        continue
+                    seen = fragments | {name}
+                else:
+                    fragment, seen = selection, fragments
+                type_condition = fragment.type_condition
+                fragment_type = (
+                    self.context.schema.get_type(type_condition.name.value)
+                    if type_condition
+                    else parent_type
+                )
+                if not isinstance(fragment_type, GraphQLObjectType):
+                    # interfaces: price the selections against the parent type
+                    fragment_type = parent_type
+                field_cost, field_depth = self.of_selection_set(
+                    fragment.selection_set, fragment_type, multiplier, seen
+                )
+            cost += field_cost
+            depth = max(depth, field_depth)
+        return cost, depth
+
+    def of_field(self, node, parent_type, multiplier, fragments):
+        name = node.name.value
+        field = getattr(parent_type, "fields", {}).get(name)
+        if name.startswith("__") or field is None or node.selection_set is None:
+            return 0, 0
+
+        key = f"{parent_type.name}.{name}"
+        field_type = get_nullable_type(field.type)
+        named_type = get_named_type(field_type)
+        if key in FIELD_WEIGHTS:
+            weight = FIELD_WEIGHTS[key]
+        elif _is_connection(parent_type) or _is_edge(parent_type):
+            # edges and page info come with the connection
+            weight = 1 if name == "node" else 0
+        else:
+            weight = 1
+
+        size = 1
+        if isinstance(field_type, GraphQLList):
+            size = self.list_size(node, key, parent_type)
+        objects = multiplier * size
+
+        if _is_connection(named_type):
+            # the connection resolves once, its edges as many times as it is sized
+            objects = multiplier
+            node_multiplier = multiplier * self.connection_size(node)
+        else:
+            node_multiplier = objects
+        children_cost, children_depth = self.of_selection_set(
+            node.selection_set, named_type, node_multiplier, fragments
+        )
+        return objects * weight + children_cost, children_depth + 1
+
+    def arguments(self, node):
+        return {
+            argument.name.value: value_from_ast_untyped(argument.value, self.variables)
+            for argument in node.arguments
+        }
+
+    def connection_size(self, node):
+        arguments = self.arguments(node)
+        size = arguments.get("first") or arguments.get("last")
+        if not isinstance(size, int):
+            # missing, or a bad variable that execution will reject anyway
+            return self.max_limit
+        return max(0, min(size, self.max_limit))
+
+    def list_size(self, node, key, parent_type):
+        if _is_connection(parent_type):
+            # `edges`, already sized by the connection
+            return 1
+        if key in LIST_SIZE_ARGUMENTS:
+            return len(self.arguments(node).get(LIST_SIZE_ARGUMENTS[key]) or [])
+        if parent_type is self.context.schema.query_type:
+            return self.max_limit
+        return DEFAULT_LIST_SIZE
+
+
+def cost_limit_rule(variables, report):
+    """
+    Validation rule rejecting operations over the cost and depth limits. The estimate of
+    each operation is recorded in `report` by operation name.
+    """
+
+    class QueryCostRule(ValidationRule):
+        def enter_operation_definition(self, node, *_):
+            cost, depth = QueryCost(self.context, variables).of_operation(node)
+            report[node.name.value if node.name else None] = cost
+            if cost > settings.GRAPHQL_MAX_QUERY_COST:
+                self.report_error(
+                    GraphQLError(
+                        f"Query cost {cost} exceeds the limit of "
+                        f"{settings.GRAPHQL_MAX_QUERY_COST}, request fewer items with "
+                        f"`first` or select fewer nested objects",
+                        node,
+                    )
+                )
+            if depth > settings.GRAPHQL_MAX_QUERY_DEPTH:
+                self.report_error(
+                    GraphQLError(
+                        f"Query depth {depth} exceeds the limit of "
+                        f"{settings.GRAPHQL_MAX_QUERY_DEPTH}",
+                        node,
+                    )
+                )
+
+    return QueryCostRule
+
+
+def count_objects(data):
+    """Objects in an execution result, the actual counterpart of the estimate"""
+    if isinstance(data, dict):
+        return 1 + sum(count_objects(value) for value in data.values())
+    if isinstance(data, list):
+        return sum(count_objects(value) for value in data)
+    return 0
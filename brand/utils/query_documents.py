@@ -0,0 +1,98 @@
+"""
+Parsed and validated GraphQL documents, kept in a per-process LRU keyed by the SHA-256 of
+the query text, so the dozen documents the frontend sends over and over are parsed and
+validated once per worker.
+
+Only the standard validation rules are cached: the cost limit depends on the variables of
+each request, see brand/utils/query_cost.py.
+"""
+
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from graphene_django.settings import graphene_settings
+from graphql import GraphQLError, parse, specified_rules, validate
+
+from brand.models import PersistedQuery
+
+
+class PersistedQueryNotFound(Exception):
+    pass
+
+
+class DocumentCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            document = self._documents.get(key)
+            if document is not None:
+                self._documents.move_to_end(key)
+            return document
+
+    def put(self, key, document):
+        with self._lock:
+            self._documents[key] = document
+            self._documents.move_to_end(key)
+            while len(self._documents) > self.maxsize:
+                self._documents.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._documents.clear()
+
+    def __len__(self):
+        return len(self._documents)
+
+
+documents = DocumentCache(settings.GRAPHQL_DOCUMENT_CACHE_SIZE)
+
+
+def persisted_query_hash(extensions):
+    """sha256Hash of an Apollo `persistedQuery` extension, or None"""
+    persisted = (extensions or {}).get("persistedQuery") if isinstance(extensions, dict) else None
+    return persisted.get("sha256Hash") if isinstance(persisted, dict) else None
+
+
+def get_document(schema, query=None, query_hash=None, persist=False):
+    """
+    (document, errors) for `query`, or for the registered document of `query_hash` when
+    no query is sent. Raises PersistedQueryNotFound for an unknown hash. With `persist`
+    and GRAPHQL_AUTO_PERSIST_QUERIES, a valid query sent with its hash is registered.
+    """
+    if query_hash and query and PersistedQuery.hash(query) != query_hash:
+        return None, [GraphQLError("provided sha does not match query")]
+    key = query_hash or PersistedQuery.hash(query)
+    if query_hash and query and persist and settings.GRAPHQL_AUTO_PERSIST_QUERIES:
+        document, errors = _document(schema, key, query)
+        if document is not None:
+            PersistedQuery.objects.get_or_create(sha256=key, defaults={"query": query})
+        return document, errors
+    return _document(schema, key, query)
+
+
+def _document(schema, key, query):
+    document = documents.get(key)
+    if document is not None:
+        return document, []
+
+    if not query:
+        query = PersistedQuery.objects.filter(sha256=key).values_list("query", flat=True).first()
+        if query is None:
+            raise PersistedQueryNotFound(key)
+
+    try:
+        document = parse(query)
+    except GraphQLError as e:
+        return None, [e]
+    errors = validate(schema, document, specified_rules, graphene_settings.MAX_VALIDATION_ERRORS)
+    if errors:
+        return None, errors
+
+    documents.put(key, document)
+    return document, []
@@ -0,0 +1,53 @@
+from collections import defaultdict, deque
+from typing import Dict, Iterable, Optional, Tuple
+
+from brand.models.commentary import RatingChoice
+
+
+def resolve_inherited_ratings(
+    rows: Iterable[Tuple[int, str, Optional[int]]]
+) -> Tuple[Dict[int, str], set]:
+    """
+    Resolve the effective rating of every brand in the inheritance graph in one pass.
+
+    `rows` are (brand_id, rating, inherit_brand_rating_id) tuples, one per commentary.
+    Brands with a direct rating are the roots of the graph and their rating is pushed down
+    to inheritors breadth first. Inheritors that are never reached either point at a brand
+    without a commentary or sit in (or downstream of) a cycle; both resolve to UNKNOWN.
+
+    Returns a brand_id -> rating dict and the set of brand ids that could not be reached
+    from a root because of a cycle.
+    """
+    own_rating = {}
+    inheritors = defaultdict(list)
+    inherits_from = {}
+
+    for brand_id, rating, parent_id in rows:
+        own_rating[brand_id] = rating
+        if rating == RatingChoice.INHERIT and parent_id is not None:
+            inheritors[parent_id].append(brand_id)
+            inherits_from[brand_id] = parent_id
+
+    resolved = {}
+    queue = deque()
+    for brand_id, rating in own_rating.items():
+        if rating != RatingChoice.INHERIT:
+            resolved[brand_id] = rating
+            queue.append(brand_id)
+        elif inherits_from.get(brand_id) not in own_rating:
+            # nothing to inherit from: no parent, or parent has no commentary
+            resolved[brand_id] = RatingChoice.UNKNOWN
+            queue.append(brand_id)
+
+    while queue:
+        parent_id = queue.popleft()
+        for brand_id in inheritors.get(parent_id, ()):
+            if brand_id not in resolved:
+                resolved[brand_id] = resolved[parent_id]
+                queue.append(brand_id)
+
+    cyclic = set(own_rating) - set(resolved)
+    for brand_id in cyclic:
+        resolved[brand_id] = RatingChoice.UNKNOWN
+
+    return resolved, cyclic
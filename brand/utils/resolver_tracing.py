@@ -0,0 +1,138 @@
+"""
+Per resolver wall time, SQL count and SQL time of /graphql requests.
+
+A request is traced when it asks for it with the `X-GraphQL-Tracing` header, the result
+then comes back under `extensions.tracing`, or when it is sampled at
+GRAPHQL_TRACING_SAMPLE_RATE. The header is only honoured from a staff session (`true`) or
+with the GRAPHQL_TRACING_TOKEN as its value, and those responses are not cached. Traced
+requests are stored as ResolverTrace rows whose rolling aggregate staff can see on
+/resolver_stats/. Untraced requests run without the middleware.
+
+Times are per resolver call. Lists returned as lazy querysets are evaluated by the executor
+after their resolver returned; their SQL is counted under EXECUTOR.
+"""
+
+import hmac
+import random
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+from brand.models import ResolverTrace
+
+
+HEADER = "X-GraphQL-Tracing"
+EXECUTOR = "(executor)"
+
+
+def wants_tracing(request):
+    value = request.headers.get(HEADER, "")
+    if not value:
+        return False
+    if settings.GRAPHQL_TRACING_TOKEN and hmac.compare_digest(
+        value.encode(), settings.GRAPHQL_TRACING_TOKEN.encode()
+    ):
+        return True
+    user = getattr(request, "user", None)
+    return value.lower() in ("1", "true") and bool(user and user.is_staff)
+
+
+def sampled():
+    return random.random() < settings.GRAPHQL_TRACING_SAMPLE_RATE
+
+
+class ResolverTracer:
+    """Graphene middleware plus a connection.execute_wrapper, for a single request"""
+
+    def __init__(self):
+        # "Type.field": [calls, ms, sql count, sql ms]
+        self.fields = defaultdict(lambda: [0, 0.0, 0, 0.0])
+        self.stack = []
+        self.sql_count = 0
+        self.started = time.perf_counter()
+
+    def resolve(self, next, root, info, **args):
+        key = f"{info.parent_type.name}.{info.field_name}"
+        self.stack.append(key)
+        started = time.perf_counter()
+        try:
+            return next(root, info, **args)
+        finally:
+            self.stack.pop()
+            stats = self.fields[key]
+            stats[0] += 1
+            stats[1] += (time.perf_counter() - started) * 1000
+
+    def execute_sql(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            stats = self.fields[self.stack[-1] if self.stack else EXECUTOR]
+            stats[2] += 1
+            stats[3] += (time.perf_counter() - started) * 1000
+            self.sql_count += 1
+
+    @property
+    def duration_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def as_extension(self):
+        return {
+            "version": 1,
+            "duration_ms": round(self.duration_ms, 3),
+            "sql_count": self.sql_count,
+            "resolvers": [
+                {
+                    "field": key,
+                    "calls": calls,
+                    "duration_ms": round(ms, 3),
+                    "sql_count": sql_count,
+                    "sql_ms": round(sql_ms, 3),
+                }
+                for key, (calls, ms, sql_count, sql_ms) in sorted(
+                    self.fields.items(), key=lambda item: -item[1][1]
+                )
+            ],
+        }
+
+    def record(self, operation_name):
+        trace = ResolverTrace.objects.create(
+            operation_name=operation_name or "",
+            duration_ms=self.duration_ms,
+            sql_count=self.sql_count,
+            fields=dict(self.fields),
+        )
+        # prune every so often rather than on every insert
+        if trace.pk % 100 == 0:
+            ResolverTrace.objects.filter(pk__lte=trace.pk - settings.GRAPHQL_TRACING_KEEP).delete()
+
+
+def aggregate(traces):
+    """
+    Rows of {field, calls, duration_ms, mean_ms, sql_count, sql_ms, per_request_ms} over
+    `traces`, slowest in total first
+    """
+    totals = defaultdict(lambda: [0, 0.0, 0, 0.0])
+    requests = 0
+    for fields in traces.values_list("fields", flat=True):
+        requests += 1
+        for key, values in fields.items():
+            total = totals[key]
+            for i, value in enumerate(values):
+                total[i] += value
+    return [
+        {
+            "field": key,
+            "calls": calls,
+            "duration_ms": ms,
+            "mean_ms": ms / calls if calls else 0,
+            "sql_count": sql_count,
+            "sql_ms": sql_ms,
+            "per_request_ms": ms / requests,
+        }
+        for key, (calls, ms, sql_count, sql_ms) in sorted(
+            totals.items(), key=lambda item: -item[1][1]
+        )
+    ]
@@ -0,0 +1,62 @@
+"""
+Helpers for the persistent duplicate index, see brand/models/brand_duplicate.py.
+
+Candidates are generated the way SymSpell does it: every term is stored with all variants
+of its prefix that have up to `MAX_DISTANCE` characters deleted. Two terms within that edit
+distance share at least one such variant, so candidates are an indexed equality lookup
+and only they need an actual edit distance check.
+"""
+
+import re
+from itertools import combinations
+
+from symspellpy.editdistance import DistanceAlgorithm, EditDistance
+
+
+MAX_DISTANCE = 2
+PREFIX_LENGTH = 7
+
+NAME = "name"
+TAG = "tag"
+WEBSITE = "website"
+
+_edit_distance = EditDistance(DistanceAlgorithm.DAMERAU_OSA)
+
+
+def normalize_text(value):
+    return re.sub(r"\s+", " ", (value or "").strip().lower())
+
+
+def normalize_website(value):
+    """bankofamerica.com, https://www.bankofamerica.com/ and http://bankofamerica.com match"""
+    value = normalize_text(value)
+    value = re.sub(r"^[a-z]+://", "", value)
+    value = re.sub(r"^www\.", "", value)
+    return value.rstrip("/")
+
+
+def brand_terms(brand):
+    """(kind, term) pairs a brand is indexed under, aliases compare against names"""
+    terms = {(NAME, normalize_text(brand.name)), (TAG, normalize_text(brand.tag))}
+    terms.update((NAME, normalize_text(alias)) for alias in (brand.aliases or "").split(","))
+    terms.add((WEBSITE, normalize_website(brand.website)))
+    return {(kind, term) for kind, term in terms if term}
+
+
+def delete_keys(term):
+    prefix = term[:PREFIX_LENGTH]
+    keys = {prefix}
+    for distance in range(1, min(MAX_DISTANCE, len(prefix) - 1) + 1):
+        for removed in combinations(range(len(prefix)), distance):
+            keys.add("".join(c for i, c in enumerate(prefix) if i not in removed))
+    return keys
+
+
+def distance(a, b):
+    """Edit distance of a and b, or None when it is over MAX_DISTANCE"""
+    result = _edit_distance.compare(a, b, MAX_DISTANCE)
+    return None if result < 0 else result
+
+
+def score(a, b, edit_distance):
+    return 1 - edit_distance / max(len(a), len(b))
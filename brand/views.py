@@ -1,36 +1,65 @@
-import csv
 import json
-import os
-import pathlib
+import logging
+import time
+from contextlib import nullcontext
 from datetime import datetime
 from uuid import uuid4
 
 from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.models import User
 from django.contrib.auth.views import PasswordResetView
-from django.core import serializers
 from django.core.cache import cache
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.paginator import Paginator
+from django.db import connection, transaction
 from django.forms import inlineformset_factory
 from django.forms.models import model_to_dict
-from django.http import Http404, HttpResponse
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseNotAllowed,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import redirect, render
 from django.urls import reverse, reverse_lazy
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from django.views.generic import CreateView
 
 from dal import autocomplete
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.views import GraphQLView, HttpError
+from graphql import (
+    ExecutionResult,
+    GraphQLError,
+    OperationType,
+    execute,
+    get_operation_ast,
+    validate,
+    validate_schema,
+)
 
-from scripts.check_duplicates import return_all_duplicates
 from scripts.find_missing_brands_vs_pages import (
+    brand_tag_pks,
     get_missing_brand_and_bankpages,
     get_missing_sfi_brands_and_pages,
+    get_prismic_listings,
     get_ref_id,
 )
-from utils.brand_utils import concat_brand_feature_data, get_institution_data
 
 from .forms import BrandFeaturesForm
-from .models import Brand, BrandFeature
+from .models import Brand, BrandDuplicate, BrandFeature, ResolverTrace
 from .models.commentary import InstitutionCredential, InstitutionType
+from .utils import csv_export, query_cache, resolver_tracing
+from .utils.query_cost import cost_limit_rule, count_objects
+from .utils.query_documents import PersistedQueryNotFound, get_document, persisted_query_hash
+
+
+logger = logging.getLogger(__name__)
+
+DUPLICATES_PER_PAGE = 50
 
 
 def update_success(request):
@@ -52,94 +81,28 @@ def calendar_redirect(request):
     return redirect(settings.SEMI_PUBLIC_CALENDAR_URL)
 
 
-def serialize_brand_model_to_json():
-    """
-    serialize brand, commentary, brandfeature models
-    save model into json format
-
-    """
-
-    results = []
-    institute_dict = {}
-
-    brand_instances = Brand.objects.select_related("commentary").all()
-    instutute_type_data, instutute_credential_data = get_institution_data()
-
-    for brand_instance in brand_instances:
-        brand_serialized_data = serializers.serialize(
-            "json", [brand_instance], use_natural_primary_keys=True, use_natural_foreign_keys=True
-        )
-        try:
-            commentary_serialized_data = serializers.serialize(
-                "json",
-                [brand_instance.commentary],
-                use_natural_primary_keys=True,
-                use_natural_foreign_keys=True,
-            )
-        except ObjectDoesNotExist:
-            pass
-
-        brand_data = json.loads(brand_serialized_data)
-        commentary_data = json.loads(commentary_serialized_data)
-
-        feature_data = concat_brand_feature_data(brand_id=brand_data[0]["pk"])
-
-        institute_dict["institution_type"] = ",".join([data.name for data in instutute_type_data])
-        institute_dict["institution_credentials"] = ",".join(
-            [data.name for data in instutute_credential_data]
-        )
-
-        brand_data[0]["fields"]["brand_id"] = brand_data[0]["pk"]
-        brand_data[0]["fields"]["countries"] = ",".join(
-            [country.name for country in brand_instance.countries]
-        )
-        brand_data[0]["fields"].update(commentary_data[0]["fields"])
-        brand_data[0]["fields"].update(feature_data)
-        brand_data[0]["fields"].update(institute_dict)
-        results.append(json.loads(json.dumps(brand_data[0])))
-
-    with open(r"data.json", "w") as file:
-        json.dump(results, file)
-
-
 def export_csv(request):
     """
     This function is used to export Brand related data into the csv file.
+    Rows are streamed in chunks, see brand/utils/csv_export.py.
     """
-
-    downloads_path = str(pathlib.Path.home() / "Downloads")
     csv_file_name = f"data_{datetime.now().strftime('%Y_%m_%d-%I_%M_%S_%p')}.csv"
 
-    file_location = downloads_path + "/" + csv_file_name
-
-    response = HttpResponse(content_type="text/csv")
+    response = StreamingHttpResponse(csv_export.iter_csv_lines(), content_type="text/csv")
     response["Content-Disposition"] = f"attachment;filename={csv_file_name}"
-
-    serialize_brand_model_to_json()
-
-    with open("data.json") as json_file:
-        data = json.loads(json_file.read())
-
-    # remove data.json file
-    os.remove("data.json")
-
-    # Create a CSV writer object
-    csv_writer = csv.writer(response)
-
-    # Write the header (column names)
-    header = sorted(data[0]["fields"].keys())
-    csv_writer.writerow(header)
-
-    # Write the data rows
-    for item in data:
-        csv_writer.writerow(dict(sorted(item["fields"].items())).values())
-
     return response
 
 
 def check_duplicates(request):
-    suggested_duplicates = return_all_duplicates()
-    return render(request, "button.html", context={"suggested_duplicates": suggested_duplicates})
+    """
+    Paginated duplicate candidates, most similar first.
+    Read from the index kept up to date on Brand save, see brand/models/brand_duplicate.py.
+    """
+    candidates = BrandDuplicate.objects.select_related("brand", "duplicate_of").only(
+        "kind", "distance", "score", "brand__name", "duplicate_of__name"
+    )
+    page = Paginator(candidates, DUPLICATES_PER_PAGE).get_page(request.GET.get("page"))
+    return render(request, "button.html", context={"page": page})
 
 
 def check_prismic_mismatches(request):
@@ -148,9 +111,15 @@ def check_prismic_mismatches(request):
     """
     missing_brands_pages = {}
     ref = get_ref_id()
+    listings = get_prismic_listings(ref, ["bankpage", "sfipage"]) if ref else {}
+    tag_pks = brand_tag_pks()
 
-    missing_brands_pages.update(get_missing_brand_and_bankpages(ref))
-    missing_brands_pages.update(get_missing_sfi_brands_and_pages(ref))
+    missing_brands_pages.update(
+        get_missing_brand_and_bankpages(ref, listings.get("bankpage"), tag_pks)
+    )
+    missing_brands_pages.update(
+        get_missing_sfi_brands_and_pages(ref, listings.get("sfipage"), tag_pks)
+    )
 
     return render(
         request,
@@ -161,13 +130,41 @@ def check_prismic_mismatches(request):
 
 def clear_cache(request):
     """
-    Clears django.core.cache, as used by the graphql brand queries
-    at bankgreen-django/brand/schema.py > resolve_brands
+    Clears django.core.cache and the graphql brand query cache
+    at bankgreen-django/brand/utils/query_cache.py.
+    Brand, Commentary and BrandFeature changes already evict the affected entries.
     """
     cache.clear()
+    query_cache.clear()
     return HttpResponse(status=204)
 
 
+@staff_member_required
+def brand_query_cache_stats(request):
+    """
+    Return hit, miss and eviction counters of the graphql brand query cache
+    """
+    return JsonResponse(query_cache.stats())
+
+
+@staff_member_required
+def resolver_stats(request):
+    """
+    GraphQL resolver timings aggregated over the latest traced requests,
+    see brand/utils/resolver_tracing.py
+    """
+    traces = ResolverTrace.objects.order_by("-pk")[: settings.GRAPHQL_TRACING_KEEP]
+    return render(
+        request,
+        "resolver_stats.html",
+        context={
+            "rows": resolver_tracing.aggregate(traces),
+            "requests": traces.count(),
+            "sample_rate": settings.GRAPHQL_TRACING_SAMPLE_RATE,
+        },
+    )
+
+
 class CustomPasswordResetView(PasswordResetView):
     def form_valid(self, form):
         # Verifying if the email belong to registered user
@@ -176,3 +173,157 @@ class CustomPasswordResetView(PasswordResetView):
             return super().form_valid(form)
         else:
             return render(self.request, "registration/email_not_found.html", {"email": email})
+
+
+class BrandGraphQLView(GraphQLView):
+    """
+    GraphQLView that
+    - runs persisted queries sent as a SHA-256 hash only, so GET requests carrying just the
+      hash and variables can be cached by the CDN
+    - reuses parsed and validated documents, see brand/utils/query_documents.py
+    - rejects queries over the cost and depth limits before running them, see
+      brand/utils/query_cost.py, and logs the estimated against the actual cost of each.
+    - times every resolver of traced requests, see brand/utils/resolver_tracing.py.
+    """
+
+    tracer = None
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        estimates = {}
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        if resolver_tracing.wants_tracing(request) or resolver_tracing.sampled():
+            self.tracer = resolver_tracing.ResolverTracer()
+        trace_sql = (
+            connection.execute_wrapper(self.tracer.execute_sql) if self.tracer else nullcontext()
+        )
+
+        started = time.monotonic()
+        with connection.execute_wrapper(count_query), trace_sql:
+            result = self._execute(
+                request, data, query, variables, operation_name, show_graphiql, estimates
+            )
+        if estimates:
+            if operation_name is None and len(estimates) == 1:
+                operation_name = next(iter(estimates))
+            if self.tracer and result and result.data is not None:
+                self.tracer.record(operation_name)
+            logger.info(
+                "graphql %s: estimated cost %d, actual %d objects, %d queries, %.0f ms%s",
+                operation_name or "anonymous",
+                estimates.get(operation_name, max(estimates.values())),
+                count_objects(result.data if result else None),
+                queries,
+                (time.monotonic() - started) * 1000,
+                ", rejected" if result and result.errors and result.data is None else "",
+            )
+        return result
+
+    def dispatch(self, request, *args, **kwargs):
+        response = super().dispatch(request, *args, **kwargs)
+        # the tracing header changes the response, and traced ones carry timings
+        patch_vary_headers(response, [resolver_tracing.HEADER])
+        if self.tracer is not None and resolver_tracing.wants_tracing(request):
+            patch_cache_control(response, private=True, no_store=True)
+        return response
+
+    def get_middleware(self, request):
+        middleware = super().get_middleware(request)
+        if self.tracer is None:
+            return middleware
+        return [*(middleware or []), self.tracer]
+
+    def json_encode(self, request, d, pretty=False):
+        if self.tracer is not None and resolver_tracing.wants_tracing(request):
+            d = {**d, "extensions": {"tracing": self.tracer.as_extension()}}
+        return super().json_encode(request, d, pretty)
+
+    def _execute(self, request, data, query, variables, operation_name, show_graphiql, estimates):
+        extensions = request.GET.get("extensions") or data.get("extensions")
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+        query_hash = persisted_query_hash(extensions)
+
+        if not query and not query_hash:
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        schema = self.schema.graphql_schema
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return ExecutionResult(data=None, errors=schema_validation_errors)
+
+        try:
+            # auto persisting is for development, anonymous clients never add documents
+            document, errors = get_document(
+                schema, query, query_hash, persist=request.user.is_staff
+            )
+        except PersistedQueryNotFound:
+            # tells Apollo style clients to resend the hash along with the query
+            return ExecutionResult(data=None, errors=[GraphQLError("PersistedQueryNotFound")])
+        if errors:
+            return ExecutionResult(data=None, errors=errors)
+
+        # the rest follows GraphQLView.execute_graphql_request, which parses the query itself
+        operation_ast = get_operation_ast(document, operation_name)
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    f"Can only perform a {operation_ast.operation.value} operation from a POST "
+                    "request.",
+                )
+            )
+
+        # the standard rules ran when the document was cached
+        errors = validate(
+            schema,
+            document,
+            [*(self.validation_rules or ()), cost_limit_rule(variables, estimates)],
+            graphene_settings.MAX_VALIDATION_ERRORS,
+        )
+        if errors:
+            return ExecutionResult(data=None, errors=errors)
+
+        try:
+            execute_options = {
+                "root_value": self.get_root_value(request),
+                "context_value": self.get_context(request),
+                "variable_values": variables,
+                "operation_name": operation_name,
+                "middleware": self.get_middleware(request),
+                "execution_context_class": self.execution_context_class,
+            }
+            if (
+                operation_ast is not None
+                and operation_ast.operation == OperationType.MUTATION
+                and (
+                    graphene_settings.ATOMIC_MUTATIONS is True
+                    or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+                )
+            ):
+                with transaction.atomic():
+                    result = execute(schema, document, **execute_options)
+                    if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                        transaction.set_rollback(True)
+                return result
+            return execute(schema, document, **execute_options)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
@@ -1,47 +1,23 @@
 from django.urls import reverse
 
-from symspellpy import SymSpell, Verbosity
-
-from brand.models import Brand
+from brand.models import BrandDuplicate
 
 
 def return_all_duplicates():
-    # fetch all brands from Brand.models
-    all_objects = Brand.objects.all()
-
-    name_comparison = SymSpell()
-    tag_comparison = SymSpell()
-    name_or_tag_to_pk = {}
-    pk_to_name = {}
-
-    # For each object add its name and tag to dictionary and map them to pk and then map each pk to a name
-    for object in all_objects:
-        name_comparison.create_dictionary_entry(object.name, 1)
-        tag_comparison.create_dictionary_entry(object.tag, 1)
-        name_or_tag_to_pk[object.name] = object.pk
-        name_or_tag_to_pk[object.tag] = object.pk
-        pk_to_name[object.pk] = object.name
-
+    """
+    Map (brand name, admin url) to the set of (name, admin url) of its possible duplicates.
+    Read from the duplicate index, see brand/models/brand_duplicate.py.
+    """
     relation_dictionary = {}
-
-    # Find all relations and then add a tuple of object name and url to dictionary
-
-    for object in all_objects:
-        name_matches = name_comparison.lookup(object.name, Verbosity.ALL)
-        tag_matches = tag_comparison.lookup(object.tag, Verbosity.ALL)
-        source_object_url = reverse("admin:brand_brand_change", args=(str(object.pk),))
-        relation_dictionary[(object.name, source_object_url)] = set()
-
-        for possible_match in name_matches[1:] + tag_matches[1:]:
-            possible_match_pk = name_or_tag_to_pk[possible_match.term]
-            possible_match_name = pk_to_name[possible_match_pk]
-
-            if possible_match_pk < object.pk:
-                possible_match_url = reverse(
-                    "admin:brand_brand_change", args=(str(possible_match_pk),)
-                )
-                relation_dictionary[(object.name, source_object_url)].add(
-                    (possible_match_name, possible_match_url)
-                )
-
+    candidates = BrandDuplicate.objects.select_related("brand", "duplicate_of").order_by(
+        "brand_id", "duplicate_of_id"
+    )
+    for candidate in candidates.iterator():
+        source_object_url = reverse("admin:brand_brand_change", args=(str(candidate.brand_id),))
+        possible_match_url = reverse(
+            "admin:brand_brand_change", args=(str(candidate.duplicate_of_id),)
+        )
+        relation_dictionary.setdefault((candidate.brand.name, source_object_url), set()).add(
+            (candidate.duplicate_of.name, possible_match_url)
+        )
     return relation_dictionary
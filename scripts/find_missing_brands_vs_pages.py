@@ -2,13 +2,16 @@ import itertools
 import json
 import re
 import time
+from concurrent.futures import ThreadPoolExecutor
 
+from django.core.cache import cache
 from django.urls import reverse
 
 import requests
 from unidecode import unidecode
 
 from brand.models import Brand, Commentary
+from brand.utils import http_client
 
 
 prismic_base_url = "https://bankgreen.cdn.prismic.io/api/v2"
@@ -17,7 +20,7 @@ prismic_filter_documents_url = "/documents/search"
 
 def get_ref_id():
     try:
-        response = requests.get(prismic_base_url)
+        response = http_client.get("prismic", prismic_base_url)
         if response.status_code == 200:
             response = response.json()
             print(f"reference number is : {response['refs'][0]['ref']}")
@@ -30,34 +33,89 @@ def get_ref_id():
         raise SystemExit(e)
 
 
-def get_prismic_documents(document_type, ref_number):
-    bank_uids = []
+# complete listings are cached per ref, which only changes when something is published
+LISTING_CACHE_TIMEOUT = 60 * 60 * 24
+PRISMIC_PAGE_SIZE = 100
+PRISMIC_WORKERS = 8
 
-    if (not document_type) or (not ref_number):
-        return None
 
-    # document_url = prismic_filter_documents_url.replace("DOCUMENTTYPE", document_type.lower()).replace('RRRR', ref_number).replace('PGNUMBER', pg_number)
-    params = {"q": f'[[at(document.type,"{document_type}")]]', "ref": ref_number, "page": 1}
-    url = prismic_base_url + prismic_filter_documents_url
+def _search_page(document_type, ref_number, page):
+    """One page of the documents of `document_type`, None when Prismic didn't answer 200"""
+    params = {
+        "q": f'[[at(document.type,"{document_type}")]]',
+        "ref": ref_number,
+        "page": page,
+        "pageSize": PRISMIC_PAGE_SIZE,
+    }
+    response = http_client.get(
+        "prismic", prismic_base_url + prismic_filter_documents_url, params=params
+    )
+    return response.json() if response.status_code == 200 else None
 
-    while url:
-        try:
-            response = requests.get(url, params=params)
 
-            params = None
-            if response.status_code == 200:
-                response_body = response.json()
+def get_prismic_listings(ref_number, document_types):
+    """
+    {document type: uids of its documents at `ref_number`}. The first pages of every type
+    are fetched at once, then all their remaining pages at once.
+    """
+    listings = {}
+    for document_type in document_types:
+        cached = cache.get(f"prismic_uids:{ref_number}:{document_type}")
+        if cached is not None:
+            listings[document_type] = cached
+    missing = [document_type for document_type in document_types if document_type not in listings]
+    if not missing:
+        return listings
 
-                for result in response_body["results"]:
-                    bank_uids.append(result["uid"])
+    try:
+        with ThreadPoolExecutor(max_workers=PRISMIC_WORKERS) as pool:
+            first_pages = {
+                document_type: pool.submit(_search_page, document_type, ref_number, 1)
+                for document_type in missing
+            }
+            later_pages = {}
+            for document_type, future in first_pages.items():
+                first_pages[document_type] = future.result()
+                total_pages = (first_pages[document_type] or {}).get("total_pages", 1)
+                later_pages[document_type] = [
+                    pool.submit(_search_page, document_type, ref_number, page)
+                    for page in range(2, total_pages + 1)
+                ]
+            pages = {
+                document_type: [first_pages[document_type]] + [f.result() for f in futures]
+                for document_type, futures in later_pages.items()
+            }
+    except requests.exceptions.RequestException as e:
+        raise SystemExit(e)
 
-                url = response_body["next_page"]
-            else:
-                return bank_uids
-        except requests.exceptions.RequestException as e:
-            raise SystemExit(e)
+    for document_type, type_pages in pages.items():
+        listings[document_type] = [
+            result["uid"] for page in type_pages if page for result in page["results"]
+        ]
+        if all(type_pages):
+            cache.set(
+                f"prismic_uids:{ref_number}:{document_type}",
+                listings[document_type],
+                LISTING_CACHE_TIMEOUT,
+            )
+    return listings
 
-    return bank_uids
+
+def get_prismic_documents(document_type, ref_number):
+    if (not document_type) or (not ref_number):
+        return None
+    return get_prismic_listings(ref_number, [document_type])[document_type]
+
+
+def brand_tag_pks():
+    return dict(Brand.objects.values_list("tag", "pk"))
+
+
+def admin_links(tags, tag_pks):
+    return [
+        (tag, reverse("admin:brand_brand_change", args=[tag_pks[tag]]) if tag in tag_pks else None)
+        for tag in tags
+    ]
 
 
 def calculate_missing_tags(list_brand_tags, list_prismic_pages, find_missing_brands_flag=False):
@@ -81,35 +139,28 @@ def calculate_missing_tags(list_brand_tags, list_prismic_pages, find_missing_bra
     return [tag_dict[ele] for ele in missing_bank_pages]
 
 
-def get_missing_brand_and_bankpages(ref):
+def get_missing_brand_and_bankpages(ref, bankpage_tags=None, tag_pks=None):
     """
     Finds the missing brands for which accompanying bankpages are present in prismic
     Finds the missing bankpages for which accompanying brands are present in bank.green
     """
     output_dict = {}
 
-    # Make an API call to fetch all BankPages from PRISMIC
-    list_prismic_bankpage_tags = get_prismic_documents("bankpage", ref)
-    list_prismic_bankpage_tags = [ele.strip() for ele in list_prismic_bankpage_tags]
+    # Make an API call to fetch all BankPages from PRISMIC, unless already fetched
+    if bankpage_tags is None:
+        bankpage_tags = get_prismic_documents("bankpage", ref)
+    list_prismic_bankpage_tags = [ele.strip() for ele in bankpage_tags]
 
     # Fetch all brands
-    list_brand_tags = list(Brand.objects.values_list("tag", flat=True))
-    # list_brand_tags = [ele.strip() for ele in list_brand_tags]
+    tag_pks = brand_tag_pks() if tag_pks is None else tag_pks
+    list_brand_tags = list(tag_pks)
 
     output_dict["missing_brands"] = calculate_missing_tags(
         list_brand_tags, list_prismic_bankpage_tags, find_missing_brands_flag=True
     )
     missing_bank_pages = calculate_missing_tags(list_brand_tags, list_prismic_bankpage_tags)
 
-    output_dict["missing_bank_pages"] = []
-    for tag in missing_bank_pages:
-        try:
-            brand_id = Brand.objects.get(tag=tag).pk
-            output_dict["missing_bank_pages"].append(
-                (tag, reverse("admin:brand_brand_change", args=[brand_id]))
-            )
-        except:
-            output_dict["missing_bank_pages"].append((tag, None))
+    output_dict["missing_bank_pages"] = admin_links(missing_bank_pages, tag_pks)
 
     output_dict["missing_brands"] = sorted(output_dict["missing_brands"])
     output_dict["missing_bank_pages"] = sorted(output_dict["missing_bank_pages"])
@@ -117,24 +168,22 @@ def get_missing_brand_and_bankpages(ref):
     return output_dict
 
 
-def get_missing_sfi_brands_and_pages(ref):
+def get_missing_sfi_brands_and_pages(ref, sfipage_tags=None, tag_pks=None):
     """
     Finds the missing sfi brands for which accompanying sfi pages are present in prismic
     Finds the missing sfi pages for which accompanying sfi brands are present in bank.green
     """
     output_dict = {}
 
-    # Make an API call to fetch all BankPages from PRISMIC
-    list_prismic_sfipage_tags = get_prismic_documents("sfipage", ref)
-    list_prismic_sfipage_tags = [ele.strip() for ele in list_prismic_sfipage_tags]
+    # Make an API call to fetch all SFI pages from PRISMIC, unless already fetched
+    if sfipage_tags is None:
+        sfipage_tags = get_prismic_documents("sfipage", ref)
+    list_prismic_sfipage_tags = [ele.strip() for ele in sfipage_tags]
 
     # Fetch all SFI brands
-    brand_ids = list(
-        Commentary.objects.filter(show_on_sustainable_banks_page=True).values_list(
-            "brand_id", flat=True
-        )
-    )
-    list_of_sfi_brand_tags = [Brand.objects.values("tag").get(pk=id)["tag"] for id in brand_ids]
+    list_of_sfi_brand_tags = Commentary.objects.filter(
+        show_on_sustainable_banks_page=True
+    ).values_list("brand__tag", flat=True)
     list_of_sfi_brand_tags = [ele.strip() for ele in list_of_sfi_brand_tags]
 
     output_dict["sfi_missing_brands"] = calculate_missing_tags(
@@ -144,15 +193,8 @@ def get_missing_sfi_brands_and_pages(ref):
 
     missing_sfi_pages = calculate_missing_tags(list_of_sfi_brand_tags, list_prismic_sfipage_tags)
 
-    output_dict["missing_sfi_pages"] = []
-    for tag in missing_sfi_pages:
-        try:
-            brand_id = Brand.objects.get(tag=tag).pk
-            output_dict["missing_sfi_pages"].append(
-                (tag, reverse("admin:brand_brand_change", args=[brand_id]))
-            )
-        except:
-            output_dict["missing_sfi_pages"].append((tag, None))
+    tag_pks = brand_tag_pks() if tag_pks is None else tag_pks
+    output_dict["missing_sfi_pages"] = admin_links(missing_sfi_pages, tag_pks)
 
     output_dict["missing_sfi_pages"] = sorted(output_dict["missing_sfi_pages"])
 
@@ -1,36 +1,32 @@
 """script is meant to be copy-pasted into django shell.
 In short, it prints the number of banks per country, with their ratings."""
 
-from brand.models import Brand, Commentary, RatingChoice
+from collections import OrderedDict
+
 from django.db.models import Count, F
 
-from collections import OrderedDict
 import yaml
 
+from brand.models import Brand, BrandCountry, Commentary, RatingChoice
+
 
 # Step 1: Retrieve all unique country codes from brands that have commentaries.
-# The 'countries' field (CountryField with multiple=True) stores country codes as a comma-separated string.
-# We first fetch these strings, then split and collect unique codes in Python.
-brands_with_commentaries_country_strings = (
-    Brand.objects.filter(commentary__isnull=False).values_list("countries", flat=True).distinct()
+# BrandCountry holds one indexed row per country in the 'countries' field.
+all_unique_country_codes = set(
+    BrandCountry.objects.filter(brand__commentary__isnull=False)
+    .values_list("country", flat=True)
+    .distinct()
 )
 
-all_unique_country_codes = set()
-for country_string in brands_with_commentaries_country_strings:
-    if country_string:  # Ensure the string is not empty
-        # Split the comma-separated string into individual country codes
-        for code in country_string.split(","):
-            all_unique_country_codes.add(code.strip())  # Add cleaned codes to the set
-
 # Initialize the dictionary to store the final results.
 results_by_country = {}
 
 # Step 2: For each identified unique country code, perform aggregations.
 for country_code in all_unique_country_codes:
     # Filter for brands that operate in the current 'country_code' and have an associated commentary.
-    # We use '__contains' to check if the country_code is part of the comma-separated string in the 'countries' field.
+    # The join on BrandCountry uses its (country, brand) index.
     brands_in_this_country_queryset = Brand.objects.filter(
-        commentary__isnull=False, countries__contains=country_code
+        commentary__isnull=False, country_memberships__country=country_code
     )
 
     # Calculate the total number of unique banks (brands) in this specific country.
@@ -79,6 +75,7 @@ sorted_filtered_results = dict(
 
 from brand.models.state import COUNTRIES  # Import the COUNTRIES dictionary
 
+
 results_with_country_names = OrderedDict()
 for country_code, data in sorted_filtered_results.items():
     country_name = COUNTRIES.get(